@@ -16,7 +16,10 @@ from mic_common.utils.scan_monitor import execute_scan_2d
 from .generallized_scan_1d import generalized_scan_1d
 from bluesky import plan_stubs as bps  
 from apsbits.utils.config_loaders import get_config, load_config_yaml
-from mic_common.utils.watch_pvs_write_hdf5 import write_scan_master_h5
+from mic_common.utils.watch_pvs_write_hdf5 import write_scan_master_h5_async
+from mic_common.utils.watch_pvs_write_hdf5 import write_scan_timing
+from mic_common.utils.line_timing import LineTimer
+from mic_common.utils.status_wait import wait_for_future
 from pathlib import Path
 from isn.plans.utils.det_setup import xrf_me7_setup, ptycho_setup
 from isn.startup import master_file_config_path
@@ -43,6 +46,7 @@ iconfig = get_config()
 netcdf_delimiter = iconfig.get("FILE_DELIMITER")
 xrf_me7_folder = iconfig.get("XRF_ME7_FOLDER")
 ptycho_folder = iconfig.get("PTYCHO_FOLDER")
+scan_overhead = iconfig.get("SCAN_OVERHEAD")
 
 master_file_yaml = load_config_yaml(master_file_config_path)
 
@@ -158,13 +162,23 @@ def step2d(
     """Generate the scan master file"""
     next_file_name = savedata.next_file_name.replace(".mda", "_master.h5")
     scan_master_h5_path = Path(savedata.file_system.value) / next_file_name
-    write_scan_master_h5(master_file_yaml, scan_master_h5_path, bluesky_params)
-    logger.info(f"Scan master file saved to {scan_master_h5_path}")
+    # PVs read now, the file is written in the background during the scan
+    master_file = write_scan_master_h5_async(master_file_yaml, scan_master_h5_path,
+                                             bluesky_params)
+    logger.info(f"Scan master file queued for {scan_master_h5_path}")
         
     
     """Start executing scan"""
     savedata.update_next_file_name()
-    yield from execute_scan_2d(scan1, scan2, scan_name=savedata.next_file_name)
+    line_timer = LineTimer(dwell=dwell, scan_overhead=scan_overhead)
+    yield from execute_scan_2d(scan1, scan2, scan_name=savedata.next_file_name,
+                               hooks=[line_timer])
+    try:
+        yield from wait_for_future(master_file)
+        logger.info(f"Scan master file saved to {scan_master_h5_path}")
+    except Exception as reason:  # the scan is done, close the shutter anyway
+        logger.error(f"Scan master file not written: {reason!r}")
+    write_scan_timing(scan_master_h5_path, line_timer)
 
     """Close the shutter"""
     yield from bps.mv(shutter_close, 1)
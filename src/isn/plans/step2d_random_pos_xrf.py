@@ -17,10 +17,14 @@ from apsbits.utils.controls_setup import oregistry
 from apsbits.utils.config_loaders import get_config, load_config_yaml
 from mic_common.utils.scan_monitor import execute_scan_1d
 from isn.plans.utils.trajectory import generate_random_points
+from isn.plans.utils.point_order import optimize_order
 from isn.plans.utils.det_setup import xrf_me7_setup, ptycho_setup
-from mic_common.utils.watch_pvs_write_hdf5 import write_scan_master_h5
+from mic_common.utils.watch_pvs_write_hdf5 import write_scan_master_h5_async
+from mic_common.utils.watch_pvs_write_hdf5 import write_scan_timing
+from mic_common.utils.line_timing import LineTimer
+from mic_common.utils.status_wait import wait_for_future
+from mic_common.utils.trajectory_cache import table_uploads
 import bluesky.plan_stubs as bps
-from epics import caput
 from isn.startup import master_file_config_path
 import h5py
 import os
@@ -44,6 +48,7 @@ iconfig = get_config()
 netcdf_delimiter = iconfig.get("FILE_DELIMITER")
 xrf_me7_folder = iconfig.get("XRF_ME7_FOLDER")
 ptycho_folder = iconfig.get("PTYCHO_FOLDER")
+scan_overhead = iconfig.get("SCAN_OVERHEAD")
 
 master_file_yaml = load_config_yaml(master_file_config_path)
 
@@ -63,6 +68,7 @@ def step2d_random_pos_xrf(
     ptycho_on=False,
     xrf_me7_on=False,
     ptycho_exp_factor=1,
+    optimize_path=False,
 ):
     """
     Step 2D random position scan plan. This plan will drive samx and samy
@@ -104,6 +110,8 @@ def step2d_random_pos_xrf(
         Bool: Whether to turn on the ptycho
     xrf_me7_on: 
         Bool: Whether to turn on the xrf me7
+    optimize_path:
+        Bool: Whether to reorder the points for the least stage travel
     """
 
     
@@ -150,6 +158,19 @@ def step2d_random_pos_xrf(
                                                       width, height, stepsize_x, stepsize_y, dr, nth)
     logger.info(f"Generated array of {samx_points.shape[0]} points")
 
+    # index in the generate_random_points order of each point scanned,
+    # saved in the master file for scan_pixel_map(..., order=point_order)
+    point_order = np.arange(samx_points.shape[0])
+    if optimize_path:
+        """Visit the points in the order with the least stage travel"""
+        order, time_before, time_after = optimize_order(
+            samx_points, samy_points, samx.velocity.get(), samy.velocity.get()
+        )
+        samx_points, samy_points = samx_points[order], samy_points[order]
+        point_order = np.asarray(order)
+        logger.info(f"Point order saves {time_before - time_after:.1f} s of travel")
+    bluesky_params["point_order"] = point_order
+
     """Configure the scanrecord and pass the scan trajectory"""
     yield from scan1.set_scan_mode("table")
     yield from bps.mv(scan1.positioners.p2.mode, "table".upper())
@@ -162,8 +183,9 @@ def step2d_random_pos_xrf(
     yield from bps.mv(scan1.positioners.p2.setpoint_pv, samy.prefix+'.VAL',
                       scan1.positioners.p2.readback_pv, samy.prefix+'.RBV')
     yield from bps.mv(scan1.positioners.p2.abs_rel, "relative".upper())    
-    caput(scan1.P1PA.pvname, samx_points)
-    caput(scan1.P2PA.pvname, samy_points)
+    # Repeated geometries reuse the table already in the scan record
+    table_uploads.upload(scan1.P1PA, samx_points)
+    table_uploads.upload(scan1.P2PA, samy_points)
     
     # yield from bps.mv(scan1.positioner_delay, 0.1)
     yield from bps.sleep(0.1)
@@ -184,12 +206,22 @@ def step2d_random_pos_xrf(
     """Generate the scan master file"""
     next_file_name = savedata.next_file_name.replace(".mda", "_master.h5")
     scan_master_h5_path = Path(savedata.file_system.value) / next_file_name
-    write_scan_master_h5(master_file_yaml, scan_master_h5_path, bluesky_params)
-    logger.info(f"Scan master file saved to {scan_master_h5_path}")
+    # PVs read now, the file is written in the background during the scan
+    master_file = write_scan_master_h5_async(master_file_yaml, scan_master_h5_path,
+                                             bluesky_params)
+    logger.info(f"Scan master file queued for {scan_master_h5_path}")
 
     """Start executing scan"""
     savedata.update_next_file_name()
-    yield from execute_scan_1d(scan1, scan_name=savedata.next_file_name)
+    line_timer = LineTimer(dwell=dwell, scan_overhead=scan_overhead)
+    yield from execute_scan_1d(scan1, scan_name=savedata.next_file_name,
+                               hooks=[line_timer])
+    try:
+        yield from wait_for_future(master_file)
+        logger.info(f"Scan master file saved to {scan_master_h5_path}")
+    except Exception as reason:  # the scan is done, close the shutter anyway
+        logger.error(f"Scan master file not written: {reason!r}")
+    write_scan_timing(scan_master_h5_path, line_timer)
 
     """Close the shutter"""
     yield from bps.mv(shutter_close, 1)
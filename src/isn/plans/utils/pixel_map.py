@@ -0,0 +1,153 @@
+"""
+Map scan points onto a regular grid of pixels
+
+Spiral and random-position scans measure at points that are not on a
+grid.  A PixelMap bins every point into the pixels around it, once per
+scan geometry, as a sparse matrix.  Every element map of every detector
+is then one sparse matrix product with the measured values.
+
+"""
+
+import copy
+import functools
+
+import numpy as np
+from scipy import sparse
+
+from isn.plans.utils.trajectory import generate_random_points
+
+
+class PixelMap:
+    """
+    Sparse weights from ``npts`` scan points to a grid of pixels.
+
+    The pixel centers sit on the ``grid`` scan positions: from
+    ``x_center - width/2`` to ``x_center + width/2`` in steps of
+    ``stepsize_x``, the same for y.  ``matrix`` has one row per pixel,
+    normalized so each pixel is the weighted mean of its points.
+
+    method "nearest" puts each point in the pixel it falls in.
+    method "bilinear" splits each point across the 4 pixels around it,
+    which leaves fewer empty pixels when the points are sparse.
+    """
+
+    def __init__(self, x, y, x_center, y_center, width, height,
+                 stepsize_x, stepsize_y, method="bilinear"):
+        """Bin the points ``x``, ``y`` into the pixels of the grid."""
+        if stepsize_x <= 0 or stepsize_y <= 0:
+            raise ValueError(
+                f"Pixel sizes must be positive, received {stepsize_x}, {stepsize_y}"
+            )
+        x = np.asarray(x, dtype=np.float64).ravel()
+        y = np.asarray(y, dtype=np.float64).ravel()
+        if x.shape != y.shape:
+            raise ValueError(f"x and y differ in size: {x.size} != {y.size}")
+
+        nx = int(np.floor(width / stepsize_x + 0.5)) + 1
+        ny = int(np.floor(height / stepsize_y + 0.5)) + 1
+        x_start = x_center - width / 2
+        y_start = y_center - height / 2
+        self.x_pixels = x_start + stepsize_x * np.arange(nx)
+        self.y_pixels = y_start + stepsize_y * np.arange(ny)
+        self.shape = (ny, nx)
+        self.npts = x.size
+
+        # position in units of pixels
+        fx = (x - x_start) / stepsize_x
+        fy = (y - y_start) / stepsize_y
+        points = np.arange(x.size)
+        if method == "nearest":
+            ix = np.floor(fx + 0.5).astype(np.intp)
+            iy = np.floor(fy + 0.5).astype(np.intp)
+            weights = np.ones(x.size)
+        elif method == "bilinear":
+            ix0 = np.floor(fx).astype(np.intp)
+            iy0 = np.floor(fy).astype(np.intp)
+            wx = fx - ix0
+            wy = fy - iy0
+            ix = np.concatenate((ix0, ix0 + 1, ix0, ix0 + 1))
+            iy = np.concatenate((iy0, iy0, iy0 + 1, iy0 + 1))
+            weights = np.concatenate((
+                (1 - wx) * (1 - wy), wx * (1 - wy), (1 - wx) * wy, wx * wy,
+            ))
+            points = np.tile(points, 4)
+        else:
+            raise ValueError(f"Unknown method: {method!r}")
+
+        inside = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny) & (weights > 0)
+        pixels = iy[inside] * nx + ix[inside]
+        matrix = sparse.csr_matrix(
+            (weights[inside], (pixels, points[inside])), shape=(ny * nx, x.size)
+        )
+        self.coverage = np.asarray(matrix.sum(axis=1)).ravel()
+        scale = np.divide(
+            1.0, self.coverage, out=np.zeros_like(self.coverage),
+            where=self.coverage > 0,
+        )
+        self.matrix = sparse.diags(scale) @ matrix
+        self.empty = self.coverage == 0
+
+    def reorder(self, order):
+        """
+        PixelMap of the same points, measured in the sequence ``order``.
+
+        ``order[k]`` is the index of the ``k``-th measured point among the
+        points of this map, e.g. the ``point_order`` of a scan whose
+        points were reordered by ``optimize_order``.
+        """
+        order = np.asarray(order, dtype=np.intp).ravel()
+        if order.size != self.npts or not np.array_equal(
+            np.sort(order), np.arange(self.npts)
+        ):
+            raise ValueError(f"order is not a permutation of {self.npts} points")
+        reordered = copy.copy(self)
+        reordered.matrix = self.matrix[:, order]
+        return reordered
+
+    def apply(self, values, fill_value=np.nan):
+        """
+        Image of ``values`` measured at the scan points.
+
+        ``values`` has the points along its first axis, any other axes
+        (channels, elements) are kept: ``(npts, nchan)`` gives an image of
+        shape ``(ny, nx, nchan)``.  Pixels without points get ``fill_value``.
+        """
+        values = np.asarray(values)
+        if values.shape[0] != self.npts:
+            raise ValueError(
+                f"Expected {self.npts} values along axis 0, received {values.shape[0]}"
+            )
+        image = self.matrix @ values.reshape(self.npts, -1)
+        image[self.empty] = fill_value
+        return image.reshape(*self.shape, *values.shape[1:])
+
+
+@functools.lru_cache(maxsize=16)
+def _scan_pixel_map(scan_traj, width, height, stepsize_x, stepsize_y, dr, nth,
+                    method):
+    """PixelMap of a scan geometry, around (0, 0)."""
+    x, y = generate_random_points(
+        scan_traj, 0, 0, width, height, stepsize_x, stepsize_y, dr, nth
+    )
+    return PixelMap(x, y, 0, 0, width, height,
+                    stepsize_x or dr, stepsize_y or dr, method=method)
+
+
+def scan_pixel_map(scan_traj, width, height, stepsize_x, stepsize_y, dr, nth,
+                   method="bilinear", order=None):
+    """
+    PixelMap of the planned points of ``generate_random_points``.
+
+    The map does not depend on the scan center, so it is built once per
+    geometry and shared by all the detectors, channels and later scans of
+    that geometry.  ``x_pixels`` and ``y_pixels`` are relative to the scan
+    center.  Spiral scans without a step size use pixels of ``dr``.
+
+    A scan with ``optimize_path`` measured the points in another order:
+    pass the ``SCAN/point_order`` of its master file as ``order``.
+    """
+    pixel_map = _scan_pixel_map(scan_traj, width, height, stepsize_x,
+                                stepsize_y, dr, nth, method)
+    if order is not None:
+        pixel_map = pixel_map.reorder(order)
+    return pixel_map
@@ -0,0 +1,157 @@
+"""
+Order scan points to shorten the stage travel
+
+Table scans visit their points in the order given.  For an arbitrary set
+of points (regions of interest, adaptive resampling) that order can spend
+most of the scan moving the stages.  The points are sorted along a
+Hilbert curve, then improved with a windowed 2-opt.  Moves are timed with
+both axes moving at once, so a move takes the longer of the x and y times.
+
+"""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HILBERT_BITS = 16  # curve resolution, 2**16 cells along each axis
+WINDOW = 32  # longest stretch of points a 2-opt move reverses
+PASSES = 4
+
+
+def move_times(x, y, x_velocity, y_velocity):
+    """Time of each move between consecutive points."""
+    return np.maximum(
+        np.abs(np.diff(x)) / x_velocity, np.abs(np.diff(y)) / y_velocity
+    )
+
+
+def path_time(x, y, x_velocity, y_velocity, start=(0, 0)):
+    """Travel time through the points in order, from ``start``."""
+    x = np.concatenate(([start[0]], x))
+    y = np.concatenate(([start[1]], y))
+    return float(move_times(x, y, x_velocity, y_velocity).sum())
+
+
+def hilbert_index(ix, iy, bits=HILBERT_BITS):
+    """Distance along the Hilbert curve of integer cells ``(ix, iy)``."""
+    ix = np.asarray(ix, dtype=np.int64).copy()
+    iy = np.asarray(iy, dtype=np.int64).copy()
+    n = 1 << bits
+    d = np.zeros(ix.shape, dtype=np.int64)
+    s = n >> 1
+    while s > 0:
+        rx = (ix & s) > 0
+        ry = (iy & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+        # rotate the quadrant, as the curve does
+        flip = ~ry & rx
+        ix[flip] = n - 1 - ix[flip]
+        iy[flip] = n - 1 - iy[flip]
+        swap = ~ry
+        ix[swap], iy[swap] = iy[swap], ix[swap]
+        s >>= 1
+    return d
+
+
+def _hilbert_order(tx, ty):
+    """Order of points, in units of time, along the Hilbert curve."""
+    top = (1 << HILBERT_BITS) - 1
+    span = max(np.ptp(tx), np.ptp(ty)) or 1.0
+    ix = np.rint((tx - tx.min()) / span * top)
+    iy = np.rint((ty - ty.min()) / span * top)
+    return np.argsort(hilbert_index(ix, iy), kind="stable")
+
+
+def _two_opt(tx, ty, order, window, passes):
+    """
+    Improve ``order`` with 2-opt moves that reverse at most ``window`` points.
+
+    Point ``order[0]`` stays first.  For each length of reversal, the gains
+    of all the moves are computed at once; the improving moves that do not
+    touch each other are applied together.
+    """
+    n = order.size
+    for _ in range(passes):
+        improved = False
+        for k in range(2, min(window, n - 2) + 1):
+            px = tx[order]
+            py = ty[order]
+            i = np.arange(n - k - 1)
+            j = i + k
+
+            def dist(a, b, px=px, py=py):
+                return np.maximum(np.abs(px[a] - px[b]), np.abs(py[a] - py[b]))
+
+            # reverse order[i + 1 : j + 1]: edges (i, i+1), (j, j+1) become
+            # (i, j), (i+1, j+1)
+            gain = dist(i, i + 1) + dist(j, j + 1) - dist(i, j) - dist(i + 1, j + 1)
+            last = -1
+            for c in np.flatnonzero(gain > 1e-12 * (1 + gain.max())):
+                if c > last:
+                    order[c + 1 : c + k + 1] = order[c + 1 : c + k + 1][::-1]
+                    last = c + k
+                    improved = True
+        if not improved:
+            break
+    return order
+
+
+def optimize_order(x, y, x_velocity, y_velocity, start=(0, 0),
+                   window=WINDOW, passes=PASSES):
+    """
+    Order of the points that shortens the travel time.
+
+    The first move starts from ``start``, the stage position before the
+    scan.  Sorting 1e5 points takes about a second.
+
+    Parameters
+    ----------
+    x, y : array
+        The points.
+    x_velocity, y_velocity : float
+        Speeds of the x and y stages.
+    start : tuple
+        Stage position before the first point.
+    window : int
+        Longest stretch of points a 2-opt move reverses, 0 to skip 2-opt.
+    passes : int
+        Most 2-opt passes over the points.
+
+    Returns
+    -------
+    order : array
+        Indices of the points, in the order to visit them.
+    time_before, time_after : float
+        Travel times in the given order and in the new order.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    time_before = path_time(x, y, x_velocity, y_velocity, start)
+    if x.size < 3:
+        return np.arange(x.size), time_before, time_before
+
+    # distances in units of time, the start point stays first
+    tx = np.concatenate(([start[0]], x)) / x_velocity
+    ty = np.concatenate(([start[1]], y)) / y_velocity
+    order = _hilbert_order(tx[1:], ty[1:]) + 1
+    # walk the curve from the end nearer the start
+    ends = order[[0, -1]]
+    ends = np.maximum(np.abs(tx[ends] - tx[0]), np.abs(ty[ends] - ty[0]))
+    if ends[1] < ends[0]:
+        order = order[::-1]
+    order = np.concatenate(([0], order))
+    if window >= 2:
+        order = _two_opt(tx, ty, order, window, passes)
+    order = order[1:] - 1
+
+    time_after = path_time(x[order], y[order], x_velocity, y_velocity, start)
+    if time_after >= time_before:
+        # already a good order, keep it
+        return np.arange(x.size), time_before, time_before
+    logger.info(
+        "Point order: travel %.1f s -> %.1f s, %.1f s saved",
+        time_before, time_after, time_before - time_after,
+    )
+    return order, time_before, time_after
@@ -6,25 +6,33 @@ Generate scan trajectory points
 """
 
 
+import time
+
 import numpy as np
 from bluesky.plans import plan_patterns
+from mic_common.utils.trajectory_cache import cache_trajectory
 
 
+@cache_trajectory
 def generate_random_points(scan_traj, x_center, y_center, width, height, 
                            stepsize_x, stepsize_y, dr, nth):
     """
     Generate random points for the scan trajectory.
+
+    Results are cached by geometry (see ``mic_common.utils.trajectory_cache``),
+    repeating a scan at another center only translates the cached points.
     """
     samx_points, samy_points = [], []
     if scan_traj == "spiral":
-        scan_cyc = plan_patterns.spiral("samx", "samy", x_center, y_center, width, height, 
-                                        dr, nth)
-        samx_points, samy_points = process_scan_cyc(scan_cyc)
+        samx_points, samy_points = spiral_points(
+            x_center, y_center, width, height, dr, nth
+        )
         
     elif scan_traj == "spiral_grid":
-        scan_cyc = plan_patterns.spiral_square_pattern("samx", "samy", x_center, y_center, 
-                                                       width, height, int(width/stepsize_x), int(height/stepsize_y))
-        samx_points, samy_points = process_scan_cyc(scan_cyc)
+        samx_points, samy_points = spiral_square_points(
+            x_center, y_center, width, height,
+            int(width / stepsize_x), int(height / stepsize_y),
+        )
         
     elif scan_traj == "grid":
         samx_points, samy_points = grid_points(x_center, y_center, width, height, stepsize_x, stepsize_y)
@@ -52,4 +60,112 @@ def grid_points(x_center, y_center, width, height, stepsize_x, stepsize_y):
 
     x_coords, y_coords = np.meshgrid(x_vals, y_vals)
 
-    return x_coords, y_coords
\ No newline at end of file
+    return x_coords, y_coords
+
+
+def spiral_points(x_center, y_center, x_range, y_range, dr, nth, dr_y=None, tilt=0.0):
+    """
+    Points of ``bluesky.plans.plan_patterns.spiral``, as arrays.
+
+    Every ring is computed at once, no cycler and no per-point dicts.
+    Parameters are those of ``plan_patterns.spiral`` without the motors.
+    """
+    dr_aspect = 1 if dr_y is None else dr_y / dr
+    half_x = x_range / 2
+    half_y = y_range / (2 * dr_aspect)
+    num_ring = 1 + int(np.sqrt(half_x**2 + half_y**2) / dr)
+    tilt_tan = np.tan(tilt + np.pi / 2.0)
+
+    rings = np.arange(1, num_ring + 2)
+    counts = (rings * nth).astype(int)
+    ring_of_pt = np.repeat(rings, counts)
+    i_angle = np.arange(ring_of_pt.size) - np.repeat(np.cumsum(counts) - counts, counts)
+    angle = i_angle * (2.0 * np.pi / (ring_of_pt * nth))
+    radius = ring_of_pt * dr
+    x = radius * np.cos(angle)
+    y = radius * np.sin(angle) * dr_aspect
+    keep = np.abs(x - (y / dr_aspect) / tilt_tan) <= half_x
+    keep &= np.abs(y / dr_aspect) <= half_y
+    return x_center + x[keep], y_center + y[keep]
+
+
+def spiral_square_points(x_center, y_center, x_range, y_range, x_num, y_num):
+    """
+    Points of ``bluesky.plans.plan_patterns.spiral_square_pattern``, as arrays.
+
+    Every side of every ring is computed at once, in the same order, and
+    the points outside the ``x_num`` by ``y_num`` grid are masked out.
+    Parameters are those of ``plan_patterns.spiral_square_pattern`` without
+    the motors.
+    """
+    x_offset = 0.5 if x_num % 2 == 0 else 0
+    y_offset = -0.5 if y_num % 2 == 0 else 0
+    x_delta = x_range / (x_num - 1)
+    y_delta = y_range / (y_num - 1)
+
+    # ring i has 4 sides of 2i - 2 points, side p runs along n
+    rings = np.arange(2, max(x_num, y_num) + 1)
+    side_len = 2 * rings - 2
+    ring = np.repeat(rings, 4 * side_len)
+    length = np.repeat(side_len, 4 * side_len)
+    ring_start = np.cumsum(4 * side_len) - 4 * side_len
+    pos = np.arange(ring.size) - np.repeat(ring_start, 4 * side_len)
+    side, j = np.divmod(pos, length)
+    n = np.where(side < 2, ring - 2 - j, -ring + 2 + j)
+
+    edge = np.where((side == 1) | (side == 2), -ring + 1, ring - 1)
+    along_x = (side == 1) | (side == 3)  # sides 2 and 4 run along x
+    x_coef = np.where(along_x, n, edge) - x_offset
+    y_coef = np.where(along_x, edge, n) - y_offset
+    # the first side of a ring may sit on the x edge of the grid
+    x_in = np.where(side == 0, np.abs(x_coef) <= x_num / 2, np.abs(x_coef) < x_num / 2)
+    keep = x_in & (np.abs(y_coef) < y_num / 2)
+
+    x_coef = np.concatenate(([-x_offset], x_coef[keep]))[: x_num * y_num]
+    y_coef = np.concatenate(([-y_offset], y_coef[keep]))[: x_num * y_num]
+    return x_center + x_delta * x_coef, y_center + y_delta * y_coef
+
+
+def _cycler_points(pattern, *args):
+    """Points of a ``plan_patterns`` cycler, the way they used to be made."""
+    return process_scan_cyc(pattern(*args))
+
+
+def benchmark_random_points(sizes=(10, 30, 100, 300), repeat=3):
+    """
+    Time the cycler path against the array path of ``generate_random_points``.
+
+    ``sizes`` are the number of steps across the scan; the spiral uses
+    ``dr`` and ``nth`` giving a similar point density.
+    """
+    results = []
+    for size in sizes:
+        cases = {
+            "spiral": (
+                (plan_patterns.spiral, "samx", "samy", 0, 0, 1, 1, 1 / size, 6),
+                (spiral_points, 0, 0, 1, 1, 1 / size, 6),
+            ),
+            "spiral_grid": (
+                (
+                    plan_patterns.spiral_square_pattern,
+                    *("samx", "samy", 0, 0, 1, 1, size, size),
+                ),
+                (spiral_square_points, 0, 0, 1, 1, size, size),
+            ),
+        }
+        for name, ((pattern, *cycler_args), (func, *args)) in cases.items():
+            timings = []
+            for run, run_args in (
+                (_cycler_points, (pattern, *cycler_args)),
+                (func, args),
+            ):
+                best = np.inf
+                for _ in range(repeat):
+                    t0 = time.perf_counter()
+                    x, _y = run(*run_args)
+                    best = min(best, time.perf_counter() - t0)
+                timings.append(best)
+            results.append((name, len(x), *timings))
+            print(f"{name:<12} {len(x):>8} points  cycler {timings[0]:.4f} s  "
+                  f"arrays {timings[1]:.4f} s  ({timings[0] / timings[1]:.0f}x)")
+    return results
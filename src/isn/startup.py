@@ -28,12 +28,16 @@ from apsbits.utils.aps_functions import host_on_aps_subnet
 
 # Configuration functions
 from apsbits.utils.config_loaders import load_config
+from apsbits.utils.config_loaders import load_config_yaml
 from apsbits.utils.helper_functions import register_bluesky_magics
 from apsbits.utils.logging_setup import configure_logging
 
 # Utility functions from apstools and bluesky
 from apstools.utils import listobjects, listplans
 
+from mic_common.devices.master_file_baseline import setup_master_file_baseline
+from mic_common.utils.watch_pvs_write_hdf5 import pv_pool
+
 # Configuration block
 # Get the path to the instrument package
 # Load configuration to be used by the instrument.
@@ -113,6 +117,13 @@ RE(make_devices(clear=False, file="devices.yml"))  # Create the devices.
 if host_on_aps_subnet():
     RE(make_devices(clear=False, file="devices_aps_only.yml"))
 
+# Connect the master file PVs once, every scan's master file is written from them.
+master_file_config = load_config_yaml(master_file_config_path)
+pv_pool.connect(master_file_config)
+
+# The master file PVs, one device per section, in the baseline stream of every run.
+setup_master_file_baseline(sd, master_file_config)
+
 # local_mountpath = iconfig.get("STORAGE")["PATH"]
 # xrf_me7_hdf = oregistry["xrf_me7_hdf"]
 # xrf_me7_hdf.micdata_mountpath = local_mountpath
@@ -13,8 +13,7 @@ from typing import Dict
 from typing import Union
 
 import bluesky.plan_stubs as bps
-import numpy as np
-from ophyd.status import Status
+from ophyd import EpicsMotor
 
 from ..devices.positioner_stream import PositionerStream
 from ..devices.profile_move import ProfileMove
@@ -25,7 +24,23 @@ from ..utils.misc import create_master_file
 from ..utils.misc import mkdir
 from ..utils.misc import mksubdirs
 from ..utils.misc import pvput
-from .trajectories import snake
+from .trajectory_engine import iter_segments
+from .trajectory_engine import prefetch
+from .trajectory_engine import trajectory_size
+from .trajectory_limits import AxisLimits
+from .trajectory_limits import check_segments
+
+
+def _registered_motor(pv):
+    """The registered ``EpicsMotor`` of PV ``pv``, None if there is none."""
+    from apsbits.core.instrument_init import oregistry
+
+    if oregistry is None:
+        return None
+    for device in oregistry.root_devices:
+        if isinstance(device, EpicsMotor) and device.prefix == pv:
+            return device
+    return None
 
 
 def run_scan(
@@ -44,6 +59,8 @@ def run_scan(
     l2_center: float = 0,
     l2_size: float = 0.01,
     l2_width: float = 0.5,
+    segment_size: int = None,
+    check_limits: bool = True,
 ) -> None:
     """Run a scan with the specified parameters.
 
@@ -79,6 +96,13 @@ def run_scan(
         Size of second loop, by default 0.01
     l2_width : float, optional
         Width of second loop, by default 0.5
+    segment_size : int, optional
+        Points uploaded to the profile move at a time, by default None
+        (the whole trajectory at once)
+    check_limits : bool, optional
+        Reject a trajectory beyond the velocity, acceleration or travel
+        limits of the loop1 and loop2 motors, by default True.  The motors
+        must be registered devices, else the check is skipped.
     """
     if devices is None:
         devices = {
@@ -90,10 +114,11 @@ def run_scan(
         }
 
     """parse parameters"""
+    geometry = (dwell_time, l1_size, l1_center, l2_center, l1_width, l2_width)
     if trajectory == "snake":
-        x, y, t = snake(dwell_time, l1_size, l1_center, l2_center, l1_width, l2_width)
+        traj_args = ("snake", *geometry)
     elif trajectory == "raster":
-        x, y, t = snake(dwell_time, l1_size, l1_center, l2_center, l1_width, l2_width)
+        traj_args = ("snake", *geometry)
     elif trajectory == "spiral":
         pass
     elif trajectory == "lissajous":
@@ -101,9 +126,24 @@ def run_scan(
     elif trajectory == "custom":
         pass
 
-    x = list(np.round(x, 5))
-    y = list(np.round(y, 5))
-    npts = len(x)
+    # Segments are generated lazily, never as one list of the whole trajectory.
+    npts = trajectory_size(*traj_args)
+
+    if check_limits:
+        # before any detector is armed, with the motors of the session
+        motors = [_registered_motor(pv) for pv in (loop1, loop2)]
+        if None in motors:
+            print(f"No registered motors {loop1}, {loop2}: limits not checked")
+        else:
+            limits = [AxisLimits.from_motor(motor) for motor in motors]
+            report = check_segments(
+                iter_segments(*traj_args, segment_size=segment_size or npts),
+                *limits,
+            )
+            if not report.ok:
+                raise ValueError(f"Trajectory exceeds the motor limits:\n{report}")
+            print(f"Predicted scan time: {report.predicted_duration:.1f} s")
+
     frequency = 1 / float(dwell_time) / 1000
 
     folder_name = sample_name.strip("_")
@@ -130,120 +170,115 @@ def run_scan(
     pm1 = None
     sgz = None
     postrm = None
+    segments = None  # computed ahead for the profile move only
 
-    for device_name, device_prefix in devices.items():
-        if device_name == "flyXRF":
-            if use_softglue_triggers:
-                trigger_mode = 3  # ext trigger
-            else:
-                trigger_mode = 1  # internal
-            xp3 = Xspress3(device_prefix, name="xp3")
-            savepath = f"{save_path}{device_name}"
-            yield from xp3.setup_xspress3(
-                xp3,
-                npts,
-                sample_name,
-                savepath,
-                trigger_mode,
-                dwell_time,
-                reset_counter=False,
-            )
+    try:
+        for device_name, device_prefix in devices.items():
+            if device_name == "flyXRF":
+                if use_softglue_triggers:
+                    trigger_mode = 3  # ext trigger
+                else:
+                    trigger_mode = 1  # internal
+                xp3 = Xspress3(device_prefix, name="xp3")
+                savepath = f"{save_path}{device_name}"
+                yield from xp3.setup_xspress3(
+                    xp3,
+                    npts,
+                    sample_name,
+                    savepath,
+                    trigger_mode,
+                    dwell_time,
+                    reset_counter=False,
+                )
 
-        elif device_name == "tetramm":
-            if use_softglue_triggers:
-                trigger_mode = 1  # ext trigger
-            else:
-                trigger_mode = 0  # internal
-            tmm = TetraMM(device_prefix, name="tmm")
-            savepath = f"{save_path}tetramm"
-            yield from tmm.setup_tetramm(
-                tmm,
-                npts,
-                sample_name,
-                savepath,
-                trigger_mode,
-                dwell_time,
-                reset_counter=False,
-            )
+            elif device_name == "tetramm":
+                if use_softglue_triggers:
+                    trigger_mode = 1  # ext trigger
+                else:
+                    trigger_mode = 0  # internal
+                tmm = TetraMM(device_prefix, name="tmm")
+                savepath = f"{save_path}tetramm"
+                yield from tmm.setup_tetramm(
+                    tmm,
+                    npts,
+                    sample_name,
+                    savepath,
+                    trigger_mode,
+                    dwell_time,
+                    reset_counter=False,
+                )
 
-        elif device_name == "profilemove":
-            pm1 = ProfileMove(device_prefix, name="pm1")
-            yield from pm1.setup_profile_move(pm1, x, y, dwell_time)
+            elif device_name == "profilemove":
+                pm1 = ProfileMove(device_prefix, name="pm1")
+                segments = prefetch(
+                    iter_segments(*traj_args, segment_size=segment_size or npts)
+                )
+                x, y, _t = next(segments)
+                yield from pm1.setup_profile_move(x, y, dwell_time)
 
-        elif device_name == "softglue":
-            sgz = SoftGlueZynq(device_prefix, name="sgz")
-            yield from sgz.setup_SoftGlueZynq(sgz, npts, frequency)
+            elif device_name == "softglue":
+                sgz = SoftGlueZynq(device_prefix, name="sgz")
+                yield from sgz.setup_SoftGlueZynq(sgz, npts, frequency)
 
-        elif device_name == "positions":
-            if xp3 is not None:
-                filenumber = "{:05d}".format(xp3.FileNumber - 1)
+            elif device_name == "positions":
+                if xp3 is not None:
+                    filenumber = "{:05d}".format(xp3.FileNumber - 1)
+                else:
+                    # TODO: figure out a way to increment softglue filenumber whvery
+                    # time it closes and a way to reset counter.
+                    msg = (
+                        "file number not tracked. Not sure how else to set file name "
+                        "if not based on another detector's filenumber"
+                    )
+                    print(msg)
+                    filenumber = "00000"
+                postrm = PositionerStream(device_prefix, name="postrm")
+                filename = f"positions_{filenumber}.h5"
+                postrm.setup_positionstream(filename, f"{save_path}positions")
             else:
-                # TODO: figure out a way to increment softglue filenumber whvery
-                # time it closes and a way to reset counter.
-                msg = (
-                    "file number not tracked. Not sure how else to set file name "
-                    "if not based on another detector's filenumber"
-                )
-                print(msg)
-                filenumber = "00000"
-            postrm = PositionerStream(device_prefix, name="postrm")
-            filename = f"positions_{filenumber}.h5"
-            postrm.setup_positionstream(filename, f"{save_path}positions")
-        else:
-            print(f"unknown device: {device_name}")
-
-    """Start executing scan"""
-    st = Status()
-    print("Done setting up scan, about to start scan")
-
-    def watch_execute_scan(old_value, value, **kwargs):
-        # Watch for pm1.EXSC to change from 1 to 0 (when the scan ends).
-        if old_value in (1, 2, 3) and value == 0:
-            # mark as finished (successfully).
-            if xp3 is not None and xp3.DetectorState_RBV in (0, 10):
-                st.set_finished()
-                print("finished")
-                # Remove the subscription.
-                pm1.exsc.clear_sub(watch_execute_scan)
-
-    # TODO need some way to check if devices are ready before proceeding.
-    # timeout and exit with a warning if something is missing.
-    time.sleep(1)
-    ready = True
-
-    if ready and all(device is not None for device in (tmm, xp3, postrm, sgz, pm1)):
-        # Begin acquiring data from all devices
-        yield from bps.mv(
-            tmm.Acquire,
-            1,  # begin acquiring tetramm
-            xp3.Acquire,
-            1,  # begin acquiring xspress3
-            postrm.start_,
-            1,  # begin position stream
-            sgz.send_pulses,
-            1,  # begin sending pulses
-        )
-        yield from bps.mv(pm1.exsc, 1)  # begin profile move
-
-        pm1.exsc.subscribe(watch_execute_scan)
-        yield from bps.sleep(0.1)  # Small delay to ensure subscription is active
-        yield from bps.wait(st)
-
-        # Stop all devices
-        yield from bps.mv(
-            pm1.abort,
-            1,
-            tmm.Acquire,
-            0,
-            tmm.Capture,
-            0,
-            sgz.enbl_dma,
-            0,
-            xp3.Capture,
-            0,
-        )
-        if postrm is not None:
-            pvput(postrm.stop_.pvname, 1)  # stop position stream
+                print(f"unknown device: {device_name}")
+
+        """Start executing scan"""
+        print("Done setting up scan, about to start scan")
+
+        # TODO need some way to check if devices are ready before proceeding.
+        # timeout and exit with a warning if something is missing.
+        time.sleep(1)
+        ready = True
+
+        if ready and all(device is not None for device in (tmm, xp3, postrm, sgz, pm1)):
+            # Begin acquiring data from all devices
+            yield from bps.mv(
+                tmm.Acquire,
+                1,  # begin acquiring tetramm
+                xp3.Acquire,
+                1,  # begin acquiring xspress3
+                postrm.start_,
+                1,  # begin position stream
+                sgz.send_pulses,
+                1,  # begin sending pulses
+            )
+            # begin profile move, one segment after another
+            yield from pm1.execute_segments(segments, dwell_time)
+
+            # Stop all devices
+            yield from bps.mv(
+                pm1.abort,
+                1,
+                tmm.Acquire,
+                0,
+                tmm.Capture,
+                0,
+                sgz.enbl_dma,
+                0,
+                xp3.Capture,
+                0,
+            )
+            if postrm is not None:
+                pvput(postrm.stop_.pvname, 1)  # stop position stream
+    finally:
+        if segments is not None:
+            segments.close()  # stops the prefetch thread
 
     """Set up masterFile"""
     create_master_file(save_path, sample_name, subdirs)
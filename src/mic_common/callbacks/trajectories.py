@@ -5,7 +5,10 @@ Trajectories for the mic instrument
 import matplotlib.pyplot as plt
 import numpy as np
 
+from ..utils.trajectory_cache import cache_trajectory
 
+
+@cache_trajectory
 def snake(dwell, step_size, x_center, y_center, x_width, y_width):
     """
     snake function callback
@@ -42,9 +45,23 @@ def snake(dwell, step_size, x_center, y_center, x_width, y_width):
     return x, y, times
 
 
-def raster(dwell, step_size, x_center, y_center, x_width, y_width, x_return_vel):
+@cache_trajectory
+def raster(
+    dwell,
+    step_size,
+    x_center,
+    y_center,
+    x_width,
+    y_width,
+    x_return_vel,
+    x_return_accel=None,
+):
     """
     raster function callback
+
+    ``times`` holds the time to reach each point from the previous one,
+    flybacks included, like the other generators.  The timestamps are
+    given by :func:`raster_times`.
     """
     rows = int(np.ceil(y_width / step_size))
     cols = int(np.ceil(x_width / step_size))
@@ -65,61 +82,205 @@ def raster(dwell, step_size, x_center, y_center, x_width, y_width, x_return_vel)
     x = np.asarray(x)
     y = np.asarray(y)
 
-    dt = dwell  # noqa: F841
-    times = raster_times(x, y, dwell, x_return_vel)
+    times = raster_times(
+        x, y, dwell, x_return_vel, return_accel=x_return_accel, cumulative=False
+    )
     return x, y, times
 
 
-def raster_times(x, y, dt, return_vel):
+def move_time(distance, velocity, accel=None):
+    """
+    Time of point-to-point moves with a trapezoidal velocity profile.
+
+    Short moves never reach ``velocity`` and follow a triangular profile.
+    Without ``accel`` the moves start and stop instantly.
+
+    Parameters:
+        distance (array): Move lengths, any sign.
+        velocity (float): Top speed.
+        accel (float, optional): Acceleration and deceleration.
+
+    Returns:
+        array: Duration of each move.
     """
-    raster times callback
+    distance = np.abs(np.asarray(distance, dtype=np.float64))
+    if not accel:
+        return distance / velocity
+    ramp = velocity * velocity / accel  # distance spent accelerating + braking
+    return np.where(
+        distance >= ramp,
+        distance / velocity + velocity / accel,
+        2 * np.sqrt(distance / accel),
+    )
+
+
+def raster_times(x, y, dt, return_vel, return_accel=None, cumulative=True):
     """
-    times = np.ones_like(x)
+    Timing of a unidirectional raster.
+
+    Points along a row are reached ``dt`` apart.  A new row starts wherever
+    ``y`` changes; its first point is reached by a flyback of both axes at
+    ``return_vel``, accelerating at ``return_accel``, the slower axis
+    setting the duration.
+
+    Parameters:
+        x (array): x positions.
+        y (array): y positions, constant along each row.
+        dt (float): Dwell time per point.
+        return_vel (float): Velocity of the return stroke.
+        return_accel (float, optional): Acceleration of the return stroke.
+        cumulative (bool): Return timestamps instead of per-point durations.
+
+    Returns:
+        array: When ``cumulative``, the time at which each point is reached,
+        the last one being the duration of the scan.  Otherwise the time to
+        reach each point from the previous one (``dt`` for the first).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    times = np.full(x.shape, float(dt))
     # find index where y changes.
+    row_starts = np.flatnonzero(np.diff(y)) + 1
     # calculate time for return velocity
+    flyback = np.maximum(
+        move_time(x[row_starts] - x[row_starts - 1], return_vel, return_accel),
+        move_time(y[row_starts] - y[row_starts - 1], return_vel, return_accel),
+    )
     # create times arrays
-
+    times[row_starts] = flyback
+    if cumulative:
+        np.cumsum(times, out=times)
     return times
 
 
-def spiral(dwell, r_step_size, step_size, x_center, y_center, diameter):
+@cache_trajectory
+def spiral(
+    dwell, r_step_size, step_size, x_center, y_center, diameter, equidistant=False
+):
     """
     spiral function callback
+
+    All the semi-circles are computed at once by :func:`spiral_points`.
+    With ``equidistant``, the points are resampled ``step_size`` apart along
+    the path (see :func:`resample_path`).
     """
+    radii, counts = spiral_arcs(r_step_size, step_size, diameter)
+    x, y = spiral_points(radii, counts, r_step_size, x_center, y_center)
+    if equidistant:
+        x, y = resample_path(x, y, step=step_size)
+    times = np.full(x.shape, float(dwell))
+    return x, y, times
+
+
+def spiral_arcs(r_step_size, step_size, diameter):
+    """
+    Radius and number of points of each semi-circle of a spiral.
+
+    Arc ``r`` has radius ``(1 + r / 2) * r_step_size`` and is sampled about
+    ``step_size`` apart along its length.
+
+    Parameters:
+        r_step_size (float): Radial pitch of the spiral.
+        step_size (float): Distance between points along an arc.
+        diameter (float): Extent of the spiral.
+
+    Returns:
+        tuple: ``(radii, counts)`` arrays, one entry per arc.
+
+    Raises:
+        ValueError: If any of the sizes is not positive.
+    """
+    sizes = dict(r_step_size=r_step_size, step_size=step_size, diameter=diameter)
+    for name, value in sizes.items():
+        if not value > 0:
+            raise ValueError(f"Spiral {name} must be positive, received {value!r}")
     arc_num = int(np.ceil(diameter / r_step_size))
-    start = x_center, y_center + r_step_size
-    end = x_center, y_center - r_step_size
-    x, y = [], []
-    for r in range(arc_num):
-        R = np.round((1 + 0.5 * r) * r_step_size, 5)
-        pts_x, pts_y = semi_circle(start, end, R, step_size)
-
-        x = np.append(x, np.round(pts_x, 5))
-        y = np.append(y, np.round(pts_y, 5))
-        start = np.round((pts_x[-1], pts_y[-1]), 5)
-        if r % 2:
-            end = np.round((x_center, y_center - (1.5 + 0.5 * r) * r_step_size), 5)
-        else:
-            end = np.round((x_center, y_center + (2 + 0.5 * r) * r_step_size), 5)
-    dt = dwell
-    times = np.ones_like(x) * dt
-    # TODO: consider passing coordinared through equidistant()
-    return np.asarray(x), np.asarray(y), np.asarray(times)
+    radii = np.round((1 + 0.5 * np.arange(arc_num)) * r_step_size, 5)
+    counts = np.ceil(np.round(np.pi * radii, 5) / step_size).astype(int)
+    return radii, counts
+
+
+def spiral_points(radii, counts, r_step_size, x_center, y_center, start=0, stop=None):
+    """
+    Points of the semi-circles of a spiral, as one contiguous array.
+
+    Even arcs are centered on ``(x_center, y_center)`` and sweep the right
+    half from top to bottom, odd arcs are centered ``r_step_size / 2``
+    higher and sweep the left half from bottom to top, so each arc starts
+    where the previous one ends.  Each arc includes both of its ends.
+
+    Only the points ``start`` to ``stop`` are computed, from the arcs they
+    touch, so long spirals can be generated piece by piece.
+
+    Parameters:
+        radii (array): Radius of each arc, from :func:`spiral_arcs`.
+        counts (array): Points on each arc, from :func:`spiral_arcs`.
+        r_step_size (float): Radial pitch of the spiral.
+        x_center (float): Center of the spiral in x.
+        y_center (float): Center of the spiral in y.
+        start (int): Index of the first point.
+        stop (int, optional): Index after the last point, default: all.
+
+    Returns:
+        tuple: ``(x, y)`` float64 arrays.
+    """
+    ends = np.cumsum(counts)
+    total = int(ends[-1]) if ends.size else 0
+    stop = total if stop is None else min(stop, total)
+    if stop <= start:
+        return np.empty(0), np.empty(0)
+    first_arc = int(np.searchsorted(ends, start, side="right"))
+    last_arc = int(np.searchsorted(ends, stop - 1, side="right")) + 1
+    arcs = np.arange(first_arc, last_arc)
+    arc_counts = counts[first_arc:last_arc]
+    offset = int(ends[first_arc] - counts[first_arc])
+    npts = int(ends[last_arc - 1]) - offset
+
+    # arc number and fraction along that arc of every point, no Python loop
+    arc_of_pt = np.repeat(arcs, arc_counts)
+    frac = np.arange(offset, offset + npts, dtype=np.float64)
+    frac -= np.repeat(ends[first_arc:last_arc] - arc_counts, arc_counts)
+    frac /= np.maximum(counts - 1, 1)[arc_of_pt]
+
+    odd = (arc_of_pt % 2).astype(bool)
+    radius = radii[arc_of_pt]
+    theta = np.where(odd, frac - 0.5, 0.5 - frac)
+    theta *= np.pi
+
+    x = np.empty(npts, dtype=np.float64)
+    y = np.empty(npts, dtype=np.float64)
+    np.cos(theta, out=x)
+    x *= radius
+    np.negative(x, out=x, where=odd)
+    x += x_center
+    np.sin(theta, out=y)
+    y *= radius
+    y += y_center
+    y[odd] += 0.5 * r_step_size
+    np.round(x, 5, out=x)
+    np.round(y, 5, out=y)
+    return x[start - offset : stop - offset], y[start - offset : stop - offset]
 
 
 def semi_circle(start, end, R, step):
     """
     semi_circle function callback
+
+    Raises:
+        ValueError: If the arc cannot be drawn, i.e. ``R`` or ``step`` is
+            not positive or ``start`` and ``end`` are more than ``2 * R``
+            apart.
     """
     xc = np.round((start[0] + end[0]) / 2, 5)
     yc = np.round((start[1] + end[1]) / 2, 5)
     d = np.round(np.sqrt((end[0] - start[0]) ** 2 + (end[1] - start[1]) ** 2), 5)
+    if not (R > 0 and step > 0):
+        raise ValueError(f"Radius and step must be positive, received {R=}, {step=}")
+    if d > 2 * R:
+        raise ValueError(f"{start=} and {end=} are {d} apart, too far for {R=}")
     # TODO: find way to calculate arc length instead of assuming semi-circle
     arc_length = np.round(2 * R * np.arcsin(d / (2 * R)), 5)
-    try:
-        npts = int(np.ceil(arc_length / step))
-    except:  # noqa: E722
-        print("why")
+    npts = int(np.ceil(arc_length / step))
     t0 = np.arctan2(start[1] - yc, start[0] - xc)
     t1 = np.arctan2(end[1] - yc, end[0] - xc)
     thetas = np.linspace(t0, t1, int(npts))
@@ -130,6 +291,7 @@ def semi_circle(start, end, R, step):
     return x, y
 
 
+@cache_trajectory
 def lissajous(
     dwell,
     step_size,
@@ -140,15 +302,20 @@ def lissajous(
     cycles,
     x_freq=7.7,
     y_freq=10,
+    equidistant=False,
 ):
     """
     lissajous function callback
+
+    With ``equidistant``, the points are resampled ``step_size`` apart along
+    the path (see :func:`resample_path`) instead of evenly in phase.
     """
     npts = int(np.ceil(x_width / step_size) * cycles)
     pts = np.linspace(0, 2 * np.pi * cycles, npts)
     x = x_center + x_width * np.cos(x_freq * pts) / 2
     y = y_center + y_width * np.cos(y_freq * pts) / 2
-    # TODO: consider passing coordinared through equidistant()
+    if equidistant:
+        x, y = resample_path(x, y, step=step_size)
     times = np.ones_like(x) * dwell  # noqa: F841
 
     return x, y
@@ -249,3 +416,63 @@ def equidistant(x, y, dt):
             trig_idx.append(idx)
             ctr = 0
     return np.asarray(trig_idx).astype("int")
+
+
+def path_length(x, y):
+    """
+    Cumulative distance along a path.
+
+    Parameters:
+        x (array): x positions.
+        y (array): y positions.
+
+    Returns:
+        array: Distance from the first point to each point.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    s = np.empty(x.shape, dtype=np.float64)
+    if s.size:
+        s[0] = 0
+        np.cumsum(np.hypot(np.diff(x), np.diff(y)), out=s[1:])
+    return s
+
+
+def resample_path(x, y, step=None, speed=None, dwell=None):
+    """
+    Resample a path at a constant distance between points.
+
+    Points are placed by linear interpolation on the arc length, so the
+    stage covers the same distance during each dwell.  Give either ``step``
+    or the constant ``speed`` wanted at a given ``dwell`` per point.  The
+    first point is kept; the last one only if it falls on the step.
+
+    Parameters:
+        x (array): x positions.
+        y (array): y positions.
+        step (float, optional): Distance between resampled points.
+        speed (float, optional): Constant speed along the path.
+        dwell (float, optional): Time per point, required with ``speed``.
+
+    Returns:
+        tuple: Resampled ``(x, y)`` float64 arrays.
+    """
+    if step is None:
+        if speed is None or dwell is None:
+            raise ValueError("Give either step, or both speed and dwell.")
+        step = speed * dwell
+    if step <= 0:
+        raise ValueError(f"Step along the path must be positive, received {step}")
+
+    s = path_length(x, y)
+    if s.size < 2:
+        return np.array(x, dtype=np.float64), np.array(y, dtype=np.float64)
+    # repeated points would make the arc length non-increasing
+    moving = np.empty(s.shape, dtype=bool)
+    moving[0] = True
+    np.greater(s[1:], s[:-1], out=moving[1:])
+    s = s[moving]
+    targets = np.arange(0, s[-1] + step * 1e-9, step)
+    x_new = np.interp(targets, s, np.asarray(x, dtype=np.float64)[moving])
+    y_new = np.interp(targets, s, np.asarray(y, dtype=np.float64)[moving])
+    return x_new, y_new
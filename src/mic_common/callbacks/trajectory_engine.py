@@ -0,0 +1,503 @@
+"""
+Vectorized trajectories for the mic instrument.
+
+Array-based counterparts of the generators in
+:mod:`mic_common.callbacks.trajectories`.  No per-row Python loops and no
+``np.append``: every function sizes its output up front and fills
+preallocated ``float64`` arrays ``(x, y, t)``, where ``t`` is the time spent
+on each point (the profile-move ``Times`` convention).
+
+List of functions::
+
+    # snake( ... ): # bidirectional raster, rows alternate direction
+    # raster( ... ): # unidirectional raster with a return stroke
+    # spiral( ... ): # semi-circle spiral built from all arcs at once
+    # lissajous( ... ): # lissajous figure
+    # trajectory_size( ... ): # number of points, without generating them
+    # iter_segments( ... ): # lazy fixed-size (x, y, t) segments
+    # prefetch( ... ): # compute the next segment while this one executes
+    # benchmark( ... ): # compare against the list-based generators
+"""
+
+__all__ = """
+    snake
+    raster
+    spiral
+    lissajous
+    trajectory_size
+    iter_segments
+    prefetch
+    benchmark
+""".split()
+
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+
+from . import trajectories
+
+logger = logging.getLogger(__name__)
+
+DECIMALS = 5  # same rounding as the list-based generators
+SEGMENT_SIZE = 2000  # points per segment, fits the profile-move arrays
+
+
+def _grid_axes(step_size, x_center, y_center, x_width, y_width):
+    """Return the column positions and row positions of a rectangular map."""
+    rows = int(np.ceil(y_width / step_size))
+    cols = int(np.ceil(x_width / step_size)) + 1
+    xpts = np.round(
+        np.linspace(x_center - x_width / 2, x_center + x_width / 2, cols), DECIMALS
+    )
+    ypts = np.linspace(y_center - y_width / 2, y_center + y_width / 2, rows + 1)
+    return xpts, ypts[:rows]
+
+
+def _grid_layout(step_size, x_center, y_center, x_width, y_width, snake_rows):
+    """
+    Size of a rectangular map and a function making any slice of it.
+
+    The slice is built from the whole rows it touches, by broadcasting.
+    """
+    xpts, ypts = _grid_axes(step_size, x_center, y_center, x_width, y_width)
+    cols = xpts.size
+
+    def points(start, stop):
+        first_row = start // cols
+        last_row = -(-stop // cols)  # ceil
+        shape = (last_row - first_row, cols)
+        x = np.empty(shape, dtype=np.float64)
+        y = np.empty(shape, dtype=np.float64)
+        x[:] = xpts
+        if snake_rows:
+            # even rows (counted from the first row of the map) run backwards
+            x[first_row % 2 :: 2] = xpts[::-1]
+        y[:] = ypts[first_row:last_row, np.newaxis]
+        offset = first_row * cols
+        return (
+            x.ravel()[start - offset : stop - offset],
+            y.ravel()[start - offset : stop - offset],
+        )
+
+    return ypts.size * cols, points
+
+
+def _spiral_layout(r_step_size, step_size, x_center, y_center, diameter):
+    """Size of a semi-circle spiral and a function making any slice of it."""
+    radii, counts = trajectories.spiral_arcs(r_step_size, step_size, diameter)
+
+    def points(start, stop):
+        return trajectories.spiral_points(
+            radii, counts, r_step_size, x_center, y_center, start, stop
+        )
+
+    return int(counts.sum()), points
+
+
+def _lissajous_layout(
+    step_size, x_center, y_center, x_width, y_width, cycles, x_freq=7.7, y_freq=10
+):
+    """Size of a lissajous figure and a function making any slice of it."""
+    npts = int(np.ceil(x_width / step_size) * cycles)
+    dphase = 2 * np.pi * cycles / max(npts - 1, 1)  # same spacing as np.linspace
+
+    def points(start, stop):
+        phase = np.arange(start, stop, dtype=np.float64)
+        phase *= dphase
+        x = np.empty(phase.size, dtype=np.float64)
+        y = np.empty(phase.size, dtype=np.float64)
+        np.multiply(phase, x_freq, out=x)
+        np.cos(x, out=x)
+        x *= x_width / 2
+        x += x_center
+        np.multiply(phase, y_freq, out=y)
+        np.cos(y, out=y)
+        y *= y_width / 2
+        y += y_center
+        return x, y
+
+    return npts, points
+
+
+def _layout(trajectory, *args, **kwargs):
+    """
+    Size, point maker and time maker for a trajectory.
+
+    ``args`` and ``kwargs`` are those of the public function of the same
+    name.  The time maker takes the ``(x, y)`` of a slice and the index of
+    its first point.
+    """
+    if trajectory == "snake":
+        dwell, *geometry = args
+        npts, points = _grid_layout(*geometry, snake_rows=True)
+    elif trajectory == "raster":
+        dwell, *geometry, x_return_vel = args
+        x_return_accel = kwargs.get("x_return_accel")
+        npts, points = _grid_layout(*geometry, snake_rows=False)
+
+        def times(x, y, start):
+            if start > 0:
+                # the previous point tells whether this slice opens a new row
+                x0, y0 = points(start - 1, start)
+                x = np.concatenate((x0, x))
+                y = np.concatenate((y0, y))
+            t = trajectories.raster_times(
+                x, y, dwell, x_return_vel, x_return_accel, cumulative=False
+            )
+            return t[1:] if start > 0 else t
+
+        return npts, points, times
+    elif trajectory == "spiral":
+        dwell, *geometry = args
+        npts, points = _spiral_layout(*geometry)
+    elif trajectory == "lissajous":
+        dwell, *geometry = args
+        npts, points = _lissajous_layout(*geometry, **kwargs)
+    else:
+        raise ValueError(f"Unknown trajectory: {trajectory!r}")
+
+    def times(x, y, start):
+        return np.full(x.size, float(dwell), dtype=np.float64)
+
+    return npts, points, times
+
+
+def _generate(trajectory, *args, **kwargs):
+    """Whole trajectory as ``(x, y, t)``."""
+    npts, points, times = _layout(trajectory, *args, **kwargs)
+    x, y = points(0, npts)
+    return x, y, times(x, y, 0)
+
+
+def _equidistant(x, y, dwell, step_size):
+    """Whole trajectory resampled at a constant step, as ``(x, y, t)``."""
+    x, y = trajectories.resample_path(x, y, step=step_size)
+    return x, y, np.full(x.size, float(dwell), dtype=np.float64)
+
+
+def snake(dwell, step_size, x_center, y_center, x_width, y_width):
+    """
+    Bidirectional raster (snake) trajectory.
+
+    Same points as :func:`mic_common.callbacks.trajectories.snake`: ``rows``
+    lines of ``cols + 1`` points, even rows run from high to low x.
+
+    Parameters:
+        dwell (float): Time per point.
+        step_size (float): Distance between points and between rows.
+        x_center (float): Center of the map in x.
+        y_center (float): Center of the map in y.
+        x_width (float): Width of the map in x.
+        y_width (float): Height of the map in y.
+
+    Returns:
+        tuple: ``(x, y, t)`` float64 arrays.
+    """
+    return _generate("snake", dwell, step_size, x_center, y_center, x_width, y_width)
+
+
+def raster(
+    dwell,
+    step_size,
+    x_center,
+    y_center,
+    x_width,
+    y_width,
+    x_return_vel,
+    x_return_accel=None,
+):
+    """
+    Unidirectional raster trajectory.
+
+    Same points and times as :func:`mic_common.callbacks.trajectories.raster`,
+    every row runs from low to high x.  ``t`` is the time to reach each
+    point from the previous one, flybacks included; its sum is the duration
+    of the scan.  For timestamps, use
+    :func:`mic_common.callbacks.trajectories.raster_times`.
+
+    Parameters:
+        dwell (float): Time per point.
+        step_size (float): Distance between points and between rows.
+        x_center (float): Center of the map in x.
+        y_center (float): Center of the map in y.
+        x_width (float): Width of the map in x.
+        y_width (float): Height of the map in y.
+        x_return_vel (float): Velocity of the return stroke.
+        x_return_accel (float, optional): Acceleration of the return stroke.
+
+    Returns:
+        tuple: ``(x, y, t)`` float64 arrays.
+    """
+    return _generate(
+        "raster",
+        dwell,
+        step_size,
+        x_center,
+        y_center,
+        x_width,
+        y_width,
+        x_return_vel,
+        x_return_accel=x_return_accel,
+    )
+
+
+def spiral(
+    dwell, r_step_size, step_size, x_center, y_center, diameter, equidistant=False
+):
+    """
+    Spiral made of alternating semi-circles, all arcs computed at once.
+
+    Same points as :func:`mic_common.callbacks.trajectories.spiral`, from
+    :func:`mic_common.callbacks.trajectories.spiral_points`.
+
+    Parameters:
+        dwell (float): Time per point.
+        r_step_size (float): Radial pitch of the spiral.
+        step_size (float): Distance between points along an arc.
+        x_center (float): Center of the spiral in x.
+        y_center (float): Center of the spiral in y.
+        diameter (float): Extent of the spiral.
+        equidistant (bool): Resample the path ``step_size`` apart.
+
+    Returns:
+        tuple: ``(x, y, t)`` float64 arrays.
+    """
+    x, y, t = _generate(
+        "spiral", dwell, r_step_size, step_size, x_center, y_center, diameter
+    )
+    if equidistant:
+        return _equidistant(x, y, dwell, step_size)
+    return x, y, t
+
+
+def lissajous(
+    dwell,
+    step_size,
+    x_center,
+    y_center,
+    x_width,
+    y_width,
+    cycles,
+    x_freq=7.7,
+    y_freq=10,
+    equidistant=False,
+):
+    """
+    Lissajous trajectory.
+
+    Parameters:
+        dwell (float): Time per point.
+        step_size (float): Sets the number of points per cycle.
+        x_center (float): Center of the figure in x.
+        y_center (float): Center of the figure in y.
+        x_width (float): Full width of the figure in x.
+        y_width (float): Full height of the figure in y.
+        cycles (float): Number of cycles.
+        x_freq (float): Relative frequency in x.
+        y_freq (float): Relative frequency in y.
+        equidistant (bool): Resample the path ``step_size`` apart instead
+            of evenly in phase.
+
+    Returns:
+        tuple: ``(x, y, t)`` float64 arrays.
+    """
+    x, y, t = _generate(
+        "lissajous",
+        dwell,
+        step_size,
+        x_center,
+        y_center,
+        x_width,
+        y_width,
+        cycles,
+        x_freq=x_freq,
+        y_freq=y_freq,
+    )
+    if equidistant:
+        return _equidistant(x, y, dwell, step_size)
+    return x, y, t
+
+
+def trajectory_size(trajectory, *args, **kwargs):
+    """
+    Number of points of a trajectory, without generating it.
+
+    Parameters:
+        trajectory (str): "snake", "raster", "spiral" or "lissajous".
+        *args: Arguments of the function of that name.
+        **kwargs: Keyword arguments of the function of that name.
+
+    Returns:
+        int: Number of points.
+    """
+    npts, _points, _times = _layout(trajectory, *args, **kwargs)
+    return npts
+
+
+def iter_segments(trajectory, *args, segment_size=SEGMENT_SIZE, **kwargs):
+    """
+    Yield a trajectory lazily, as fixed-size ``(x, y, t)`` segments.
+
+    Only one segment exists in memory at a time, so the trajectory may be
+    longer than the profile-move or SoftGlue buffers.  The last segment may
+    be shorter.  Concatenated, the segments equal the whole trajectory.
+
+    Parameters:
+        trajectory (str): "snake", "raster", "spiral" or "lissajous".
+        *args: Arguments of the function of that name.
+        segment_size (int): Points per segment.
+        **kwargs: Keyword arguments of the function of that name.
+
+    Yields:
+        tuple: ``(x, y, t)`` float64 arrays of at most ``segment_size`` points.
+    """
+    if segment_size < 1:
+        raise ValueError(f"segment_size must be positive, received {segment_size}")
+    npts, points, times = _layout(trajectory, *args, **kwargs)
+    for start in range(0, npts, segment_size):
+        x, y = points(start, min(start + segment_size, npts))
+        yield x, y, times(x, y, start)
+
+
+def prefetch(segments, depth=1):
+    """
+    Compute the next ``depth`` segments in a thread while the current is used.
+
+    Wrap :func:`iter_segments` with this so that segment N+1 is ready to be
+    uploaded as soon as segment N finishes executing.
+
+    Parameters:
+        segments (iterable): Segments, usually from :func:`iter_segments`.
+        depth (int): Number of segments to compute ahead.
+
+    Yields:
+        Items of ``segments``, in order.
+    """
+    done = object()
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producer():
+        try:
+            for item in segments:
+                if not put(item):
+                    return
+        except Exception as exc:
+            put(exc)
+            return
+        put(done)
+
+    worker = threading.Thread(target=producer, daemon=True, name="prefetch")
+    worker.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def _benchmark_cases(npts):
+    """Arguments giving roughly ``npts`` points for each trajectory."""
+    side = int(np.ceil(np.sqrt(npts)))
+    arcs = max(int(2 * np.sqrt(npts / np.pi)), 1)
+    return {
+        "snake": (1, 1, 0, 0, side - 1, side),
+        "raster": (1, 1, 0, 0, side - 1, side, 10),
+        "spiral": (1, 1, 1, 0, 0, arcs),
+        "lissajous": (1, 1, 0, 0, 1000, 1000, max(npts // 1000, 1)),
+    }
+
+
+def _legacy_spiral(dwell, r_step_size, step_size, x_center, y_center, diameter):
+    """The list-based spiral replaced by ``trajectories.spiral``, for timing."""
+    arc_num = int(np.ceil(diameter / r_step_size))
+    start = x_center, y_center + r_step_size
+    end = x_center, y_center - r_step_size
+    x, y = [], []
+    for r in range(arc_num):
+        R = np.round((1 + 0.5 * r) * r_step_size, 5)
+        pts_x, pts_y = trajectories.semi_circle(start, end, R, step_size)
+
+        x = np.append(x, np.round(pts_x, 5))
+        y = np.append(y, np.round(pts_y, 5))
+        start = np.round((pts_x[-1], pts_y[-1]), 5)
+        if r % 2:
+            end = np.round((x_center, y_center - (1.5 + 0.5 * r) * r_step_size), 5)
+        else:
+            end = np.round((x_center, y_center + (2 + 0.5 * r) * r_step_size), 5)
+    times = np.ones_like(x) * dwell
+    return np.asarray(x), np.asarray(y), np.asarray(times)
+
+
+def _legacy(name):
+    """The list-based generator ``name``, not cached."""
+    if name == "spiral":
+        return _legacy_spiral
+    return getattr(trajectories, name).__wrapped__
+
+
+def _time_it(func, args, repeat):
+    """Best wall time of ``repeat`` calls, and the number of points made."""
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, len(result[0])
+
+
+def benchmark(npoints=(10**4, 10**6, 10**7), repeat=1, legacy_limit=None):
+    """
+    Compare these generators with the list-based ones in ``trajectories``.
+
+    ``trajectories.spiral`` now shares this module's closed-form arcs, so
+    the spiral is compared with a copy of the former arc-by-arc generator.
+    Use ``legacy_limit`` to skip the list-based runs above that many points.
+
+    Parameters:
+        npoints (tuple): Approximate trajectory sizes to time.
+        repeat (int): Calls per measurement, the best one is reported.
+        legacy_limit (int, optional): Largest size to time the list-based
+            generators with.
+
+    Returns:
+        list: ``(name, npts, legacy_s, vectorized_s)`` per case, ``legacy_s``
+        is ``None`` when skipped.
+    """
+    results = []
+    for target in npoints:
+        for name, args in _benchmark_cases(target).items():
+            fast, npts = _time_it(globals()[name], args, repeat)
+            slow = None
+            if legacy_limit is None or target <= legacy_limit:
+                slow, _ = _time_it(_legacy(name), args, repeat)
+            results.append((name, npts, slow, fast))
+
+    header = ("trajectory", "points", "legacy (s)", "vector (s)", "speedup")
+    print("{:<10} {:>10} {:>11} {:>11} {:>8}".format(*header))
+    for name, npts, slow, fast in results:
+        legacy = "skipped" if slow is None else f"{slow:.4f}"
+        speedup = "" if slow is None else f"{slow / fast:.1f}x"
+        print(f"{name:<10} {npts:>10} {legacy:>11} {fast:>11.4f} {speedup:>8}")
+    return results
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,256 @@
+"""
+Check a trajectory against the motion limits of its motors.
+
+A fly scan that asks a motor for more speed or acceleration than it has
+falls behind, or stalls part way through the map.  These checks run on the
+``(x, y, t)`` arrays before the scan starts, so such a scan is rejected
+before the shutter opens.
+
+Segment ``k`` is the move from point ``k - 1`` to point ``k``, and takes
+``t[k]`` seconds (the profile-move "Times" convention of
+:mod:`mic_common.callbacks.trajectory_engine`).  With ``cumulative=True``
+``t`` holds timestamps instead, as returned by
+:func:`mic_common.callbacks.trajectories.raster_times`.
+
+The acceleration is not checked where an axis stops, starts or reverses,
+e.g. at the turnaround of every snake row: the velocity changes there
+within a single dwell by design, and the motion controller ramps it.
+
+List of objects::
+
+    # AxisLimits: # velocity, acceleration and travel limits of one axis
+    # TrajectoryReport: # segments beyond the limits, and predicted duration
+    # check_trajectory( ... ): # check whole (x, y, t) arrays
+    # check_segments( ... ): # check a trajectory given as segments
+"""
+
+__all__ = """
+    AxisLimits
+    TrajectoryReport
+    check_trajectory
+    check_segments
+""".split()
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+logger.info(__file__)
+
+AXES = ("x", "y")
+KINDS = ("velocity", "acceleration", "travel")
+
+
+class AxisLimits:
+    """Velocity, acceleration and travel limits of one axis.
+
+    Attributes:
+        max_velocity (float): Top speed, units/s.
+        max_accel (float): Largest acceleration, units/s^2.
+        low (float): Low travel limit.
+        high (float): High travel limit.
+    """
+
+    def __init__(self, max_velocity=np.inf, max_accel=np.inf, low=-np.inf, high=np.inf):
+        """Initialize AxisLimits.  Limits not given are not checked."""
+        self.max_velocity = float(max_velocity)
+        self.max_accel = float(max_accel)
+        self.low = float(low)
+        self.high = float(high)
+
+    def __repr__(self):
+        """Limits, as the call that makes them."""
+        return (
+            f"{self.__class__.__name__}(max_velocity={self.max_velocity},"
+            f" max_accel={self.max_accel}, low={self.low}, high={self.high})"
+        )
+
+    @classmethod
+    def from_motor(cls, motor, timeout=2):
+        """Limits read from an ``EpicsMotor``.
+
+        Uses ``.VMAX`` where the motor has it (``s2idd_uprobe`` ``Motor``),
+        else ``.VELO``.  The acceleration is ``.VELO / .ACCL``, since
+        ``.ACCL`` is the time the motor takes to reach its speed.  As in the
+        motor record, a zero ``.VMAX`` and equal travel limits mean no limit.
+
+        Parameters:
+            motor (ophyd.EpicsMotor): The motor.
+            timeout (float): Seconds to wait for the motor to connect.
+        """
+        motor.wait_for_connection(timeout=timeout)
+        velocity = motor.velocity.get()
+        max_velocity = velocity
+        if hasattr(motor, "max_velocity"):
+            max_velocity = motor.max_velocity.get() or velocity
+        accel_time = motor.acceleration.get()
+        max_accel = velocity / accel_time if accel_time > 0 else np.inf
+        low = motor.low_limit_travel.get()
+        high = motor.high_limit_travel.get()
+        if low == high:
+            low, high = -np.inf, np.inf
+        return cls(max_velocity or np.inf, max_accel, low, high)
+
+
+class TrajectoryReport:
+    """Where a trajectory exceeds the limits, and how long it will take.
+
+    Attributes:
+        npts (int): Number of points checked.
+        duration (float): Duration asked for by ``t``.
+        predicted_duration (float): Duration with every segment slowed to
+            the top speed of its motors.
+        violations (dict): ``(axis, kind)`` to the array of offending
+            segment (velocity), point (acceleration, travel) indices.
+        peaks (dict): ``(axis, kind)`` to the largest speed, acceleration,
+            or distance beyond the travel limits, found.
+    """
+
+    def __init__(self):
+        """Initialize an empty TrajectoryReport."""
+        self.npts = 0
+        self.duration = 0.0
+        self.predicted_duration = 0.0
+        self._found = {(axis, kind): [] for axis in AXES for kind in KINDS}
+        self.peaks = {(axis, kind): 0.0 for axis in AXES for kind in KINDS}
+
+    @property
+    def violations(self):
+        """Offending indices, by ``(axis, kind)``."""
+        return {
+            key: np.concatenate(found) if found else np.empty(0, dtype=np.intp)
+            for key, found in self._found.items()
+        }
+
+    @property
+    def ok(self):
+        """True if no segment exceeds the limits."""
+        return not any(self._found.values())
+
+    def _add(self, axis, kind, indices, peak):
+        """Record offending ``indices`` and the ``peak`` value found."""
+        if indices.size:
+            self._found[axis, kind].append(indices)
+        self.peaks[axis, kind] = max(self.peaks[axis, kind], float(peak))
+
+    def __str__(self):
+        """Summary of the violations, one line per axis and kind."""
+        lines = [
+            f"{self.npts} points, {self.duration:.3f} s"
+            f" (predicted {self.predicted_duration:.3f} s)"
+        ]
+        for (axis, kind), indices in self.violations.items():
+            if indices.size:
+                lines.append(
+                    f"{axis} {kind}: {indices.size} beyond the limit,"
+                    f" first at {indices[0]}, peak {self.peaks[axis, kind]:.6g}"
+                )
+        if self.ok:
+            lines.append("within the limits")
+        return "\n".join(lines)
+
+
+def check_trajectory(x, y, t, x_limits, y_limits, cumulative=False):
+    """
+    Check a trajectory against the limits of its x and y motors.
+
+    Vectorized, a million points take a few tens of milliseconds.
+
+    Parameters:
+        x (array): x positions.
+        y (array): y positions.
+        t (array): Time of each segment, or timestamps if ``cumulative``.
+        x_limits (AxisLimits): Limits of the x motor.
+        y_limits (AxisLimits): Limits of the y motor.
+        cumulative (bool): ``t`` holds timestamps.
+
+    Returns:
+        TrajectoryReport: Violations and predicted duration.
+    """
+    return check_segments([(x, y, t)], x_limits, y_limits, cumulative=cumulative)
+
+
+def check_segments(segments, x_limits, y_limits, cumulative=False):
+    """
+    Check a trajectory given as ``(x, y, t)`` segments.
+
+    Accepts :func:`mic_common.callbacks.trajectory_engine.iter_segments`,
+    so the whole trajectory is never in memory.  Indices in the report
+    count from the start of the trajectory.
+
+    Parameters:
+        segments: Iterable of ``(x, y, t)`` arrays.
+        x_limits (AxisLimits): Limits of the x motor.
+        y_limits (AxisLimits): Limits of the y motor.
+        cumulative (bool): ``t`` holds timestamps.
+
+    Returns:
+        TrajectoryReport: Violations and predicted duration.
+    """
+    report = TrajectoryReport()
+    limits = dict(zip(AXES, (x_limits, y_limits), strict=True))
+    tail = None  # last two points, to join the segments
+    for x, y, t in segments:
+        positions = {
+            "x": np.asarray(x, dtype=np.float64),
+            "y": np.asarray(y, dtype=np.float64),
+        }
+        t = np.asarray(t, dtype=np.float64)
+        start = report.npts
+        report.npts += t.size
+        if t.size == 0:
+            continue
+
+        for axis, pos in positions.items():
+            lim = limits[axis]
+            beyond = np.maximum(lim.low - pos, pos - lim.high)
+            over = np.flatnonzero(beyond > 0)
+            report._add(axis, "travel", over + start, beyond.max())
+
+        if tail is None:
+            # segment 0 has no move, only its dwell
+            if not cumulative:
+                report.duration += t[0]
+                report.predicted_duration += t[0]
+            ntail = 0
+        else:
+            ntail = tail["t"].size
+            t = np.concatenate((tail["t"], t))
+            for axis in AXES:
+                positions[axis] = np.concatenate((tail[axis], positions[axis]))
+        tail = {key: value[-2:] for key, value in (("t", t), *positions.items())}
+        if t.size < 2:
+            continue
+
+        # segment j moves to point j + 1; the first ntail - 1 were checked
+        dt = np.diff(t) if cumulative else t[1:]
+        new = slice(max(ntail - 1, 0), None)
+        first = start - ntail + 1  # index of the point segment 0 moves to
+        slowest = dt[new].copy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for axis in AXES:
+                lim = limits[axis]
+                step = np.abs(np.diff(positions[axis]))
+                speed = np.where(step > 0, step / dt, 0.0)
+                velocity = np.diff(positions[axis]) / dt
+                over = np.flatnonzero(speed[new] > lim.max_velocity)
+                over += first + new.start
+                report._add(axis, "velocity", over, speed[new].max())
+                np.maximum(slowest, step[new] / lim.max_velocity, out=slowest)
+
+                # acceleration at point j + 1, from segment j to segment j + 1
+                accel = np.abs(np.diff(velocity)) / (0.5 * (dt[:-1] + dt[1:]))
+                accel[np.isnan(accel)] = 0.0
+                # turnarounds: the axis stops, starts or reverses there
+                sign = np.sign(velocity)
+                accel[sign[:-1] != sign[1:]] = 0.0
+                if accel.size:
+                    over = np.flatnonzero(accel > lim.max_accel)
+                    report._add(axis, "acceleration", over + first, accel.max())
+        report.duration += dt[new].sum()
+        report.predicted_duration += slowest.sum()
+
+    if not report.ok:
+        logger.warning("Trajectory exceeds the motor limits:\n%s", report)
+    return report
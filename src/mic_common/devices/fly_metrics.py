@@ -0,0 +1,183 @@
+"""
+Live point rate and lag of the detectors during a fly scan.
+
+The SIS3820 channel advances with the stage, it is the reference.  The
+XMAP current pixel and the pixels written by the NetCDF file plugin are
+compared with it: the lag is how many pixels, and how many seconds at the
+current rate, a device is behind the stage.
+
+The counters are cached from their monitors and sampled at a fixed rate
+by a thread, between ``start_sampling()`` and ``stop_sampling()`` or for
+the length of a scan as a ScanMonitor hook.  The results are soft Signals
+of a Device: they can be plotted, logged with the baseline, or subscribed
+to for alarms.
+
+List of objects::
+
+    # FlyScanMetrics: # rate and lag Signals, also a ScanMonitor hook
+"""
+
+__all__ = """
+    FlyScanMetrics
+""".split()
+
+import logging
+import threading
+import time
+from numbers import Integral
+
+from ophyd import Component
+from ophyd import Device
+from ophyd import Signal
+
+from mic_common.utils.scan_monitor import ScanMonitorHooks
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL = 0.5  # seconds between samples
+MAX_LAG_TIME = 5.0  # seconds behind the stage before lag_alarm is set
+
+
+class FlyScanMetrics(Device, ScanMonitorHooks):
+    """Rate and lag of the SIS3820, the XMAP and its NetCDF file plugin.
+
+    Rates are pixels per second, lags are pixels behind the SIS3820 and
+    seconds at the SIS3820 rate.  ``lag_alarm`` is 1 while a device is
+    more than ``max_lag_time`` seconds behind.
+
+    Parameters:
+        sis3820 (SIS3820): Its ``current_channel`` counts the pixels.
+        xmap (XMAP, optional): Its ``current_pixel`` is compared.
+        netcdf (DetNetCDF, optional): Its ``num_captured`` is compared.
+        netcdf_pixels (int): Pixels in one captured array, the XMAP
+            buffer size.
+        interval (float): Seconds between samples.
+        max_lag_time (float): Lag, in seconds, that sets ``lag_alarm``.
+    """
+
+    point_rate = Component(Signal, value=0.0, kind="hinted")
+    xmap_rate = Component(Signal, value=0.0)
+    xmap_lag = Component(Signal, value=0)
+    xmap_lag_time = Component(Signal, value=0.0)
+    netcdf_rate = Component(Signal, value=0.0)
+    netcdf_lag = Component(Signal, value=0)
+    netcdf_lag_time = Component(Signal, value=0.0)
+    netcdf_queue = Component(Signal, value=0)
+    lag_alarm = Component(Signal, value=0)
+
+    def __init__(
+        self,
+        *args,
+        sis3820=None,
+        xmap=None,
+        netcdf=None,
+        netcdf_pixels=1,
+        interval=SAMPLE_INTERVAL,
+        max_lag_time=MAX_LAG_TIME,
+        **kwargs,
+    ):
+        """Initialize FlyScanMetrics."""
+        super().__init__(*args, **kwargs)
+        if isinstance(netcdf_pixels, bool) or not isinstance(netcdf_pixels, Integral):
+            raise TypeError(f"netcdf_pixels must be an int: {netcdf_pixels!r}")
+        if netcdf_pixels < 1:
+            raise ValueError(f"netcdf_pixels must be positive: {netcdf_pixels!r}")
+        self.sources = {"sis3820": (sis3820, "current_channel", 1)}
+        if xmap is not None:
+            self.sources["xmap"] = (xmap, "current_pixel", 1)
+        if netcdf is not None:
+            self.sources["netcdf"] = (netcdf, "num_captured", netcdf_pixels)
+            self.sources["netcdf_queue"] = (netcdf, "queue_use", 1)
+        self.interval = interval
+        self.max_lag_time = max_lag_time
+        self._latest = {}
+        self._previous = {}
+        self._subscriptions = []
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _cache(self, key, scale):
+        def callback(value, **kwargs):
+            self._latest[key] = value * scale
+
+        return callback
+
+    def sample(self, now=None):
+        """Compute the rates and lags from the cached counters."""
+        now = time.monotonic() if now is None else now
+        latest = dict(self._latest)
+        rates = {}
+        for key in ("sis3820", "xmap", "netcdf"):
+            if key not in latest:
+                continue
+            if key in self._previous:
+                t, count = self._previous[key]
+                dt = now - t
+                # a counter going back is a new line, not a negative rate
+                if dt > 0 and latest[key] >= count:
+                    rates[key] = (latest[key] - count) / dt
+            self._previous[key] = (now, latest[key])
+
+        point_rate = rates.get("sis3820", 0.0)
+        self.point_rate.put(point_rate)
+        alarm = 0
+        for key in ("xmap", "netcdf"):
+            if key not in latest:
+                continue
+            lag = max(latest.get("sis3820", 0) - latest[key], 0)
+            lag_time = lag / point_rate if point_rate > 0 else 0.0
+            getattr(self, f"{key}_rate").put(rates.get(key, 0.0))
+            getattr(self, f"{key}_lag").put(lag)
+            getattr(self, f"{key}_lag_time").put(lag_time)
+            alarm |= lag_time > self.max_lag_time
+        if "netcdf_queue" in latest:
+            self.netcdf_queue.put(latest["netcdf_queue"])
+        alarm = int(alarm)
+        if alarm != self.lag_alarm.get():
+            if alarm:
+                logger.warning(
+                    "Fly scan detectors lag: xmap %.1f s, netcdf %.1f s",
+                    self.xmap_lag_time.get(), self.netcdf_lag_time.get(),
+                )
+            self.lag_alarm.put(alarm)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.sample()
+            except Exception:
+                logger.exception("FlyScanMetrics sample failed")
+
+    def start_sampling(self):
+        """Cache the counters from their monitors and start sampling."""
+        if self._thread is not None:
+            return
+        self._latest = {}
+        self._previous = {}
+        for key, (device, attr, scale) in self.sources.items():
+            signal = getattr(device, attr)
+            cid = signal.subscribe(self._cache(key, scale), run=True)
+            self._subscriptions.append((signal, cid))
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=f"{self.name}.sample", daemon=True
+        )
+        self._thread.start()
+
+    def stop_sampling(self):
+        """Stop sampling and remove the subscriptions."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+        while self._subscriptions:
+            signal, cid = self._subscriptions.pop()
+            signal.unsubscribe(cid)
+
+    def on_start(self, monitor):
+        """Sample for the length of the scan."""
+        self.start_sampling()
+
+    def on_finish(self, monitor):
+        """Stop with the scan."""
+        self.stop_sampling()
@@ -0,0 +1,244 @@
+"""
+The PVs of the master file configuration as baseline Devices.
+
+Each section of ``masterFileConfig.yml`` (ACCELERATOR, BEAMLINE, ...)
+becomes a lightweight Device of soft Signals, one per entry, so the PVs
+written to the ``_master.h5`` file are also in the baseline stream of
+every run in the catalog.
+
+The Devices of a configuration share one ``MasterFileSnapshot``: the
+first section triggered reads all the PVs of all the sections with a
+single ``epics.caget_many``, in about one CA round trip, and the others
+take their values from it.
+
+List of objects::
+
+    # MasterFilePV: # soft Signal with the value of a PV, read in a batch
+    # MasterFileSection: # a section of the configuration, triggered in a batch
+    # MasterFileSnapshot: # batched read of the PVs of all the sections
+    # master_file_baseline( ... ): # one Device per section of the configuration
+    # setup_master_file_baseline( ... ): # add them to the baseline stream
+"""
+
+__all__ = """
+    MasterFilePV
+    MasterFileSection
+    MasterFileSnapshot
+    master_file_baseline
+    setup_master_file_baseline
+""".split()
+
+import logging
+import re
+import threading
+import time
+
+import numpy as np
+from ophyd import Component
+from ophyd import Device
+from ophyd import Signal
+from ophyd.device import create_device_from_components
+from ophyd.status import DeviceStatus
+
+from mic_common.utils.pv_metadata_cache import metadata_cache
+
+logger = logging.getLogger(__name__)
+
+BASELINE_TIMEOUT = 1.0  # seconds to connect and read the PVs of a snapshot
+MAX_AGE = 1.0  # seconds the values of a snapshot are shared by the sections
+
+
+class MasterFilePV(Signal):
+    """Value of an EPICS PV, set by its MasterFileSnapshot.
+
+    Parameters:
+        pvname (str): The PV read.
+        units (str): Engineering units, empty if none.
+        long_name (str): Description of the PV.
+    """
+
+    def __init__(self, *args, pvname="", units="", long_name="", **kwargs):
+        """Initialize MasterFilePV."""
+        kwargs.setdefault("value", np.nan)
+        super().__init__(*args, **kwargs)
+        self.pvname = pvname
+        self.units = units
+        self.long_name = long_name
+
+    def describe(self):
+        """The PV as the source, with its units."""
+        desc = super().describe()
+        desc[self.name]["source"] = f"PV:{self.pvname}"
+        if self.units:
+            desc[self.name]["units"] = self.units
+        return desc
+
+
+class MasterFileSection(Device):
+    """A section of the master file configuration.
+
+    ``trigger()`` reads the PVs in a thread, through the shared
+    ``snapshot``.
+    """
+
+    snapshot = None  # MasterFileSnapshot, set by master_file_baseline()
+
+    def trigger(self):
+        """Read the PVs of the section, in one batch with the others."""
+        status = DeviceStatus(self)
+
+        def update():
+            try:
+                self.snapshot.update(self)
+            except Exception as reason:
+                status.set_exception(reason)
+            else:
+                status.set_finished()
+
+        threading.Thread(target=update, daemon=True).start()
+        return status
+
+
+class MasterFileSnapshot:
+    """Batched read of the PVs of the master file sections.
+
+    A section is updated from the last batch if it has not been updated
+    from it yet and the batch is younger than ``max_age``.  Otherwise all
+    the PVs are read again.
+
+    Parameters:
+        timeout (float): Seconds to connect and to read.
+        max_age (float): Seconds the values of a batch are used.
+    """
+
+    def __init__(self, timeout=BASELINE_TIMEOUT, max_age=MAX_AGE):
+        """Initialize MasterFileSnapshot."""
+        self.timeout = timeout
+        self.max_age = max_age
+        self.sections = []
+        self._values = {}
+        self._pending = set()  # sections not updated from the last batch
+        self._time = 0
+        self._lock = threading.Lock()
+
+    def _signals(self, section):
+        return [getattr(section, attr) for attr in section.component_names]
+
+    def fetch(self):
+        """Read the PVs of all the sections, in one ``caget_many``."""
+        import epics
+
+        epics.ca.use_initial_context()  # called from the trigger threads
+        pvs = sorted(
+            {sig.pvname for section in self.sections for sig in self._signals(section)}
+        )
+        t0 = time.monotonic()
+        values = epics.caget_many(
+            pvs, timeout=self.timeout, connection_timeout=self.timeout
+        )
+        self._values = dict(zip(pvs, values, strict=True))
+        self._pending = {section.name for section in self.sections}
+        self._time = time.monotonic()
+        missing = [pv for pv, value in self._values.items() if value is None]
+        logger.debug(
+            "Read %d master file PVs in %.3f s", len(pvs), self._time - t0
+        )
+        if missing:
+            logger.warning("Master file PVs not read: %s", missing)
+
+    def update(self, section):
+        """Set the Signals of ``section`` from the batch, read if needed."""
+        with self._lock:
+            age = time.monotonic() - self._time
+            if section.name not in self._pending or age > self.max_age:
+                self.fetch()
+            self._pending.discard(section.name)
+            values = self._values
+        for signal in self._signals(section):
+            value = values.get(signal.pvname)
+            signal.put(np.nan if value is None else value)
+
+
+def _attr_name(name):
+    """A Component name for the entry ``name``."""
+    attr = re.sub(r"\W", "_", name)
+    return attr if attr.isidentifier() else f"pv_{attr}"
+
+
+def master_file_baseline(specifications, timeout=BASELINE_TIMEOUT,
+                         labels=("baseline",)):
+    """One Device per section of the master file configuration.
+
+    An entry is read from its ``RBV_PV``, or else its ``VALUE_PV`` or
+    ``PV``.  Units and descriptions come from ``metadata_cache``.
+
+    Parameters:
+        specifications (dict): The master file YAML, by section.
+        timeout (float): Seconds to connect and read the PVs of a
+            snapshot.
+        labels (tuple): Labels of the Devices.
+
+    Returns:
+        list: The MasterFileSection Devices, named after the sections in
+        lower case.
+    """
+    entries = {}
+    for section_name, specs in specifications.items():
+        entries[section_name] = {}
+        for key, entry in specs.items():
+            if not isinstance(entry, dict):
+                raise TypeError(f"Expected a dictionary: {key=} {entry=}")
+            pv = entry.get("RBV_PV", entry.get("VALUE_PV", entry.get("PV")))
+            units = entry.get("UNITS_PV", "")
+            entries[section_name][entry["NAME"]] = (pv, units)
+
+    # the metadata of all the sections, in one batch
+    metadata_pvs = []
+    for section in entries.values():
+        for pv, units in section.values():
+            metadata_pvs.append(f"{pv.split('.')[0]}.DESC")
+            if ":" in units and "." in units:
+                metadata_pvs.append(units)
+    metadata = metadata_cache.fetch(metadata_pvs)
+
+    snapshot = MasterFileSnapshot(timeout=timeout)
+    for section_name, section in entries.items():
+        components = {}
+        for name, (pv, units) in section.items():
+            if ":" in units and "." in units:
+                units = metadata.get(units) or ""
+            components[_attr_name(name)] = Component(
+                MasterFilePV,
+                pvname=pv,
+                units=units,
+                long_name=metadata.get(f"{pv.split('.')[0]}.DESC") or name,
+            )
+        cls = create_device_from_components(
+            f"MasterFile_{section_name}",
+            docstring=f"Section {section_name} of the master file configuration.",
+            base_class=MasterFileSection,
+            **components,
+        )
+        device = cls("", name=section_name.lower(), labels=labels)
+        device.snapshot = snapshot
+        snapshot.sections.append(device)
+    return snapshot.sections
+
+
+def setup_master_file_baseline(sd, specifications, **kwargs):
+    """Add the Devices of ``master_file_baseline()`` to the baseline stream.
+
+    Parameters:
+        sd (bluesky.SupplementalData): Of the RunEngine.
+        specifications (dict): The master file YAML, by section.
+        **kwargs: Arguments of ``master_file_baseline()``.
+
+    Returns:
+        list: The Devices added.
+    """
+    devices = master_file_baseline(specifications, **kwargs)
+    sd.baseline.extend(devices)
+    logger.info(
+        "Master file PVs in the baseline: %s", [device.name for device in devices]
+    )
+    return devices
@@ -4,6 +4,7 @@ __all__ = """
     pm1
 """.split()
 
+import numpy as np
 from apsbits.utils.config_loaders import get_config
 from bluesky import plan_stubs as bps
 from epics import caput  # FIXME: refactor with bps.mv
@@ -11,6 +12,9 @@ from ophyd import Component
 from ophyd import Device
 from ophyd import EpicsSignal
 from ophyd import EpicsSignalRO
+from ophyd.status import Status
+
+from mic_common.utils.status_wait import wait_for_status
 
 iconfig = get_config()
 
@@ -69,8 +73,8 @@ class ProfileMove(Device):
         # yield from run_blocking_function(pm1.abort)
         yield from bps.sleep(0.2)  # arbitrary wait for EPICS to finish the reset.
         # FIXME: replace with yield from bps.mv()
-        caput(self.m1_arr.pvname, list(xarr))
-        caput(self.m2_arr.pvname, list(yarr))
+        caput(self.m1_arr.pvname, np.asarray(xarr, dtype=np.float64))
+        caput(self.m2_arr.pvname, np.asarray(yarr, dtype=np.float64))
         yield from bps.mv(
             self.m1_use,
             1,
@@ -95,6 +99,42 @@ class ProfileMove(Device):
         )
         print("exit in setup_profile_move function")
 
+    def execute(self):
+        """Execute the profile that is built and wait until it is done."""
+        done = Status()
+
+        def watch_execute(old_value, value, **kwargs):
+            # EXSC goes back to 0 when the profile move ends.
+            if old_value in (1, 2, 3) and value == 0:
+                done.set_finished()
+
+        cid = self.exsc.subscribe(watch_execute, run=False)
+        try:
+            yield from bps.mv(self.exsc, 1)
+            yield from wait_for_status(done)
+        finally:
+            self.exsc.unsubscribe(cid)
+
+    def execute_segments(self, segments, dwell_time):
+        """
+        Execute the profile that is built, then each of ``segments`` in turn.
+
+        The trajectory is no longer limited by the size of the position
+        arrays.  The record holds a single set of arrays, so a segment is
+        uploaded as soon as the previous one is done.  Pass
+        ``prefetch(iter_segments(...))`` from
+        :mod:`mic_common.callbacks.trajectory_engine` to have each segment
+        computed while the previous one executes.
+
+        Parameters:
+            segments: Iterable of ``(x, y, t)`` arrays.
+            dwell_time: Time to dwell at each position
+        """
+        yield from self.execute()
+        for xarr, yarr, _times in segments:
+            yield from self.setup_profile_move(xarr, yarr, dwell_time)
+            yield from self.execute()
+
 
 pv = iconfig.get("DEVICES")["PROFILE_MOVE"]
 pm1 = ProfileMove(pv, name="pm1")
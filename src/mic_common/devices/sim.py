@@ -0,0 +1,589 @@
+"""
+In-process simulators of the scan record, detectors and file plugins.
+
+A simulated device has the structure of the real one, every EPICS signal
+replaced by a soft signal with the same PV name, so plans run unchanged:
+PV names used as triggers or positioners resolve to the simulated signals.
+CA round trips are imitated by ``LATENCY``, added to every ``put()`` and
+``get()`` of a plan (``sim_put()`` and ``sim_get()`` of the simulators are
+free).
+
+Some devices also behave:
+
+* a scan record executes when ``execute_scan`` is set: it counts its
+  points in a thread at ``point_time`` each, runs the scan record nested
+  in it at every point, and clears ``execute_scan`` at the end.  It obeys
+  ``.WAIT`` and an abort.
+* a motor moves to its setpoint in ``move_time``.
+* a file plugin counts the frames it is given and increments its file
+  number when capture stops.
+
+Detectors are driven by the scan records: ``on_point`` and ``on_end`` of
+a record are called at every point and at the end of every execution.
+
+An exception in a simulator thread or callback does not stop the scan, it
+is logged and appended to ``SIM_ERRORS``, to fail the run that caused it.
+
+``sim_devices_from_yaml()`` builds the simulators of all the devices of an
+instrument from its ``devices.yml``, under the same names.
+
+List of objects::
+
+    # LATENCY: # seconds added to each CA put and get
+    # set_latency( ... ): # change LATENCY
+    # SIM_ERRORS: # exceptions raised in the simulators
+    # SimEpicsSignal, SimEpicsSignalRO, ...: # soft PVs
+    # SimTablePV: # stand-in for an ``epics.PV`` table, e.g. P1PA
+    # SimScanRecordMixin, SimMotorMixin, SimFilePluginMixin: # behaviours
+    # ENUM_STRS: # enum strings of the mode signals
+    # find_sim_signal( ... ): # simulated signal of a PV name
+    # sim_class( ... ), sim_device( ... ): # simulator of a device class
+    # sim_devices_from_yaml( ... ): # simulators of an instrument
+"""
+
+__all__ = """
+    LATENCY
+    set_latency
+    SIM_ERRORS
+    SimEpicsSignal
+    SimEpicsSignalRO
+    SimEpicsSignalWithRBV
+    SimEpicsPathSignal
+    SimTablePV
+    SimScanRecordMixin
+    SimMotorMixin
+    SimFilePluginMixin
+    ENUM_STRS
+    find_sim_signal
+    sim_class
+    sim_device
+    sim_devices_from_yaml
+""".split()
+
+import copy
+import functools
+import importlib
+import logging
+import threading
+import time
+import weakref
+
+import numpy as np
+import yaml
+from ophyd import Component
+from ophyd import Device
+from ophyd import EpicsMotor
+from ophyd import EpicsSignal
+from ophyd import EpicsSignalRO
+from ophyd.areadetector.base import EpicsSignalWithRBV
+from ophyd.areadetector.cam import EigerDetectorCam
+from ophyd.areadetector.paths import EpicsPathSignal
+from ophyd.areadetector.plugins import FilePlugin
+from ophyd.device import DynamicDeviceComponent
+from ophyd.sim import FakeEpicsPathSignal
+from ophyd.sim import FakeEpicsSignal
+from ophyd.sim import FakeEpicsSignalRO
+from ophyd.sim import FakeEpicsSignalWithRBV
+
+from mic_common.devices.scan_record import ScanRecord
+from mic_common.devices.xmap import XMAP
+from mic_common.devices.xspress3 import Xspress3
+
+logger = logging.getLogger(__name__)
+
+LATENCY = {"put": 0.002, "get": 0.001}  # seconds, a CA round trip on the LAN
+POINT_TIME = 0.01  # seconds per point of a scan record
+RETRACE_TIME = 0.0  # seconds at the end of every scan record execution
+MOVE_TIME = 0.05  # seconds per motor move
+
+SIM_ERRORS = []  # "where: exception" raised in the simulators
+
+_pv_index = weakref.WeakValueDictionary()  # PV name: simulated signal
+
+
+def set_latency(put=None, get=None):
+    """Change the seconds added to each CA put and get of a plan."""
+    if put is not None:
+        LATENCY["put"] = put
+    if get is not None:
+        LATENCY["get"] = get
+
+
+def _record_errors(func):
+    """Wrap ``func``: its exceptions are logged and added to SIM_ERRORS."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except Exception as reason:
+            where = getattr(func, "__qualname__", repr(func))
+            logger.exception("Simulator error in %s", where)
+            SIM_ERRORS.append(f"{where}: {reason!r}")
+
+    return wrapper
+
+
+def find_sim_signal(pvname):
+    """The simulated signal of PV ``pvname``, or None."""
+    return _pv_index.get(pvname.strip()) if pvname else None
+
+
+class _SimSignal:
+    """PV names, latency and index of the simulated signals."""
+
+    alarm_severity = 0  # NO_ALARM, read by EpicsMotor after a move
+    alarm_status = 0
+
+    def _sim_init(self, read_pv, write_pv=None):
+        self._read_pv = read_pv
+        self._write_pv = write_pv or read_pv
+        _pv_index.setdefault(self._read_pv, self)
+        _pv_index[self._write_pv] = self
+        if self.as_string:
+            self.sim_put("")
+        if self._use_limits:
+            self.sim_set_limits((-np.inf, np.inf))  # no limits, as 0, 0 in EPICS
+
+    @property
+    def pvname(self):
+        """Name of the read PV."""
+        return self._read_pv
+
+    @property
+    def setpoint_pvname(self):
+        """Name of the write PV."""
+        return self._write_pv
+
+    def get(self, **kwargs):
+        """Read after the CA get latency."""
+        time.sleep(LATENCY["get"])
+        return super().get(**kwargs)
+
+    def put(self, value, *args, **kwargs):
+        """Write after the CA put latency."""
+        time.sleep(LATENCY["put"])
+        return super().put(value, *args, **kwargs)
+
+    def sim_get(self):
+        """Read without latency, for the simulators."""
+        return super().get()
+
+
+class SimEpicsSignal(_SimSignal, FakeEpicsSignal):
+    """Soft EpicsSignal with PV names and CA latency."""
+
+    def __init__(self, read_pv, write_pv=None, **kwargs):
+        """Initialize SimEpicsSignal."""
+        super().__init__(read_pv, write_pv=write_pv, **kwargs)
+        self._sim_init(read_pv, write_pv)
+
+
+class SimEpicsSignalRO(_SimSignal, FakeEpicsSignalRO):
+    """Soft EpicsSignalRO with PV names and CA latency."""
+
+    def __init__(self, read_pv, **kwargs):
+        """Initialize SimEpicsSignalRO."""
+        super().__init__(read_pv, **kwargs)
+        self._sim_init(read_pv)
+
+
+class SimEpicsSignalWithRBV(_SimSignal, FakeEpicsSignalWithRBV):
+    """Soft EpicsSignalWithRBV with PV names and CA latency."""
+
+    def __init__(self, prefix, **kwargs):
+        """Initialize SimEpicsSignalWithRBV."""
+        super().__init__(prefix, **kwargs)
+        self._sim_init(prefix + "_RBV", prefix)
+
+
+class SimEpicsPathSignal(_SimSignal, FakeEpicsPathSignal):
+    """Soft EpicsPathSignal with PV names and CA latency."""
+
+    def __init__(self, prefix, path_semantics, **kwargs):
+        """Initialize SimEpicsPathSignal."""
+        super().__init__(prefix, path_semantics, **kwargs)
+        self._sim_init(prefix + "_RBV", prefix)
+
+
+class SimTablePV:
+    """Stand-in for the ``epics.PV`` of a scan record table, e.g. ``P1PA``."""
+
+    def __init__(self, pvname):
+        """Initialize SimTablePV."""
+        self.pvname = pvname
+        self.value = np.array([])
+        self.connection_callbacks = []
+
+    def get(self, **kwargs):
+        """The table."""
+        time.sleep(LATENCY["get"])
+        return self.value
+
+    def put(self, value, **kwargs):
+        """Write the table."""
+        time.sleep(LATENCY["put"])
+        self.value = np.asarray(value)
+
+
+def _wait_counter(wcnt):
+    """Putter of ``.WAIT``: a put of 1 adds a hold to ``.WCNT``, 0 removes one."""
+
+    def putter(value, *args, **kwargs):
+        count = wcnt.sim_get() or 0
+        wcnt.sim_put(count + 1 if value else max(count - 1, 0))
+
+    return putter
+
+
+class SimScanRecordMixin:
+    """Behaviour of a simulated scan record.
+
+    Attributes:
+        point_time (float): Seconds per point, the time to move and
+            acquire, when no scan record is nested.
+        retrace_time (float): Seconds at the end of every execution.
+        nested (SimScanRecordMixin): Run at every point, as a ``.EXSC``
+            trigger would in the IOC.
+        on_point (list): Callables ``(point)`` called at every point.
+        on_end (list): Callables ``()`` called at the end of every
+            execution.  Their exceptions go to SIM_ERRORS.
+        executions (list): ``(start, end, points)`` of every execution,
+            ``time.perf_counter()`` seconds.
+    """
+
+    point_time = POINT_TIME
+    retrace_time = RETRACE_TIME
+
+    def __init__(self, *args, **kwargs):
+        """Initialize SimScanRecordMixin, without the table PVs of ScanRecord."""
+        super(ScanRecord, self).__init__(*args, **kwargs)
+        self.P1PA = SimTablePV(f"{self.prefix}.P1PA")
+        self.P2PA = SimTablePV(f"{self.prefix}.P2PA")
+        self.nested = None
+        self.on_point = []
+        self.on_end = []
+        self.executions = []
+        self._abort = threading.Event()
+        self._busy = False
+        self.wait.sim_set_putter(_wait_counter(self.wcnt))
+        self.execute_scan.subscribe(self._execute_changed, run=False)
+        for signal in (self.center, self.width, self.stepsize):
+            signal.subscribe(self._geometry_changed, run=False)
+
+    @_record_errors
+    def _geometry_changed(self, obj=None, **kwargs):
+        """Linked fields of the IOC: the step sets NPTS, the width the step."""
+        width = self.width.sim_get() or 0
+        npts = int(self.number_points.sim_get() or 0)
+        stepsize = self.stepsize.sim_get()
+        if obj is self.stepsize and stepsize:
+            self.number_points.sim_put(int(round(abs(width / stepsize))) + 1)
+        elif obj is self.width and npts > 1:
+            self.stepsize.sim_put(width / (npts - 1))
+        center = self.center.sim_get() or 0
+        self.start_position.sim_put(center - width / 2)
+        self.end_position.sim_put(center + width / 2)
+
+    @_record_errors
+    def _execute_changed(self, old_value=None, value=None, **kwargs):
+        if value and not self._busy:
+            self._busy = True
+            threading.Thread(
+                target=self.run_scan, name=f"{self.name}.run", daemon=True
+            ).start()
+        elif not value and self._busy:
+            self.abort()
+
+    def abort(self):
+        """Stop the scan, and the nested ones, at the next point."""
+        self._abort.set()
+        if self.nested is not None:
+            self.nested.abort()
+
+    def _triggers(self):
+        """Simulated signals of the detector triggers, other than ``nested``."""
+        triggers = []
+        for cpt in ("detTrigger_1", "detTrigger_2", "detTrigger_3", "detTrigger_4"):
+            signal = find_sim_signal(getattr(self, cpt).sim_get())
+            if signal is not None and signal is not getattr(
+                self.nested, "execute_scan", None
+            ):
+                triggers.append(signal)
+        return triggers
+
+    @_record_errors
+    def run_scan(self):
+        """Execute the scan, in the calling thread."""
+        self._busy = True
+        self._abort.clear()
+        start = time.perf_counter()
+        point = 0
+        try:
+            self.execute_scan.sim_put(1)
+            self.scan_phase.sim_put(1)
+            self.number_points_rbv.sim_put(0)
+            for trigger in self._triggers():
+                trigger.sim_put(1)
+            npts = int(self.number_points.sim_get() or 0)
+            while point < npts and not self._abort.is_set():
+                if self.wcnt.sim_get():
+                    self.scan_phase.sim_put(15)  # RECORD SCALAR DATA, held by .WAIT
+                    while self.wcnt.sim_get() and not self._abort.is_set():
+                        time.sleep(0.01)
+                    self.scan_phase.sim_put(1)
+                if self.nested is not None:
+                    self.nested._busy = True
+                    self.nested.run_scan()
+                else:
+                    time.sleep(self.point_time)
+                point += 1
+                self.number_points_rbv.sim_put(point)
+                for callback in self.on_point:
+                    _record_errors(callback)(point)
+            time.sleep(self.retrace_time)
+            for callback in self.on_end:
+                _record_errors(callback)()
+        finally:  # the plan waits for execute_scan to clear
+            self.executions.append((start, time.perf_counter(), point))
+            self._busy = False
+            self.scan_phase.sim_put(0)
+            self.execute_scan.sim_put(0)
+
+
+class SimMotorMixin:
+    """Behaviour of a simulated motor: it moves in ``move_time`` seconds."""
+
+    move_time = MOVE_TIME
+
+    def __init__(self, *args, **kwargs):
+        """Initialize SimMotorMixin, stopped at 0."""
+        super().__init__(*args, **kwargs)
+        self.motor_done_move.sim_put(1)
+        self.user_setpoint.subscribe(self._setpoint_changed, run=False)
+
+    @_record_errors
+    def _setpoint_changed(self, value=None, **kwargs):
+        threading.Thread(target=self._move, args=(value,), daemon=True).start()
+
+    @_record_errors
+    def _move(self, position):
+        self.motor_done_move.sim_put(0)
+        time.sleep(self.move_time)
+        self.user_readback.sim_put(position)
+        self.motor_done_move.sim_put(1)
+
+
+class SimFilePluginMixin:
+    """Behaviour of a simulated file plugin: it counts the frames given."""
+
+    def __init__(self, *args, **kwargs):
+        """Initialize SimFilePluginMixin."""
+        super().__init__(*args, **kwargs)
+        self.file_path_exists.sim_put(1)
+        self.auto_increment.sim_put(1)
+        self.capture.subscribe(self._capture_changed, run=False)
+
+    @_record_errors
+    def _capture_changed(self, old_value=None, value=None, **kwargs):
+        if value and not old_value:
+            self.num_captured.sim_put(0)
+            name = f"{self.file_name.sim_get()}_{self.file_number.sim_get()}"
+            self.full_file_name.sim_put(name)
+        elif old_value and not value and self.auto_increment.sim_get():
+            self.file_number.sim_put(int(self.file_number.sim_get() or 0) + 1)
+
+    def sim_frame(self, *args):
+        """Count a frame, e.g. as ``on_point`` of a scan record."""
+        if self.capture.sim_get():
+            self.num_captured.sim_put(int(self.num_captured.sim_get() or 0) + 1)
+
+
+_scan_rates = (
+    "Passive", "Event", "I/O Intr", "10 second", "5 second", "2 second",
+    "1 second", ".5 second", ".2 second", ".1 second",
+)
+_scan_modes = ("LINEAR", "TABLE", "FLY")
+_abs_rel = ("ABSOLUTE", "RELATIVE")
+_no_yes = ("No", "Yes")
+ENUM_STRS = (  # (device class, {signal: enum strings}), as in the IOCs
+    (
+        ScanRecord,
+        {
+            "scan_mode": _scan_modes,
+            "scan_movement": _abs_rel,
+            "positioners.p1.mode": _scan_modes,
+            "positioners.p2.mode": _scan_modes,
+            "positioners.p1.abs_rel": _abs_rel,
+            "positioners.p2.abs_rel": _abs_rel,
+        },
+    ),
+    (
+        FilePlugin,
+        {
+            "capture": ("Done", "Capturing"),  # of Capture_RBV
+            "enable": ("Disable", "Enable"),
+            "auto_save": _no_yes,
+            "auto_increment": _no_yes,
+            "file_write_mode": ("Single", "Capture", "Stream"),
+        },
+    ),
+    (
+        XMAP,
+        {
+            "collection_mode": (
+                "MCA spectra", "MCA mapping", "SCA mapping", "List mapping"
+            ),
+            "preset_mode": (
+                "No preset", "Real time", "Live time", "Events", "Triggers"
+            ),
+            "status_rate": _scan_rates,
+            "read_rate": _scan_rates,
+        },
+    ),
+    (
+        Xspress3,
+        {
+            "image_mode": ("Single", "Multiple", "Continuous"),
+            "erase_on_start": _no_yes,
+            "trigger_mode": (
+                "Software", "Internal", "IDC", "TTL Veto Only", "TTL Both",
+                "LVDS Veto Only", "LVDS Both",
+            ),
+        },
+    ),
+    (
+        EigerDetectorCam,
+        {
+            "trigger_mode": (
+                "Internal Series", "Internal Enable", "External Series",
+                "External Enable",
+            ),
+            "file_writer_enable": ("Disable", "Enable"),
+            "acquire": ("Done", "Acquire"),
+            "manual_trigger": ("Disable", "Enable"),
+        },
+    ),
+)
+
+_sim_signals = {
+    EpicsSignal: SimEpicsSignal,
+    EpicsSignalRO: SimEpicsSignalRO,
+    EpicsSignalWithRBV: SimEpicsSignalWithRBV,
+    EpicsPathSignal: SimEpicsPathSignal,
+}
+_behaviours = (
+    (ScanRecord, SimScanRecordMixin),
+    (EpicsMotor, SimMotorMixin),
+    (FilePlugin, SimFilePluginMixin),
+)
+_sim_cache = dict(_sim_signals)  # real class: structure with simulated signals
+_sim_classes = {}  # real class: simulator
+
+
+def _sim_structure(cls):
+    """Subclass of ``cls`` with simulated signals, as ``make_fake_device``."""
+    if cls in _sim_cache:
+        return _sim_cache[cls]
+    if not issubclass(cls, Device):
+        for real, sim in _sim_signals.items():
+            if issubclass(cls, real):
+                return sim
+        return cls
+    components = {}
+    for name in cls.component_names:
+        cpt = getattr(cls, name)
+        if isinstance(cpt, DynamicDeviceComponent):
+            cpt = Component(
+                cpt.cls,
+                suffix=cpt.suffix,
+                lazy=cpt.lazy,
+                trigger_value=cpt.trigger_value,
+                kind=cpt.kind,
+                add_prefix=cpt.add_prefix,
+                doc=cpt.doc,
+                **cpt.kwargs,
+            )
+        else:
+            cpt = copy.copy(cpt)
+        cpt.cls = _sim_structure(cpt.cls)
+        components[name] = cpt
+    _sim_cache[cls] = type(f"SimStructure{cls.__name__}", (cls,), components)
+    return _sim_cache[cls]
+
+
+def sim_class(cls):
+    """Simulator of the device or signal class ``cls``.
+
+    The class has the structure of ``cls`` with simulated signals, and the
+    behaviour of a scan record, motor or file plugin if ``cls`` is one.
+    """
+    if cls in _sim_classes:
+        return _sim_classes[cls]
+    sim = structure = _sim_structure(cls)
+    if issubclass(cls, Device):
+        for real, behaviour in _behaviours:
+            if issubclass(cls, real):
+                sim = type(f"Sim{cls.__name__}", (behaviour, structure), {})
+                break
+    _sim_classes[cls] = sim
+    return sim
+
+
+def _apply_enum_strs(device):
+    """Enum strings of the mode signals, for ``mode_setter``."""
+    for cls, enums in ENUM_STRS:
+        if not isinstance(device, cls):
+            continue
+        for attr, strs in enums.items():
+            signal = device
+            try:
+                for part in attr.split("."):
+                    signal = getattr(signal, part)
+            except AttributeError:
+                continue
+            signal.sim_set_enum_strs(strs)
+
+
+def sim_device(cls, *args, **kwargs):
+    """Create the simulator of device class ``cls``, connected and idle."""
+    device = sim_class(cls)(*args, **kwargs)
+    if isinstance(device, Device):
+        _apply_enum_strs(device)
+    return device
+
+
+def _import(dotted):
+    module, _, name = dotted.rpartition(".")
+    return getattr(importlib.import_module(module), name)
+
+
+def sim_devices_from_yaml(path):
+    """Simulators of the devices of an instrument's ``devices.yml``.
+
+    Each entry is created as ``sim_device(cls, **kwargs)`` with the same
+    name.  Entries that are not devices, or whose class cannot be
+    imported or simulated, are skipped with a warning.
+
+    Parameters:
+        path (str): The ``devices.yml`` file.
+
+    Returns:
+        dict: ``{name: simulator}``.
+    """
+    with open(path) as f:
+        config = yaml.safe_load(f)
+    devices = {}
+    for class_path, entries in config.items():
+        for entry in entries:
+            kwargs = dict(entry)
+            kwargs.pop("labels", None)
+            name = kwargs.get("name")
+            try:
+                cls = _import(class_path)
+                if not isinstance(cls, type):
+                    raise TypeError(f"{class_path} is not a class")
+                devices[name] = sim_device(cls, **kwargs)
+            except Exception as reason:
+                logger.warning("No simulator of %s (%s): %s", name, class_path, reason)
+    return devices
@@ -33,6 +33,7 @@ class XMAP(Device):
     status_rate = Component(EpicsSignal, ":StatusAll.SCAN")
     read_rate = Component(EpicsSignal, ":ReadAll.SCAN")
     pixels_per_run = Component(EpicsSignal, ":PixelsPerRun")
+    current_pixel = Component(EpicsSignalRO, ":dxp1:CurrentPixel")
 
     def stepscan_before(self):
         """Initialize XMAP before step scan."""
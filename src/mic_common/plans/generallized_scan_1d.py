@@ -64,4 +64,6 @@ def generalized_scan_1d(
         """Start executing scan"""
         if exec_plan:
             savedata.update_next_file_name()
-            yield from execute_scan_1d(scanrecord, scan_name=savedata.next_file_name)
+            yield from execute_scan_1d(
+                scanrecord, scan_name=savedata.next_file_name, eta=eta
+            )
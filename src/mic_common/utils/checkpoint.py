@@ -0,0 +1,175 @@
+"""
+Checkpoints of scan progress, to resume a 2D scan after a restart.
+
+If the queueserver worker dies in a multi-hour map, the checkpoint tells
+where the scan was: the plan parameters, the lines completed, the file
+name of the detectors and their file numbers.  A 2D plan in resume mode
+reads it and scans only the lines left, writing on to the same detector
+files.
+
+Checkpoints are kept in a small JSON file, one per plan name, rewritten
+atomically at every line.  A scan that completes removes its checkpoint.
+
+List of objects::
+
+    # CheckpointStore: # JSON store of checkpoints, by plan name
+    # ScanCheckpoint: # ScanMonitor hook that saves a checkpoint at every line
+    # checkpoint_store: # the shared CheckpointStore at CHECKPOINT_FILE
+"""
+
+__all__ = """
+    CheckpointStore
+    ScanCheckpoint
+    checkpoint_store
+""".split()
+
+import datetime
+import json
+import logging
+import os
+import pathlib
+import threading
+
+from mic_common.utils.scan_monitor import ScanMonitorHooks
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = pathlib.Path.home() / ".bluesky_mic" / "scan_checkpoints.json"
+
+
+class CheckpointStore:
+    """Checkpoints by plan name, in a JSON file.
+
+    Parameters:
+        path (str): The JSON file, created when first saved.
+    """
+
+    def __init__(self, path=CHECKPOINT_FILE):
+        """Initialize CheckpointStore."""
+        self.path = pathlib.Path(path)
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            return json.loads(self.path.read_text())
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.error("Unreadable checkpoint file %s, ignored", self.path)
+            return {}
+
+    def _write(self, checkpoints):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(checkpoints, indent=2, default=str))
+        os.replace(tmp, self.path)  # never leaves a half-written file
+
+    def load(self, key):
+        """The checkpoint of plan ``key``, or None."""
+        with self._lock:
+            return self._read().get(key)
+
+    def save(self, key, checkpoint):
+        """Replace the checkpoint of plan ``key``."""
+        with self._lock:
+            checkpoints = self._read()
+            checkpoints[key] = checkpoint
+            self._write(checkpoints)
+
+    def clear(self, key):
+        """Remove the checkpoint of plan ``key``."""
+        with self._lock:
+            checkpoints = self._read()
+            if checkpoints.pop(key, None) is not None:
+                self._write(checkpoints)
+
+
+class ScanCheckpoint(ScanMonitorHooks):
+    """Save a checkpoint of the scan at its start and every line.
+
+    The file numbers are cached from the monitors of the file plugins:
+    the hooks run on the CA callback thread, where a CA get could block.
+
+    Parameters:
+        key (str): Plan name, the key of the checkpoint.
+        params (dict): Plan parameters, to call the plan again.
+        file_name (str): Base name of the detector files.
+        file_numbers (dict, optional): ``{name: file_number signal}`` of
+            the detector file plugins.
+        resume_from (dict, optional): The checkpoint this scan resumes,
+            its lines are counted as done.
+        store (CheckpointStore, optional): By default ``checkpoint_store``.
+
+    Attributes:
+        checkpoint (dict): The last checkpoint saved.
+    """
+
+    def __init__(self, key, params, file_name, file_numbers=None,
+                 resume_from=None, store=None):
+        """Initialize ScanCheckpoint."""
+        resume_from = resume_from or {}
+        self.key = key
+        self.store = checkpoint_store if store is None else store
+        self.file_numbers = dict(file_numbers or {})
+        self.start_line = resume_from.get("last_line", 0)
+        self.checkpoint = {
+            "plan": key,
+            "params": dict(params),
+            "file_name": file_name,
+            # the MDA files of the scan, one more at every resume
+            "scan_names": list(resume_from.get("scan_names", [])),
+            "last_line": self.start_line,
+            "num_lines": None,
+            "file_numbers": {},
+            "updated": None,
+        }
+        self._subscriptions = []
+
+    def _cache(self, name):
+        def callback(value, **kwargs):
+            self.checkpoint["file_numbers"][name] = int(value)
+
+        return callback
+
+    def save(self):
+        """Write the checkpoint to the store."""
+        self.checkpoint["updated"] = datetime.datetime.now().isoformat()
+        try:
+            self.store.save(self.key, self.checkpoint)
+        except OSError as reason:
+            logger.error("Cannot save the checkpoint of %s: %s", self.key, reason)
+
+    def on_start(self, monitor):
+        """Save the first checkpoint."""
+        for name, signal in self.file_numbers.items():
+            cid = signal.subscribe(self._cache(name), run=True)
+            self._subscriptions.append((signal, cid))
+        self.checkpoint["scan_names"].append(monitor.scan_name)
+        self.checkpoint["num_lines"] = self.start_line + monitor.numpts_y
+        self.save()
+
+    def on_line(self, monitor, level, value):
+        """Save the lines completed."""
+        self.checkpoint["last_line"] = self.start_line + monitor.current_line
+        self.save()
+
+    def on_finish(self, monitor):
+        """Remove the checkpoint of a complete scan, keep it otherwise.
+
+        The scan is complete when its last line was reached: the status
+        also finishes when the record is aborted, e.g. by a watchdog.
+        """
+        while self._subscriptions:
+            signal, cid = self._subscriptions.pop()
+            signal.unsubscribe(cid)
+        if monitor.numpts_y and monitor.current_line >= monitor.numpts_y:
+            self.store.clear(self.key)
+        else:
+            self.save()
+            logger.warning(
+                "Scan %s stopped after line %d of %s, resume with resume=True",
+                self.key, self.checkpoint["last_line"], self.checkpoint["num_lines"],
+            )
+
+
+checkpoint_store = CheckpointStore()
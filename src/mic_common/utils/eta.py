@@ -0,0 +1,127 @@
+"""
+Robust estimate of the time left in a scan.
+
+The time per unit of work (a point, or a line) is the median of the last
+``window`` units, so one slow line moves the estimate little.  Before
+enough units are done, the median is blended with a seed, the planned
+time ``numpts * dwell * (1 + scan_overhead)`` of ``generalized_scan_1d``.
+The spread of the recent units gives a confidence band.
+
+List of objects::
+
+    # EtaEstimator: # median unit time, remaining time and its band
+"""
+
+__all__ = """
+    EtaEstimator
+""".split()
+
+import logging
+import time
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+WINDOW = 25  # units in the median
+SEED_WEIGHT = 3  # the seed counts as this many measured units
+SEED_SPREAD = 0.2  # relative band when only the seed is known
+MAD_TO_SIGMA = 1.4826  # median absolute deviation to standard deviation
+
+
+class EtaEstimator:
+    """Time per unit and time remaining, from the times units complete.
+
+    Attributes:
+        total (int): Number of units in the scan.
+        seed (float): Planned seconds per unit, or None.
+        done (float): Units completed at the last update.
+        count (int): Number of unit times measured.
+    """
+
+    def __init__(self, total, seed=None, window=WINDOW):
+        """Initialize EtaEstimator.
+
+        Parameters:
+            total (int): Number of units in the scan.
+            seed (float, optional): Planned seconds per unit.
+            window (int): Number of recent units in the median.
+        """
+        self.total = total
+        self.seed = seed if seed else None
+        self.done = 0
+        self.count = 0
+        self._times = deque(maxlen=window)
+        self._stats_cache = None
+        self._last = None
+
+    def start(self, now=None):
+        """Start timing the next unit, e.g. at the start of a line."""
+        self._last = time.perf_counter() if now is None else now
+
+    def update(self, done, now=None):
+        """Record that ``done`` units are complete.
+
+        Counts that go back (a new line restarting the point counter) only
+        restart the timing.  When several units complete in one update,
+        the sample is their average time.
+        """
+        now = time.perf_counter() if now is None else now
+        if self._last is not None and done > self.done:
+            self._times.append((now - self._last) / (done - self.done))
+            self.count += 1
+            self._stats_cache = None
+        self.done = done
+        self._last = now
+
+    @property
+    def samples(self):
+        """Number of measured unit times in the window."""
+        return len(self._times)
+
+    def _stats(self):
+        """Median and standard deviation of the measured unit times."""
+        if self._stats_cache is None:
+            times = np.fromiter(self._times, dtype=float)
+            median = float(np.median(times))
+            sigma = MAD_TO_SIGMA * float(np.median(np.abs(times - median)))
+            self._stats_cache = median, sigma
+        return self._stats_cache
+
+    @property
+    def unit_time(self):
+        """Estimated seconds per unit, or None with no seed and no sample."""
+        if self.count == 0:
+            return self.seed
+        median, _sigma = self._stats()
+        if self.seed is None:
+            return median
+        # the seed fades out as units are measured
+        n = self.count
+        return (n * median + SEED_WEIGHT * self.seed) / (n + SEED_WEIGHT)
+
+    def remaining(self, done=None):
+        """Estimated seconds until all units are done, with its band.
+
+        Parameters:
+            done (float, optional): Units complete, by default the last
+                update.  May be fractional, e.g. part of a line.
+
+        Returns:
+            tuple: ``(remaining, low, high)`` in seconds, zeros if unknown.
+        """
+        done = self.done if done is None else done
+        left = max(self.total - done, 0)
+        unit = self.unit_time
+        if unit is None:
+            return 0.0, 0.0, 0.0
+        remaining = left * unit
+        n = self.samples
+        if n < 2:
+            half = remaining * SEED_SPREAD
+        else:
+            _median, sigma = self._stats()
+            # error of the estimated unit time, plus the scatter of the units left
+            half = np.sqrt((left * sigma) ** 2 / n + left * sigma**2)
+        return remaining, max(remaining - half, 0.0), remaining + half
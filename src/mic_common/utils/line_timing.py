@@ -0,0 +1,164 @@
+"""
+Time every line of a scan, to compare the overhead with SCAN_OVERHEAD.
+
+A LineTimer is a ScanMonitor hook.  For each line it keeps four times:
+the start of the line, the first and the last point counted, and the end
+of the line (the start of the next one).  Between them are the wait for
+the detectors to be ready, the points, and the retrace::
+
+    start    first_point           last_point    end
+      |--ready--|--------points--------|--retrace--|
+
+With the dwell time, the overhead over ``numpts * dwell`` splits into
+these three parts.  ``write_scan_timing()`` of
+``mic_common.utils.watch_pvs_write_hdf5`` saves it in the master file.
+
+List of objects::
+
+    # LineTimer: # per-line times and overhead summary, a ScanMonitor hook
+    # LINE_TIMING_DTYPE: # one record per line
+"""
+
+__all__ = """
+    LineTimer
+    LINE_TIMING_DTYPE
+""".split()
+
+import logging
+import time
+
+import numpy as np
+
+from mic_common.utils.scan_monitor import ScanMonitorHooks
+
+logger = logging.getLogger(__name__)
+
+LINE_TIMING_DTYPE = np.dtype(
+    [
+        ("start", "f8"),
+        ("first_point", "f8"),
+        ("last_point", "f8"),
+        ("end", "f8"),
+        ("points", "i4"),
+    ]
+)
+
+
+class LineTimer(ScanMonitorHooks):
+    """Record the times of every line of a scan.
+
+    Times are seconds from the start of the scan, ``start_time`` is the
+    ``time.time()`` of that start.  A 1D scan is one line.
+
+    Parameters:
+        dwell (float, optional): Seconds per point, for the overhead.
+        scan_overhead (float, optional): Planned overhead, as in
+            ``iconfig.yml``, to compare with.
+    """
+
+    def __init__(self, dwell=None, scan_overhead=None):
+        """Initialize LineTimer."""
+        self.dwell = dwell
+        self.scan_overhead = scan_overhead
+        self.numpts = None
+        self.start_time = None
+        self._t0 = None
+        self._rows = []
+        self._line = None
+
+    def _now(self):
+        return time.perf_counter() - self._t0
+
+    def _new_line(self, now):
+        self._line = [now, np.nan, np.nan, np.nan, 0]
+
+    def _end_line(self, now):
+        if self._line is not None:
+            self._line[3] = now
+            self._rows.append(tuple(self._line))
+            self._line = None
+
+    def on_start(self, monitor):
+        """Start the clock and the first line."""
+        self.numpts = monitor.numpts_x
+        self.start_time = time.time()
+        self._t0 = time.perf_counter()
+        self._rows = []
+        self._new_line(0.0)
+
+    def on_point(self, monitor, value):
+        """Time the first and the last point of the line."""
+        line = self._line
+        if line is None:
+            return
+        now = self._now()
+        if line[4] == 0:
+            line[1] = now
+        line[2] = now
+        line[4] = value
+
+    def on_line(self, monitor, level, value):
+        """End the line, start the next."""
+        if self._t0 is None:
+            return
+        now = self._now()
+        self._end_line(now)
+        self._new_line(now)
+
+    def on_finish(self, monitor):
+        """End the last line."""
+        if self._t0 is not None:
+            self._end_line(self._now())
+
+    @property
+    def lines(self):
+        """Structured array of LINE_TIMING_DTYPE, one record per line."""
+        return np.array(self._rows, dtype=LINE_TIMING_DTYPE)
+
+    def summary(self):
+        """Median times of the lines, and the overhead, actual and planned.
+
+        Returns:
+            dict: Seconds for the times, fractions of ``numpts * dwell``
+            for the overheads.  Overheads are left out without ``dwell``.
+        """
+        lines = self.lines
+        lines = lines[lines["points"] > 0]
+        if lines.size == 0:
+            return {"lines": 0}
+        line_time = lines["end"] - lines["start"]
+        ready = lines["first_point"] - lines["start"]
+        points = lines["last_point"] - lines["first_point"]
+        retrace = lines["end"] - lines["last_point"]
+        summary = {
+            "lines": int(lines.size),
+            "total_time": float(lines["end"][-1] - lines["start"][0]),
+            "median_line_time": float(np.median(line_time)),
+            "median_ready_wait": float(np.median(ready)),
+            "median_points_time": float(np.median(points)),
+            "median_retrace": float(np.median(retrace)),
+        }
+        if self.dwell:
+            npts = lines["points"]
+            nominal = npts * self.dwell
+            # the first point is counted after its dwell, in the ready wait
+            parts = {
+                "overhead_ready": (ready - self.dwell) / nominal,
+                "overhead_points": (points - (npts - 1) * self.dwell) / nominal,
+                "overhead_retrace": retrace / nominal,
+                "overhead_actual": line_time / nominal - 1,
+            }
+            summary.update({k: float(np.median(v)) for k, v in parts.items()})
+            numpts = self.numpts or int(np.median(npts))
+            summary["predicted_line_time"] = float(
+                numpts * self.dwell * (1 + (self.scan_overhead or 0))
+            )
+        if self.scan_overhead is not None:
+            summary["overhead_predicted"] = float(self.scan_overhead)
+        return summary
+
+    def histogram(self, bins="auto"):
+        """Counts and bin edges of the line times."""
+        lines = self.lines
+        lines = lines[lines["points"] > 0]
+        return np.histogram(lines["end"] - lines["start"], bins=bins)
@@ -8,14 +8,30 @@ __all__ = [
     "pause_scan",
     "resume_scan",
     "abort_scan",
+    "ScanControl",
+    "scan_control",
     "run_subprocess",
     "scan_number_in_list",
     "create_master_file",
 ]
+import logging
 import os
 import subprocess
+import threading
+import time
 
 import h5py
+from ophyd.status import Status
+from ophyd.utils.errors import StatusTimeoutError
+
+logger = logging.getLogger(__name__)
+
+PAUSE_TIMEOUT = 1.0  # seconds for the record to confirm a pause or resume
+ABORT_TIMEOUT = 1.0  # seconds for the record to be idle after an abort
+ABORT_RETRY = 0.1  # seconds between writes of .EXSC = 0
+# .FAZE of a record that does not advance: idle, or held by .WAIT after a point
+HOLD_PHASES = (0, 15, "IDLE", "RECORD SCALAR DATA")
+IDLE_PHASES = (0, "IDLE")
 
 
 def mkdir(directory):
@@ -92,39 +108,177 @@ def run_subprocess(command_list):
     return result
 
 
-def pause_scan():
-    """Pause the current scan."""
-    from ..devices.scan_record import scan2
+class ScanControl:
+    """Pause, resume and abort a scan record, confirming each change.
+
+    Each action returns an ophyd Status that a callback of the record
+    finishes once the record reports the new state; ``timings`` keeps the
+    seconds each action took.  After its timeout the Status fails with
+    ``ophyd.utils.errors.StatusTimeoutError``.
+
+    * pause: one client hold (``.WAIT`` = 1), confirmed once ``.WCNT`` >= 1
+      and the record has stopped at its hold point after the current
+      point, ``.FAZE`` = RECORD SCALAR DATA (or IDLE, between scans).
+      The point of an outer record is a whole inner scan: hold the
+      innermost record to stop within a point.
+    * resume: releases the holds, confirmed by ``.WCNT`` = 0.
+    * abort: ``.EXSC`` = 0, repeated every ``retry`` seconds, confirmed by
+      ``.FAZE`` = IDLE.
+
+    Parameters:
+        scan (ScanRecord or str): The scan record, or its oregistry name.
+    """
+
+    def __init__(self, scan):
+        """Initialize ScanControl."""
+        if isinstance(scan, str):
+            from apsbits.core.instrument_init import oregistry
+
+            scan = oregistry[scan]
+        self.scan = scan
+        self.timings = {}
+
+    def _confirm(self, signals, done, action, timeout):
+        """Status finished when ``done(*values)`` of ``signals`` is true."""
+        t0 = time.perf_counter()
+        status = Status(timeout=timeout)
+        confirmed = threading.Event()  # status.done is set from another thread
+
+        def check(**kwargs):
+            if confirmed.is_set():
+                return
+            if done(*(signal.get() for signal in signals)):
+                confirmed.set()
+                self.timings[action] = time.perf_counter() - t0
+                logger.info(
+                    "%s %s in %.3f s", self.scan.name, action, self.timings[action]
+                )
+                status.set_finished()
+
+        subscriptions = [(signal, signal.subscribe(check, run=False))
+                         for signal in signals]
+
+        def unsubscribe(st):
+            for signal, cid in subscriptions:
+                signal.unsubscribe(cid)
+
+        status.add_callback(unsubscribe)
+        check()
+        return status
+
+    def pause(self, timeout=PAUSE_TIMEOUT):
+        """Hold the scan after its current point, confirmed once it stopped."""
+        status = self._confirm(
+            (self.scan.wcnt, self.scan.scan_phase),
+            lambda wcnt, phase: wcnt >= 1 and phase in HOLD_PHASES,
+            "paused",
+            timeout,
+        )
+        if self.scan.wcnt.get() == 0:
+            self.scan.wait.put(1)
+        return status
+
+    def resume(self, timeout=PAUSE_TIMEOUT):
+        """Release the holds on the scan, ours and any other client's."""
+        status = self._confirm(
+            (self.scan.wcnt,), lambda wcnt: wcnt == 0, "resumed", timeout
+        )
+        # each 0 written to .WAIT releases one hold
+        for _i in range(int(self.scan.wcnt.get())):
+            self.scan.wait.put(0)
+        return status
+
+    def abort(self, timeout=ABORT_TIMEOUT, retry=ABORT_RETRY):
+        """Stop the scan, writing ``.EXSC`` = 0 until the record is idle."""
+        status = self._confirm(
+            (self.scan.scan_phase,), lambda phase: phase in IDLE_PHASES,
+            "aborted", timeout,
+        )
+        done = threading.Event()
+        status.add_callback(lambda st: done.set())
+
+        def repeat():
+            while not done.is_set():
+                self.scan.execute_scan.put(0)
+                done.wait(retry)
+
+        threading.Thread(target=repeat, name="ScanControl.abort", daemon=True).start()
+        return status
+
 
-    wcnt = scan2.wcnt.get()
-    if wcnt == 0:
-        scan2.wcnt.put(1)
-    elif wcnt > 1:
-        for _i in range(wcnt - 1):
-            scan2.wcnt.put(0)
-    print("pausing scan")
+_scan_controls = {}
 
 
-def resume_scan():
-    """Resume the paused scan."""
-    from ..devices.scan_record import scan2
+def scan_control(scan="scan2"):
+    """The ScanControl of ``scan``, a ScanRecord or its oregistry name."""
+    key = scan if isinstance(scan, str) else scan.name
+    if key not in _scan_controls:
+        _scan_controls[key] = ScanControl(scan)
+    return _scan_controls[key]
 
-    wcnt = scan2.wcnt.get()
-    if wcnt >= 1:
-        for _i in range(wcnt):
-            scan2.wcnt.put(0)
-    print("resuming scan...")
 
+def pause_scan(scan="scan1", timeout=PAUSE_TIMEOUT):
+    """Pause the current scan, wait for the record to confirm.
 
-def abort_scan():
-    """Abort the current scan."""
-    pause_scan()
-    from ..devices.scan_record import scan2
+    The hold takes effect at the end of the current point of ``scan``, by
+    default the inner record of a 2D scan.  When the record has the hold
+    but is still in its point after ``timeout``, the pause is pending: it
+    is reported, not raised.
 
-    scan2.AbortScan2.put(1)
-    scan2.AbortScan2.put(1)
-    scan2.AbortScan2.put(1)
-    print("aborting scan...")
+    Parameters:
+        scan (ScanRecord or str): The scan record, or its oregistry name.
+        timeout (float): Seconds before ``StatusTimeoutError``, raised if
+            the record did not take the hold.
+
+    Returns:
+        float: Seconds taken to pause, None if the pause is pending.
+    """
+    control = scan_control(scan)
+    try:
+        control.pause(timeout).wait()
+    except StatusTimeoutError:
+        if not control.scan.wcnt.get():
+            raise
+        print(
+            f"scan pause pending: {control.scan.name} is held, it stops"
+            " at the end of its current point"
+        )
+        return None
+    print(f"scan paused in {control.timings['paused']:.3f} s")
+    return control.timings["paused"]
+
+
+def resume_scan(scan="scan1", timeout=PAUSE_TIMEOUT):
+    """Resume the paused scan, wait for the record to confirm.
+
+    Parameters:
+        scan (ScanRecord or str): The scan record, or its oregistry name.
+        timeout (float): Seconds before ``StatusTimeoutError``.
+
+    Returns:
+        float: Seconds taken to resume.
+    """
+    control = scan_control(scan)
+    control.resume(timeout).wait()
+    print(f"scan resumed in {control.timings['resumed']:.3f} s")
+    return control.timings["resumed"]
+
+
+def abort_scan(scan="scan2", timeout=ABORT_TIMEOUT):
+    """Abort the current scan, wait for the record to be idle.
+
+    Parameters:
+        scan (ScanRecord or str): The scan record (the outermost of a
+            multi-dimensional scan), or its oregistry name.
+        timeout (float): Seconds before ``StatusTimeoutError``.
+
+    Returns:
+        float: Seconds taken to abort.
+    """
+    control = scan_control(scan)
+    control.abort(timeout).wait()
+    print(f"scan aborted in {control.timings['aborted']:.3f} s")
+    return control.timings["aborted"]
 
 
 def scan_number_in_list(lst, partial_str):
@@ -0,0 +1,382 @@
+"""
+Measure the plan-side overhead of the scan plans against simulators.
+
+The plans run against the simulators of ``mic_common.devices.sim``, built
+from the instrument's ``devices.yml`` and registered under the same names,
+so the time measured is the plan's own: setup, ``mode_setter`` round trips,
+master file writing and monitoring, at the CA latency of ``LATENCY``.
+
+The scan records time their executions.  With them, a run splits into::
+
+    plan start      first execution               last execution    plan end
+        |---setup---|--line--|--line--| ... |--line--|---teardown---|
+
+and the per-line overhead is the median time of a line over the points
+times ``point_time`` plus ``retrace_time``: the work of the plan during a
+line, e.g. its ScanMonitor hooks.
+
+Run the suite from a shell, in a session without the instrument started::
+
+    python -m mic_common.utils.plan_benchmark fly2d --latency 0.002
+
+A benchmark whose instrument package, configuration or plan cannot be
+loaded is skipped, and reported as such with the reason.
+
+List of objects::
+
+    # BenchmarkResult: # setup, per-line overhead and teardown of a run
+    # PlanBenchmark: # a plan, its instrument and simulators
+    # PLAN_BENCHMARKS: # the suite: fly2d, step2d, step2d_random_pos
+    # benchmark_plan( ... ): # time one run of a plan
+    # run_benchmark( ... ): # run one benchmark of the suite
+    # run_benchmark_suite( ... ): # run the suite
+    # format_results( ... ): # table of results
+"""
+
+__all__ = """
+    BenchmarkResult
+    PlanBenchmark
+    PLAN_BENCHMARKS
+    benchmark_plan
+    run_benchmark
+    run_benchmark_suite
+    format_results
+""".split()
+
+import argparse
+import importlib
+import importlib.resources
+import logging
+import tempfile
+import time
+from typing import Callable
+from typing import NamedTuple
+
+import numpy as np
+
+from mic_common.devices.ad_fileplugin import DetBase
+from mic_common.devices.sim import SIM_ERRORS
+from mic_common.devices.sim import set_latency
+from mic_common.devices.sim import sim_devices_from_yaml
+
+logger = logging.getLogger(__name__)
+
+
+class BenchmarkResult(NamedTuple):
+    """Times of one run of a plan, in seconds.
+
+    Attributes:
+        plan (str): Name of the benchmark.
+        setup (float): From the plan start to the first scan execution.
+        line_overhead (float): Median line time over the simulated one.
+        teardown (float): From the last scan execution to the plan end.
+        total (float): Time of the run.
+        lines (int): Lines scanned.
+        error (str): Why the run failed, empty if it did not.
+        skipped (bool): The benchmark could not be loaded, it did not run.
+    """
+
+    plan: str
+    setup: float = np.nan
+    line_overhead: float = np.nan
+    teardown: float = np.nan
+    total: float = np.nan
+    lines: int = 0
+    error: str = ""
+    skipped: bool = False
+
+
+class PlanBenchmark(NamedTuple):
+    """A plan of the suite and the simulators it runs against.
+
+    Attributes:
+        package (str): Instrument package, its ``configs`` has the
+            ``devices.yml`` and ``iconfig.yml``.
+        module (str): Module of the plan, imported after the simulators
+            are registered.
+        plan (str): Name of the plan in ``module``.
+        records (tuple): oregistry names of the scan records, outermost
+            first.
+        kwargs (dict): Arguments of the plan.
+        wire (callable): ``wire(devices, kwargs)`` connects the simulators
+            as the IOCs would: nested scan records, point times, detector
+            counters.
+    """
+
+    package: str
+    module: str
+    plan: str
+    records: tuple
+    kwargs: dict
+    wire: Callable = None
+
+
+def _wire_savedata(devices):
+    """The saveData and file plugin paths of an IOC, in a temporary folder."""
+    root = tempfile.mkdtemp(prefix="plan_benchmark_")
+    savedata = devices["savedata"]
+    savedata.file_system.sim_put(root)
+    savedata.subdirectory.sim_put("mda")
+    savedata.base_name.sim_put("bench_")
+    savedata.next_scan_number.sim_put(1)
+    for device in devices.values():
+        if isinstance(device, DetBase):
+            device.micdata_mountpath = root
+            device.file_path.sim_put(root + "/")
+
+
+def _wire_fly2d(devices, kwargs):
+    _wire_savedata(devices)
+    fscan1, fscanh = devices["fscan1"], devices["fscanh"]
+    fscan1.nested = fscanh
+    fscanh.point_time = kwargs["dwell"] / 1000  # dwell is in ms
+    fscanh.on_point += [
+        devices["sis3820"].current_channel.sim_put,
+        devices["xrf"].current_pixel.sim_put,
+    ]
+    fscanh.on_end.append(devices["xrf_netcdf"].sim_frame)
+
+
+def _wire_step2d(devices, kwargs):
+    devices["scan2"].nested = devices["scan1"]
+    _wire_step1d(devices, kwargs)
+
+
+def _wire_step1d(devices, kwargs):
+    _wire_savedata(devices)
+    scan1 = devices["scan1"]
+    scan1.point_time = kwargs["dwell"]
+    for name in ("xrf_me7_hdf", "ptycho_hdf"):
+        if name in devices:
+            scan1.on_point.append(devices[name].sim_frame)
+
+
+PLAN_BENCHMARKS = {
+    "fly2d": PlanBenchmark(
+        package="s2idd_uprobe",
+        module="s2idd_uprobe.plans.fly2d",
+        plan="fly2d",
+        records=("fscan1", "fscanh"),
+        kwargs=dict(
+            width=10, x_center=0, stepsize_x=0.1,
+            height=2, y_center=0, stepsize_y=0.1,
+            dwell=5, stall_watchdog=False,
+        ),
+        wire=_wire_fly2d,
+    ),
+    "step2d": PlanBenchmark(
+        package="isn",
+        module="isn.plans.step2d",
+        plan="step2d",
+        records=("scan2", "scan1"),
+        kwargs=dict(
+            width=1, x_center=0, stepsize_x=0.05,
+            height=0.5, y_center=0, stepsize_y=0.05,
+            dwell=0.005,
+        ),
+        wire=_wire_step2d,
+    ),
+    "step2d_random_pos": PlanBenchmark(
+        package="isn",
+        module="isn.plans.step2d_random_pos",
+        plan="step2d_random_pos",
+        records=("scan1",),
+        kwargs=dict(width=1, height=1, x_center=0, y_center=0, dwell=0.005),
+        wire=_wire_step1d,
+    ),
+}
+
+
+def benchmark_plan(RE, plan, records, name=""):
+    """Run ``plan`` once and split its time with the scan record executions.
+
+    Parameters:
+        RE (RunEngine): Runs the plan.
+        plan (generator): The plan, against simulators.
+        records (list): Simulated scan records of the plan, outermost
+            first.
+        name (str): Name of the result.
+
+    Returns:
+        BenchmarkResult: With an ``error`` if a simulator failed during the
+        run, see ``SIM_ERRORS``.
+    """
+    outer, inner = records[0], records[-1]
+    SIM_ERRORS.clear()
+    start = time.perf_counter()
+    RE(plan)
+    end = time.perf_counter()
+    error = ""
+    if SIM_ERRORS:
+        error = f"{len(SIM_ERRORS)} simulator errors, first {SIM_ERRORS[0]}"
+    runs = [run for run in outer.executions if run[0] >= start]
+    if not runs:
+        return BenchmarkResult(
+            name, total=end - start, error=error or "no scan executed"
+        )
+    lines = [run for run in inner.executions if run[0] >= start]
+    # a line lasts until the next starts, the last until the scan ends
+    line_ends = [run[0] for run in lines[1:]] + [runs[-1][1]]
+    overheads = [
+        line_end - line_start - (points * inner.point_time + inner.retrace_time)
+        for (line_start, _, points), line_end in zip(lines, line_ends, strict=True)
+    ]
+    return BenchmarkResult(
+        name,
+        setup=runs[0][0] - start,
+        line_overhead=float(np.median(overheads)),
+        teardown=end - runs[-1][1],
+        total=end - start,
+        lines=len(lines),
+        error=error,
+    )
+
+
+def _load_config(package):
+    """Load the ``iconfig.yml`` of ``package``, read by its plans."""
+    from apsbits.utils.config_loaders import load_config
+
+    load_config(importlib.resources.files(f"{package}.configs") / "iconfig.yml")
+
+
+def _setup_logging():
+    """The ``BSDEV`` logging level of apsbits, used by the instrument packages.
+
+    ``configure_logging()`` of apsbits registers it at the start of a
+    session, the harness runs without one.
+    """
+    if not hasattr(logging, "BSDEV"):
+        from apsbits.utils.logging_setup import addLoggingLevel
+
+        addLoggingLevel("BSDEV", logging.INFO - 5)
+
+
+def _default_registry():
+    """The apsbits ``oregistry``, cleared, created when the session has none."""
+    from apsbits.core import instrument_init
+
+    if instrument_init.oregistry is None:  # no instrument started
+        from ophydregistry import Registry
+
+        instrument_init.oregistry = Registry(auto_register=False)
+    try:
+        from apsbits.utils import controls_setup
+    except ImportError:
+        pass
+    else:
+        if getattr(controls_setup, "oregistry", None) is None:
+            controls_setup.oregistry = instrument_init.oregistry
+    instrument_init.oregistry.clear()
+    return instrument_init.oregistry
+
+
+def run_benchmark(RE, name, registry=None, repeat=1, **kwargs):
+    """Run benchmark ``name`` of PLAN_BENCHMARKS against simulators.
+
+    The simulators of the instrument's devices are registered in
+    ``registry`` before the plan module is imported.  A failure is
+    reported in the result, not raised; a benchmark that cannot be loaded
+    is skipped.
+
+    Parameters:
+        RE (RunEngine): Runs the plan.
+        name (str): Key of PLAN_BENCHMARKS.
+        registry (ophydregistry.Registry, optional): By default the
+            apsbits ``oregistry``, cleared first, or a new one installed
+            as the ``oregistry`` outside of an instrument session.
+        repeat (int): Runs of the plan.
+        **kwargs: Arguments of the plan, over the benchmark's.
+
+    Returns:
+        list: A BenchmarkResult per run.
+    """
+    bench = PLAN_BENCHMARKS[name]
+    plan_kwargs = {**bench.kwargs, **kwargs}
+    try:
+        _setup_logging()
+        if registry is None:
+            registry = _default_registry()
+        _load_config(bench.package)
+        devices = sim_devices_from_yaml(
+            importlib.resources.files(f"{bench.package}.configs") / "devices.yml"
+        )
+        for device in devices.values():
+            registry.register(device)
+        if bench.wire is not None:
+            bench.wire(devices, plan_kwargs)
+        plan = getattr(importlib.import_module(bench.module), bench.plan)
+        records = [devices[record] for record in bench.records]
+    except Exception as reason:
+        logger.debug("Cannot load benchmark %s", name, exc_info=True)
+        message = " ".join(str(reason).split()) or type(reason).__name__
+        logger.warning("Benchmark %s skipped, cannot load: %s", name, message)
+        error = f"skipped, cannot load: {message}"
+        return [BenchmarkResult(name, error=error, skipped=True)]
+
+    results = []
+    for _ in range(repeat):
+        try:
+            results.append(benchmark_plan(RE, plan(**plan_kwargs), records, name))
+        except Exception as reason:
+            logger.exception("Benchmark %s failed", name)
+            results.append(BenchmarkResult(name, error=str(reason)))
+    return results
+
+
+def run_benchmark_suite(RE=None, names=None, latency=None, repeat=1):
+    """Run the benchmarks of PLAN_BENCHMARKS.
+
+    Parameters:
+        RE (RunEngine, optional): By default a new RunEngine.
+        names (list, optional): Keys of PLAN_BENCHMARKS, by default all.
+        latency (float, optional): Seconds of each CA put and get.
+        repeat (int): Runs of each plan.
+
+    Returns:
+        list: The BenchmarkResults.
+    """
+    if RE is None:
+        from bluesky import RunEngine
+
+        RE = RunEngine({})
+    if latency is not None:
+        set_latency(put=latency, get=latency)
+    results = []
+    for name in names or PLAN_BENCHMARKS:
+        results += run_benchmark(RE, name, repeat=repeat)
+    return results
+
+
+def format_results(results):
+    """Table of BenchmarkResults, times in ms."""
+    lines = [
+        f"{'plan':<20} {'setup':>10} {'per line':>10} {'teardown':>10}"
+        f" {'total':>10} {'lines':>6}"
+    ]
+    for r in results:
+        if r.error:
+            lines.append(f"{r.plan:<20} {r.error}")
+            continue
+        ms = [1000 * t for t in (r.setup, r.line_overhead, r.teardown, r.total)]
+        lines.append(
+            f"{r.plan:<20} {ms[0]:>10.1f} {ms[1]:>10.1f} {ms[2]:>10.1f}"
+            f" {ms[3]:>10.1f} {r.lines:>6}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    """Run the suite from the command line and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("names", nargs="*", help="benchmarks, by default all")
+    parser.add_argument("--latency", type=float, help="seconds per CA put and get")
+    parser.add_argument("--repeat", type=int, default=1, help="runs of each plan")
+    args = parser.parse_args()
+    results = run_benchmark_suite(
+        names=args.names, latency=args.latency, repeat=args.repeat
+    )
+    print(format_results(results))
+
+
+if __name__ == "__main__":
+    main()
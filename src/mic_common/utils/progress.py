@@ -0,0 +1,200 @@
+"""
+Rate-limited stream of scan progress records.
+
+The scan monitors publish a ScanProgress record on every counter update.
+The stream hands each subscriber at most one record per interval, the
+latest one, so a fast fly scan no longer floods the CA callback thread
+with log records.  Logging is one subscriber, a ZMQ topic can be another.
+
+List of objects::
+
+    # ScanProgress: # typed progress record
+    # ProgressStream: # rate-limited publisher with subscription tokens
+    # ZmqProgressPublisher: # sends records as JSON on a ZMQ PUB socket
+    # log_progress( ... ): # subscriber that logs a record
+    # progress_stream: # the shared ProgressStream, logging every LOG_INTERVAL
+"""
+
+__all__ = """
+    ScanProgress
+    ProgressStream
+    ZmqProgressPublisher
+    log_progress
+    progress_stream
+""".split()
+
+import json
+import logging
+import threading
+import time
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+LOG_INTERVAL = 1.0  # seconds between progress log records
+ZMQ_ADDRESS = "tcp://*:5578"
+ZMQ_TOPIC = "scan_progress"
+
+
+class ScanProgress(NamedTuple):
+    """Progress of a scan at one counter update.
+
+    Attributes:
+        scan_name (str): Name of the scan.
+        line (int): Current line, 1 for a 1D scan.
+        num_lines (int): Number of lines.
+        point (int): Current point along the line.
+        num_points (int): Points per line.
+        percent (float): Progress of the whole scan.
+        remaining (float): Estimated seconds left.
+        remaining_low (float): Low end of the band of ``remaining``.
+        remaining_high (float): High end of the band of ``remaining``.
+        line_time (float): Seconds taken by the last line (or point in 1D).
+        timestamp (float): ``time.time()`` of the update.
+    """
+
+    scan_name: str
+    line: int
+    num_lines: int
+    point: int
+    num_points: int
+    percent: float
+    remaining: float
+    remaining_low: float
+    remaining_high: float
+    line_time: float
+    timestamp: float
+
+
+class _Subscriber:
+    """A callback, its interval and the last record it received."""
+
+    __slots__ = ("callback", "interval", "due", "last")
+
+    def __init__(self, callback, interval):
+        """Initialize _Subscriber."""
+        self.callback = callback
+        self.interval = interval
+        self.due = 0.0
+        self.last = None
+
+
+class ProgressStream:
+    """Publish progress records to subscribers, at most one per interval.
+
+    Records that arrive before a subscriber is due are not queued: the
+    subscriber gets the latest record when it is next due, or at
+    ``flush()``.  A record that arrives while nobody is due costs one
+    comparison.
+    """
+
+    def __init__(self):
+        """Initialize ProgressStream."""
+        self._subscribers = {}
+        self._next_token = 0
+        self._next_due = 0.0
+        self._latest = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback, interval=0.0):
+        """Call ``callback(record)`` at most once every ``interval`` seconds.
+
+        Returns:
+            int: Token for ``unsubscribe()``.
+        """
+        with self._lock:
+            token = self._next_token
+            self._next_token += 1
+            self._subscribers[token] = _Subscriber(callback, interval)
+            self._next_due = 0.0
+        return token
+
+    def unsubscribe(self, token):
+        """Stop calling the subscriber of ``token``."""
+        with self._lock:
+            self._subscribers.pop(token, None)
+
+    @property
+    def latest(self):
+        """The last record published, or None."""
+        return self._latest
+
+    def publish(self, record):
+        """Hand ``record`` to the subscribers that are due."""
+        self._latest = record
+        now = time.monotonic()
+        if now < self._next_due:
+            return
+        self._deliver(now)
+
+    def flush(self):
+        """Hand the latest record to every subscriber that has not seen it."""
+        self._deliver(None)
+
+    def _deliver(self, now):
+        """Deliver the latest record, to all if ``now`` is None."""
+        with self._lock:
+            record = self._latest
+            due = []
+            next_due = float("inf")
+            for sub in self._subscribers.values():
+                if record is not sub.last and (now is None or now >= sub.due):
+                    sub.last = record
+                    sub.due = (now or time.monotonic()) + sub.interval
+                    due.append(sub)
+                next_due = min(next_due, sub.due)
+            self._next_due = next_due
+        for sub in due:
+            try:
+                sub.callback(record)
+            except Exception:
+                logger.exception("Progress subscriber %r failed", sub.callback)
+
+
+def log_progress(record):
+    """Log a ScanProgress record, the way the scan monitor used to."""
+    msg = f"Filename: {record.scan_name}, Scan_progress: {record.percent}%, "
+    msg += (
+        f"Line: {record.line}/{record.num_lines}, "
+        f"Scan_remaining: {record.remaining}"
+        f" ({record.remaining_low}-{record.remaining_high}), "
+        f"Line_eta: {record.line_time}, "
+        f"Scanned: {record.point}/{record.num_points}"
+    )
+    logger.info(msg)
+
+
+class ZmqProgressPublisher:
+    """Send ScanProgress records as JSON on a ZMQ PUB socket.
+
+    ``pyzmq`` is imported only when a publisher is made.  Subscribe it to a
+    stream with ``progress_stream.subscribe(ZmqProgressPublisher(), 0.1)``.
+    Messages are ``[topic, json]``, a slow client never blocks the scan.
+    """
+
+    def __init__(self, address=ZMQ_ADDRESS, topic=ZMQ_TOPIC):
+        """Bind the PUB socket to ``address``."""
+        import zmq
+
+        self.topic = topic.encode()
+        self.socket = zmq.Context.instance().socket(zmq.PUB)
+        self.socket.setsockopt(zmq.SNDHWM, 10)
+        self.socket.bind(address)
+        self._noblock = zmq.NOBLOCK
+        self._again = zmq.Again
+
+    def __call__(self, record):
+        """Send ``record``, drop it if the clients are not keeping up."""
+        payload = json.dumps(record._asdict()).encode()
+        try:
+            self.socket.send_multipart([self.topic, payload], flags=self._noblock)
+        except self._again:
+            pass
+
+    def close(self):
+        """Close the socket."""
+        self.socket.close(linger=0)
+
+
+progress_stream = ProgressStream()
+progress_stream.subscribe(log_progress, interval=LOG_INTERVAL)
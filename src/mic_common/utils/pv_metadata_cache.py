@@ -0,0 +1,169 @@
+"""
+Persistent cache of the static metadata of EPICS PVs.
+
+Record type, description, engineering units and enum strings of a PV
+almost never change.  They are fetched once, in one batch, and kept in a
+small JSON file, so a new session and every master file snapshot read
+only the values of the PVs.
+
+Entries are keyed by the PV name of the record and by field: the
+metadata PV ``"IOC:m1.DESC"`` is field ``DESC`` of ``"IOC:m1"``.  An
+entry older than ``ttl`` is fetched again.  Call ``invalidate()`` after
+a change of the IOC databases.
+
+List of objects::
+
+    # PVMetadataCache: # metadata of PVs by name and field, in a JSON file
+    # metadata_cache: # the shared PVMetadataCache at METADATA_CACHE_FILE
+"""
+
+__all__ = """
+    PVMetadataCache
+    metadata_cache
+""".split()
+
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+METADATA_CACHE_FILE = pathlib.Path.home() / ".bluesky_mic" / "pv_metadata.json"
+METADATA_TTL = 24 * 3600  # seconds an entry is used before it is fetched again
+METADATA_TIMEOUT = 0.5  # seconds to connect and read a batch of metadata PVs
+
+
+def _split(pv):
+    """``(record PV, field)`` of the metadata PV ``pv``."""
+    base, _, field = pv.rpartition(".")
+    return (base, field) if base else (pv, "VAL")
+
+
+class PVMetadataCache:
+    """Static metadata of PVs, by PV name and field, in a JSON file.
+
+    Parameters:
+        path (str): The JSON file, created when first saved.
+        ttl (float): Seconds an entry is used before it is fetched again.
+
+    Attributes:
+        hits (int): Metadata served from the cache.
+        misses (int): Metadata fetched from the IOCs.
+    """
+
+    def __init__(self, path=METADATA_CACHE_FILE, ttl=METADATA_TTL):
+        """Initialize PVMetadataCache."""
+        self.path = pathlib.Path(path)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = None  # read from the file at first use
+        self._unanswered = set()  # metadata PVs that did not answer
+        self._lock = threading.RLock()
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                self._entries = json.loads(self.path.read_text())
+            except FileNotFoundError:
+                self._entries = {}
+            except ValueError:
+                logger.error("Unreadable PV metadata cache %s, ignored", self.path)
+                self._entries = {}
+        return self._entries
+
+    def _fresh(self, entry, field):
+        if field not in entry:
+            return False
+        return time.time() - entry["updated"].get(field, 0) < self.ttl
+
+    def get(self, pvname, field):
+        """Metadata ``field`` of ``pvname``, None if not cached or expired."""
+        with self._lock:
+            entry = self._load().get(pvname)
+            if entry is None or not self._fresh(entry, field):
+                return None
+            self.hits += 1
+            return entry[field]
+
+    def put(self, pvname, field, value):
+        """Cache ``value`` as metadata ``field`` of ``pvname``."""
+        if isinstance(value, tuple):
+            value = list(value)  # as read back from JSON
+        with self._lock:
+            entry = self._load().setdefault(pvname, {"updated": {}})
+            entry[field] = value
+            entry["updated"][field] = time.time()
+            self._unanswered.discard(f"{pvname}.{field}")
+
+    def invalidate(self, pvname=None):
+        """Forget the metadata of ``pvname``, of all PVs by default."""
+        with self._lock:
+            if pvname is None:
+                self._entries = {}
+                self._unanswered.clear()
+            else:
+                self._load().pop(pvname, None)
+                self._unanswered = {
+                    pv for pv in self._unanswered if _split(pv)[0] != pvname
+                }
+            self.save()
+
+    def save(self):
+        """Write the cache to its file."""
+        with self._lock:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = self.path.with_suffix(".tmp")
+                tmp.write_text(json.dumps(self._load(), indent=1))
+                os.replace(tmp, self.path)  # never leaves a half-written file
+            except OSError as reason:
+                logger.error("Cannot save the PV metadata cache: %s", reason)
+
+    def fetch(self, pvs, timeout=METADATA_TIMEOUT, retry=True):
+        """Values of the metadata PVs ``pvs``, from the cache or the IOCs.
+
+        The PVs not cached are read together: their channels are created
+        at once and read concurrently, so the wait is about one CA round
+        trip (at most ``timeout``), not ``timeout`` per PV.  A PV that
+        does not answer is None.
+
+        Parameters:
+            pvs (list): Names of the metadata PVs, e.g. ``"IOC:m1.DESC"``.
+            timeout (float): Seconds to connect and to read.
+            retry (bool): Ask again the PVs that did not answer before.
+
+        Returns:
+            dict: ``{pv: value}``.
+        """
+        import epics
+
+        with self._lock:
+            found = {pv: self.get(*_split(pv)) for pv in pvs if pv}
+            missing = sorted(
+                pv
+                for pv, value in found.items()
+                if value is None and (retry or pv not in self._unanswered)
+            )
+            if missing:
+                values = epics.caget_many(
+                    missing,
+                    as_string=True,
+                    timeout=timeout,
+                    connection_timeout=timeout,
+                )
+                self.misses += len(missing)
+                for pv, value in zip(missing, values, strict=True):
+                    if value is None:
+                        self._unanswered.add(pv)
+                    else:
+                        self.put(*_split(pv), value)
+                    found[pv] = value
+                self.save()
+            return found
+
+
+metadata_cache = PVMetadataCache()
@@ -3,33 +3,101 @@ Creating a list of scan monitoring function so that Bluesky Plans can subscribe
 
 @author: yluo(grace227)
 
+Progress is published as ScanProgress records on a rate-limited
+ProgressStream (see ``mic_common.utils.progress``), logging is one of its
+subscribers.  One monitor serves every instrument: scans of any number of
+nested scan records, with per-beamline actions added as hooks.
+
 List of functions::
 
-    # # watch_counter( ... ): # Monitor and log the counter value
+    # # ScanMonitor: # Monitor and publish the counters of nested scan records
+    # # ScanMonitorHooks: # Per-beamline actions at the start, lines, and end
+    # # SignalHook: # Put a value to a signal at every new line
+    # # execute_scan( ... ): # Run nested scan records with monitoring
+    # # execute_scan_1d( ... ), execute_scan_2d( ... ): # 1D and 2D shortcuts
 
 """
 
+import functools
 import logging
 import time
 
 import bluesky.plan_stubs as bps
-from apstools.plans import run_blocking_function
+import numpy as np
+from bluesky.run_engine import WaitForTimeoutError
 from ophyd.status import Status
 
+from mic_common.utils.eta import EtaEstimator
+from mic_common.utils.progress import ScanProgress
+from mic_common.utils.progress import progress_stream
+from mic_common.utils.status_wait import eta_timeout
+from mic_common.utils.status_wait import wait_for_status
+
 logger = logging.getLogger(__name__)
 
 SCANNUM_DIGITS = 4
 
 
+class ScanMonitorHooks:
+    """Per-beamline actions, called by ScanMonitor.
+
+    Override the methods needed.  ``on_line`` and ``on_point`` run on the
+    CA callback thread: use ``signal.put()``, never a plan, and keep it
+    short.
+    """
+
+    def on_start(self, monitor):
+        """Called when the scan starts."""
+
+    def on_line(self, monitor, level, value):
+        """Called when outer scan ``level`` (0 = outermost) starts a line.
+
+        ``value`` is the new count of that level.
+        """
+
+    def on_point(self, monitor, value):
+        """Called when the inner scan counts point ``value`` of the line."""
+
+    def on_finish(self, monitor):
+        """Called when the scan is done, or aborted."""
+
+
+class SignalHook(ScanMonitorHooks):
+    """Put ``value`` to ``signal`` at every new line, e.g. a PROC field.
+
+    Parameters:
+        signal (ophyd.Signal): Signal to put to.
+        value: Value to put, by default 1.
+        level (int, optional): Only for this outer scan level.
+    """
+
+    def __init__(self, signal, value=1, level=None):
+        """Initialize SignalHook."""
+        self.signal = signal
+        self.value = value
+        self.level = level
+
+    def on_line(self, monitor, level, value):
+        """Put the value, at a new line of the chosen level."""
+        if self.level is None or level == self.level:
+            self.signal.put(self.value)
+
+
 class ScanMonitor:
-    """Monitor and log scan progress.
+    """Monitor scan progress and publish it on a progress stream.
+
+    The scan is any number of nested scan records.  The innermost one
+    counts points, the outer ones together count lines: with outer counts
+    ``(nz, ny)``, line ``z * ny + y`` is being scanned.
 
     Attributes:
-        current_line (int): Current line being scanned.
+        current_line (int): Lines done, over all outer scan levels.
         line_time_in (float): Time when line scan started.
         line_time_out (float): Time when line scan ended.
         line_delta (float): Time taken for line scan.
         scan_time_remaining (float): Estimated remaining scan time.
+        eta_low (float): Low end of the band of ``scan_time_remaining``.
+        eta_high (float): High end of the band of ``scan_time_remaining``.
         outter_print_msg (bool): Whether to print outer loop messages.
     """
 
@@ -38,53 +106,187 @@ class ScanMonitor:
     line_time_out = 0
     line_delta = 0
     scan_time_remaining = 0
+    eta_low = 0
+    eta_high = 0
     outter_print_msg = False
 
-    def __init__(self, numpts_x=None, scan_name=None, numpts_y=0):
+    def __init__(
+        self,
+        numpts_x=None,
+        scan_name=None,
+        numpts_y=0,
+        stream=None,
+        eta=None,
+        outer_shape=None,
+        hooks=(),
+    ):
         """Initialize ScanMonitor.
 
         Parameters:
             numpts_x (int, optional): Number of points in X direction.
             scan_name (str, optional): Name of the scan.
             numpts_y (int, optional): Number of points in Y direction.
+            stream (ProgressStream, optional): Where progress is published,
+                by default the shared ``progress_stream``.
+            eta (float, optional): Planned duration of the scan, e.g.
+                ``numpts_x * dwell * (1 + scan_overhead)``, seeds the ETA.
+            outer_shape (tuple, optional): Points of each outer scan record,
+                outermost first, instead of ``numpts_y``.
+            hooks (list, optional): ScanMonitorHooks of the instrument.
         """
+        if outer_shape is None:
+            outer_shape = (numpts_y,) if numpts_y else ()
+        self.outer_shape = tuple(outer_shape)
+        # lines per count of each outer level
+        self._strides = [
+            int(np.prod(self.outer_shape[level + 1 :]))
+            for level in range(len(self.outer_shape))
+        ]
+        self._outer_counts = [0] * len(self.outer_shape)
+        numpts_y = int(np.prod(self.outer_shape)) if self.outer_shape else 0
+
+        self.stream = progress_stream if stream is None else stream
+        self.hooks = list(hooks)
         self.scan_active = False
         self.counter_active = False
         self.st = Status()
         self.numpts_x = numpts_x
         self.numpts_y = numpts_y
         self.scan_name = scan_name
+        self._subscriptions = []
+        npts = (numpts_x or 0) * max(numpts_y, 1)
+        self.point_eta = EtaEstimator(numpts_x or 0, seed=eta / npts if eta else None)
+        self.line_eta = None
+        if numpts_y:
+            self.line_eta = EtaEstimator(numpts_y, seed=eta / numpts_y if eta else None)
+
+    def subscribe(self, scans):
+        """Watch the counters of ``scans`` and the execution of the outermost.
+
+        Only this monitor's own subscriptions are removed by
+        ``unsubscribe()``, others on the same signals are left alone.
+
+        Parameters:
+            scans (list): Scan records, outermost first.
+        """
+        *outer, inner = scans
+        watches = [(scans[0].execute_scan, self.watch_execute_scan)]
+        for level, scan in enumerate(outer):
+            callback = functools.partial(self.watch_counter_outter, level=level)
+            watches.append((scan.number_points_rbv, callback))
+        watches.append((inner.number_points_rbv, self.watch_counter_inner))
+        for signal, callback in watches:
+            cid = signal.subscribe(callback, run=False)
+            self._subscriptions.append((signal, cid))
+
+    def unsubscribe(self):
+        """Remove the subscriptions made by ``subscribe()``."""
+        while self._subscriptions:
+            signal, cid = self._subscriptions.pop()
+            signal.unsubscribe(cid)
+
+    def _run_hooks(self, name, *args):
+        """Call ``name`` on every hook, a failing hook never stops the scan."""
+        for hook in self.hooks:
+            try:
+                getattr(hook, name)(self, *args)
+            except Exception:
+                logger.exception("ScanMonitor hook %r failed in %s", hook, name)
+
+    def start(self):
+        """Start the clocks, when the scan starts."""
+        self.line_time_in = time.perf_counter()
+        self.point_eta.start(self.line_time_in)
+        if self.line_eta is not None:
+            self.line_eta.start(self.line_time_in)
+        self._run_hooks("on_start")
+
+    def finish(self):
+        """Publish the final progress and run the hooks, when the scan ends."""
+        self.stream.flush()
+        self._run_hooks("on_finish")
 
     def update_eta(self):
-        """Update estimated time remaining."""
+        """Update the time taken by the last line (point in 1D)."""
         self.line_time_out = time.perf_counter()
         self.line_delta = round(self.line_time_out - self.line_time_in, 2)
         self.line_time_in = self.line_time_out
 
-    def watch_counter_outter(self, old_value, value, **kwargs):
+    def update_remaining(self, point):
+        """Update the estimated time remaining and its band.
+
+        In 1D it is the points left at the point rate.  In 2D it is the
+        lines left after this one at the line rate, plus the points left
+        in this line at the point rate.
+
+        Parameters:
+            point (int): Points done in the current line.
+        """
+        remaining, low, high = self.point_eta.remaining(point)
+        if self.line_eta is not None:
+            lines, lines_low, lines_high = self.line_eta.remaining(
+                min(self.current_line + 1, self.numpts_y)
+            )
+            # independent errors add in quadrature
+            half = np.hypot(remaining - low, lines - lines_low)
+            half_high = np.hypot(high - remaining, lines_high - lines)
+            remaining += lines
+            low, high = max(remaining - half, 0), remaining + half_high
+        self.scan_time_remaining = round(remaining, 2)
+        self.eta_low = round(low, 2)
+        self.eta_high = round(high, 2)
+
+    def publish(self, point, num_lines, percent):
+        """Publish a ScanProgress record on the progress stream.
+
+        Parameters:
+            point (int): Current point along the line.
+            num_lines (int): Number of lines.
+            percent (float): Progress of the whole scan.
+        """
+        self.stream.publish(
+            ScanProgress(
+                scan_name=self.scan_name,
+                line=max(self.current_line, 1),
+                num_lines=num_lines,
+                point=point,
+                num_points=self.numpts_x,
+                percent=percent,
+                remaining=self.scan_time_remaining,
+                remaining_low=self.eta_low,
+                remaining_high=self.eta_high,
+                line_time=self.line_delta,
+                timestamp=time.time(),
+            )
+        )
+
+    def watch_counter_outter(self, old_value, value, level=0, **kwargs):
         """Monitor outer loop counter.
 
         Parameters:
             old_value (int): Previous counter value.
             value (int): Current counter value.
+            level (int): Outer scan level of the counter, 0 = outermost.
             **kwargs: Additional keyword arguments.
         """
-        if self.counter_active:
-            if value >= 1:
-                self.update_eta()
-                self.scan_time_remaining = round(
-                    (self.numpts_y - value) * self.line_delta, 2
-                )
-                self.current_line = value
-                if self.outter_print_msg:
-                    prog = round(100 * value / self.numpts_y, 2)
-                    msg = f"Filename: {self.scan_name}, Scan_progress: {prog}%, "
-                    msg += (
-                        f"Scanned : {value}/{self.numpts_y}, "
-                        f"Scan_remaining : {self.scan_time_remaining}, "
-                    )
-                    msg += f"Line_eta : {self.line_delta}"
-                    logger.info(msg)
+        if not self.counter_active:
+            return
+        if level > 0 and value >= self.outer_shape[level]:
+            return  # a finished level shows as a count of the level above
+        self._outer_counts[level] = value
+        for inner in range(level + 1, len(self._outer_counts)):
+            self._outer_counts[inner] = 0  # restarts with the new count
+        lines = int(np.dot(self._outer_counts, self._strides))
+        if lines > self.current_line:
+            self.update_eta()
+            self.line_eta.update(lines, self.line_time_out)
+            self.point_eta.start(self.line_time_out)  # the new line
+            self.current_line = lines
+            self.update_remaining(0)
+            self._run_hooks("on_line", level, value)
+            if self.outter_print_msg:
+                prog = round(100 * lines / self.numpts_y, 2)
+                self.publish(self.numpts_x, self.numpts_y, prog)
 
     def watch_counter_inner(self, old_value, value, **kwargs):
         """Monitor inner loop counter.
@@ -94,18 +296,16 @@ class ScanMonitor:
             value (int): Current counter value.
             **kwargs: Additional keyword arguments.
         """
+        if self.hooks and self.counter_active and value > old_value:
+            self._run_hooks("on_point", value)
         if self.counter_active and self.numpts_x is not None:
             if all([value > 0, value > old_value, value < self.numpts_x]):
+                self.point_eta.update(value)
+                self.update_remaining(value)
                 if self.numpts_y == 0:
                     self.update_eta()
-                    self.scan_time_remaining = round(
-                        (self.numpts_x - value) * self.line_delta, 2
-                    )
                     prog = round(100 * value / self.numpts_x, 2)
-                    msg = f"Filename: {self.scan_name}, Scan_progress: {prog}%, "
-                    msg += f"Line: 1/1, Scan_remaining: {self.scan_time_remaining}, "
-                    msg += f"Scanned {value}/{self.numpts_x}"
-                    logger.info(msg)
+                    self.publish(value, 1, prog)
                 else:
                     prog = round(
                         100
@@ -113,14 +313,7 @@ class ScanMonitor:
                         / (self.numpts_x * self.numpts_y),
                         2,
                     )
-                    msg = f"Filename: {self.scan_name}, Scan_progress: {prog}%, "
-                    msg += (
-                        f"Line: {self.current_line}/{self.numpts_y}, "
-                        f"Scan_remaining: {self.scan_time_remaining}, "
-                        f"Line_eta: {self.line_delta}, "
-                        f"Scanned: {value}/{self.numpts_x}"
-                    )
-                    logger.info(msg)
+                    self.publish(value, self.numpts_y, prog)
 
     def watch_execute_scan(self, old_value, value, **kwargs):
         """Monitor scan execution.
@@ -136,37 +329,81 @@ class ScanMonitor:
 
 
 # Usage
-def execute_scan_1d(scan1, scan_name=""):
-    """Execute a 1D scan with monitoring.
+def execute_scan(
+    scans, scan_name="", eta=None, hooks=(), print_outter_msg=False, timeout=None
+):
+    """Execute nested scan records with monitoring.
+
+    The plan waits for the end of the scan on the RunEngine event loop (see
+    ``mic_common.utils.status_wait``), no thread is parked for the scan and
+    pause or abort take effect at once.
 
     Parameters:
-        scan1: Scan object.
+        scans (list): Scan records, outermost first.
         scan_name (str): Name of the scan.
+        eta (float, optional): Planned duration of the scan, seeds the ETA.
+        hooks (list, optional): ScanMonitorHooks of the instrument.
+        print_outter_msg (bool): Whether to print outer loop messages.
+        timeout (float or str, optional): Seconds before the scan is
+            stopped and ``WaitForTimeoutError`` raised.  ``"eta"`` derives
+            it from ``eta`` with ``eta_timeout()``.
     """
+    if timeout == "eta":
+        timeout = eta_timeout(eta)
+    *outer, inner = scans
     watcher = ScanMonitor(
-        numpts_x=scan1.number_points.value, scan_name=scan_name.zfill(SCANNUM_DIGITS)
+        numpts_x=inner.number_points.value,
+        scan_name=scan_name.zfill(SCANNUM_DIGITS),
+        eta=eta,
+        outer_shape=[scan.number_points.value for scan in outer],
+        hooks=hooks,
     )
+    watcher.outter_print_msg = print_outter_msg
 
     logger.info("Done setting up scan, about to start scan")
     logger.info("Start executing scan")
-    print(watcher.scan_name)
-
-    scan1.execute_scan.subscribe(watcher.watch_execute_scan)  # Subscribe to the scan
-    scan1.number_points_rbv.subscribe(watcher.watch_counter_inner)
 
+    watcher.subscribe(scans)
     try:
-        yield from bps.mv(scan1.execute_scan, 1)  # Start scan
+        yield from bps.mv(scans[0].execute_scan, 1)  # Start scan
         watcher.scan_active = True
         watcher.counter_active = True
-        watcher.line_time_in = time.perf_counter()
-        yield from run_blocking_function(watcher.st.wait)
+        watcher.start()
+        yield from wait_for_status(watcher.st, timeout=timeout)
+    except WaitForTimeoutError:
+        logger.error("Scan %s did not finish in %s s, stopping it", scan_name, timeout)
+        yield from bps.mv(scans[0].execute_scan, 0)
+        raise
     finally:
-        scan1.number_points_rbv.unsubscribe_all()
-        scan1.execute_scan.unsubscribe_all()
+        watcher.unsubscribe()
+        watcher.finish()
     logger.info("Done executing scan")
 
 
-def execute_scan_2d(inner_scan, outter_scan, print_outter_msg=False, scan_name=""):
+def execute_scan_1d(scan1, scan_name="", eta=None, hooks=(), timeout=None):
+    """Execute a 1D scan with monitoring.
+
+    Parameters:
+        scan1: Scan object.
+        scan_name (str): Name of the scan.
+        eta (float, optional): Planned duration of the scan, seeds the ETA.
+        hooks (list, optional): ScanMonitorHooks of the instrument.
+        timeout (float or str, optional): See ``execute_scan()``.
+    """
+    yield from execute_scan(
+        [scan1], scan_name=scan_name, eta=eta, hooks=hooks, timeout=timeout
+    )
+
+
+def execute_scan_2d(
+    inner_scan,
+    outter_scan,
+    print_outter_msg=False,
+    scan_name="",
+    eta=None,
+    hooks=(),
+    timeout=None,
+):
     """Execute a 2D scan with monitoring.
 
     Parameters:
@@ -174,31 +411,15 @@ def execute_scan_2d(inner_scan, outter_scan, print_outter_msg=False, scan_name="
         outter_scan: Outer scan object.
         print_outter_msg (bool): Whether to print outer loop messages.
         scan_name (str): Name of the scan.
+        eta (float, optional): Planned duration of the scan, seeds the ETA.
+        hooks (list, optional): ScanMonitorHooks of the instrument.
+        timeout (float or str, optional): See ``execute_scan()``.
     """
-    watcher = ScanMonitor(
-        numpts_x=inner_scan.number_points.value,
-        numpts_y=outter_scan.number_points.value,
-        scan_name=scan_name.zfill(SCANNUM_DIGITS),
+    yield from execute_scan(
+        [outter_scan, inner_scan],
+        scan_name=scan_name,
+        eta=eta,
+        hooks=hooks,
+        print_outter_msg=print_outter_msg,
+        timeout=timeout,
     )
-    watcher.outter_print_msg = print_outter_msg
-
-    logger.info("Done setting up scan, about to start scan")
-    logger.info("Start executing scan")
-
-    outter_scan.execute_scan.subscribe(
-        watcher.watch_execute_scan
-    )  # Subscribe to the scan
-    outter_scan.number_points_rbv.subscribe(watcher.watch_counter_outter)
-    inner_scan.number_points_rbv.subscribe(watcher.watch_counter_inner)
-
-    try:
-        yield from bps.mv(outter_scan.execute_scan, 1)  # Start scan
-        watcher.scan_active = True
-        watcher.counter_active = True
-        watcher.line_time_in = time.perf_counter()
-        yield from run_blocking_function(watcher.st.wait)
-    finally:
-        inner_scan.number_points_rbv.unsubscribe_all()
-        outter_scan.number_points_rbv.unsubscribe_all()
-        outter_scan.execute_scan.unsubscribe_all()
-    logger.info("Done executing scan")
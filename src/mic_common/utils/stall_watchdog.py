@@ -0,0 +1,259 @@
+"""
+Detect a stalled scan line and try to recover it.
+
+A fly scan line is stalled when the scan record is executing, the stage
+has stopped, and the detector channel has not advanced for much longer
+than a line should take.  Nothing noticed it before, and a stuck line
+could cost an hour of beamtime.  A scan held by ``.WAIT``, e.g. paused by
+``ScanControl``, looks the same but is not stalled: the watchdog also
+watches the ``.WCNT`` of the records and waits while a hold is in place.
+
+The watchdog subscribes to the three signals and checks them from its own
+thread.  On a stall it runs the next of its recoveries; when none is left
+it stops the scan.  A recovery that starts a move returns its Status
+instead of waiting, the thread checks it at the next polls and goes on
+watching meanwhile.  Used as a hook of ``ScanMonitor``, it runs for the
+length of the scan and takes the expected line time from the ETA of the
+monitor.
+
+List of objects::
+
+    # StallWatchdog: # stall detection with recoveries, a ScanMonitor hook
+"""
+
+__all__ = """
+    StallWatchdog
+""".split()
+
+import logging
+import threading
+import time
+
+from mic_common.utils.scan_monitor import ScanMonitorHooks
+
+logger = logging.getLogger(__name__)
+
+STALL_FACTOR = 3.0  # stalled after this many expected line times
+STALL_SLACK = 10.0  # seconds added to the stall time
+POLL_INTERVAL = 1.0  # seconds between checks
+
+
+class StallWatchdog(ScanMonitorHooks):
+    """Watch a scan for a line that stopped advancing.
+
+    The scan is stalled when ``execute`` is set, ``done_move`` (if any)
+    reports the stage stopped, no ``holds`` is set, and ``counter`` has
+    not changed for ``factor * line_time + slack`` seconds.  The clock
+    restarts when the last hold is released.
+
+    Parameters:
+        counter (ophyd.Signal): Advances during a line, e.g. the
+            ``current_channel`` of the SIS3820.
+        execute (ophyd.Signal): ``execute_scan`` of the scan record, it
+            is set to 0 to stop the scan.
+        done_move (ophyd.Signal, optional): ``motor_done_move`` of the
+            fly stage.
+        holds (list): Signals set while the scan is held on purpose, e.g.
+            the ``wcnt`` of the scan records.
+        line_time (float, optional): Expected seconds per line, until the
+            scan monitor has measured some lines.
+        factor (float): Stall time in expected line times.
+        slack (float): Seconds added to the stall time.
+        recoveries (list): Callables without arguments, e.g.
+            ``unstuck_xstage``, the next one runs at every stall.  They
+            must not block: a recovery that moves returns the Status of
+            the move.
+        abort (bool): Stop the scan when no recovery is left.
+        poll (float): Seconds between checks.
+
+    Attributes:
+        stalls (int): Stalls detected since ``start()``.
+    """
+
+    def __init__(
+        self,
+        counter,
+        execute,
+        done_move=None,
+        holds=(),
+        line_time=None,
+        factor=STALL_FACTOR,
+        slack=STALL_SLACK,
+        recoveries=(),
+        abort=True,
+        poll=POLL_INTERVAL,
+    ):
+        """Initialize StallWatchdog."""
+        self.counter = counter
+        self.execute = execute
+        self.done_move = done_move
+        self.holds = list(holds)
+        self.line_time = line_time
+        self.factor = factor
+        self.slack = slack
+        self.recoveries = list(recoveries)
+        self.abort = abort
+        self.poll = poll
+        self.monitor = None
+        self.stalls = 0
+        self._recovery = 0
+        self._recovery_status = None  # Status of the running recovery
+        self._running = False
+        self._stage_done = True
+        self._holds = {}  # hold signal name: value
+        self._last_progress = time.monotonic()
+        self._subscriptions = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def expected_line_time(self):
+        """Seconds a line should take, measured by the monitor if possible."""
+        monitor = self.monitor
+        if monitor is not None:
+            if monitor.line_eta is not None and monitor.line_eta.count:
+                return monitor.line_eta.unit_time
+            point = monitor.point_eta.unit_time
+            if point is not None and monitor.numpts_x:
+                return point * monitor.numpts_x
+        return self.line_time
+
+    def stall_time(self):
+        """Seconds without progress before a stall, None if unknown."""
+        line_time = self.expected_line_time()
+        if line_time is None:
+            return None
+        return self.factor * line_time + self.slack
+
+    def _progress(self, *args, **kwargs):
+        """The line advanced: restart the clock and the recoveries."""
+        self._last_progress = time.monotonic()
+        self._recovery = 0
+
+    def _watch_execute(self, value, **kwargs):
+        self._running = bool(value)
+        self._last_progress = time.monotonic()
+
+    def _watch_done_move(self, value, **kwargs):
+        self._stage_done = bool(value)
+        if self._stage_done:
+            # the stall time counts from when the stage stopped
+            self._last_progress = time.monotonic()
+
+    def _watch_hold(self, value, obj=None, **kwargs):
+        held = self.held
+        self._holds[obj.name] = value
+        if held and not self.held:
+            logger.info("Scan released, watching for stalls again")
+            # the stall time counts from the resume
+            self._last_progress = time.monotonic()
+
+    @property
+    def held(self):
+        """Whether the scan is held on purpose, e.g. paused."""
+        return any(self._holds.values())
+
+    def check(self, now=None):
+        """Whether the scan is stalled now."""
+        stall_time = self.stall_time()
+        if not self._running or not self._stage_done or stall_time is None:
+            return False
+        if self.held:
+            return False
+        now = time.monotonic() if now is None else now
+        return now - self._last_progress > stall_time
+
+    def on_stall(self):
+        """Run the next recovery, or stop the scan when none is left."""
+        self.stalls += 1
+        idle = time.monotonic() - self._last_progress
+        logger.warning(
+            "Scan stalled: %s at %s for %.1f s (stall %d)",
+            self.counter.name, self.counter.get(), idle, self.stalls,
+        )
+        if self._recovery < len(self.recoveries):
+            recovery = self.recoveries[self._recovery]
+            self._recovery += 1
+            logger.info("Stall recovery: %s", getattr(recovery, "__name__", recovery))
+            try:
+                result = recovery()
+            except Exception:
+                logger.exception("Stall recovery %r failed", recovery)
+            else:
+                if hasattr(result, "add_callback"):  # checked at the next polls
+                    self._recovery_status = result
+        elif self.abort:
+            logger.error("Scan stalled, no recovery left: stopping the scan")
+            self.execute.put(0)
+        self._last_progress = time.monotonic()
+
+    def _check_recovery(self):
+        """Log the end of the running recovery, if it ended."""
+        status = self._recovery_status
+        if status is None or not status.done:
+            return
+        self._recovery_status = None
+        if status.success:
+            logger.info("Stall recovery done")
+        else:
+            logger.warning("Stall recovery failed: %s", status.exception())
+        # the stall time counts from the end of the recovery
+        self._last_progress = time.monotonic()
+
+    def _run(self):
+        while not self._stop.wait(self.poll):
+            self._check_recovery()
+            if self.check():
+                self.on_stall()
+
+    def start(self):
+        """Subscribe to the signals and start checking."""
+        if self._thread is not None:
+            return
+        self.stalls = 0
+        self._recovery = 0
+        self._recovery_status = None
+        self._running = bool(self.execute.get())
+        if self.done_move is not None:
+            self._stage_done = bool(self.done_move.get())
+        self._holds = {signal.name: signal.get() for signal in self.holds}
+        self._last_progress = time.monotonic()
+        watches = [
+            (self.counter, self._progress),
+            (self.execute, self._watch_execute),
+        ]
+        if self.done_move is not None:
+            watches.append((self.done_move, self._watch_done_move))
+        watches += [(signal, self._watch_hold) for signal in self.holds]
+        for signal, callback in watches:
+            self._subscriptions.append((signal, signal.subscribe(callback, run=False)))
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="StallWatchdog", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop checking and remove the subscriptions."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll + 1)
+            self._thread = None
+        while self._subscriptions:
+            signal, cid = self._subscriptions.pop()
+            signal.unsubscribe(cid)
+
+    def on_start(self, monitor):
+        """Start with the scan, timing lines with the monitor's ETA."""
+        self.monitor = monitor
+        self.start()
+
+    def on_line(self, monitor, level, value):
+        """A new line is progress."""
+        self._progress()
+
+    def on_finish(self, monitor):
+        """Stop with the scan."""
+        self.stop()
+        if self.stalls:
+            logger.warning("Scan %s stalled %d time(s)", monitor.scan_name, self.stalls)
+        self.monitor = None
@@ -0,0 +1,103 @@
+"""
+Wait for an ophyd Status inside a plan, on the RunEngine event loop.
+
+``run_blocking_function(status.wait)`` parks a worker thread for the whole
+scan.  ``wait_for_status`` hands the RunEngine an asyncio future that the
+Status completes from its callback thread.  No thread waits, and a pause
+or abort interrupts the wait at once.
+
+List of functions::
+
+    # wait_for_status( ... ): # plan stub, wait for a Status with bps.wait_for
+    # wait_for_future( ... ): # plan stub, wait for a concurrent.futures.Future
+    # eta_timeout( ... ): # timeout with a margin over an estimated duration
+"""
+
+__all__ = """
+    wait_for_status
+    wait_for_future
+    eta_timeout
+""".split()
+
+import asyncio
+import logging
+
+import bluesky.plan_stubs as bps
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT_FACTOR = 2.0  # timeout as a multiple of the ETA
+TIMEOUT_SLACK = 60.0  # seconds added to every ETA-derived timeout
+
+
+def eta_timeout(eta, factor=TIMEOUT_FACTOR, slack=TIMEOUT_SLACK):
+    """Timeout for a scan estimated to take ``eta`` seconds, None if unknown."""
+    if not eta:
+        return None
+    return eta * factor + slack
+
+
+def _status_awaitable(status):
+    """Factory of futures that complete with ``status``, for ``bps.wait_for``.
+
+    The RunEngine may call it again after a pause, each call makes a new
+    future.
+    """
+
+    def factory():
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def finish(future, status):
+            if future.done():
+                return
+            exc = status.exception()
+            if exc is None:
+                future.set_result(status)
+            else:
+                future.set_exception(exc)
+
+        # the Status calls back from its own thread, or now if already done
+        status.add_callback(
+            lambda st: loop.call_soon_threadsafe(finish, future, st)
+        )
+        return future
+
+    return factory
+
+
+def wait_for_status(status, timeout=None):
+    """Plan stub: wait for ``status`` without blocking a thread.
+
+    Parameters:
+        status (ophyd.status.StatusBase): The status to wait for.
+        timeout (float, optional): Seconds, then raise
+            ``bluesky.run_engine.WaitForTimeoutError``.
+
+    Returns:
+        The finished status.  A failed status raises its exception.
+    """
+    kwargs = {} if timeout is None else {"timeout": timeout}
+    futures = yield from bps.wait_for([_status_awaitable(status)], **kwargs)
+    for future in futures or []:
+        future.result()  # raise the exception of a failed status
+    return status
+
+
+def wait_for_future(future, timeout=None):
+    """Plan stub: wait for a ``concurrent.futures.Future`` of a worker thread.
+
+    A future already done costs no wait.
+
+    Parameters:
+        future (concurrent.futures.Future): The future to wait for.
+        timeout (float, optional): Seconds, then raise
+            ``bluesky.run_engine.WaitForTimeoutError``.
+
+    Returns:
+        The result of the future.  A failed future raises its exception.
+    """
+    if not future.done():
+        kwargs = {} if timeout is None else {"timeout": timeout}
+        yield from bps.wait_for([lambda: asyncio.wrap_future(future)], **kwargs)
+    return future.result()
@@ -0,0 +1,256 @@
+"""
+Cache of scan trajectories, keyed by scan geometry.
+
+Operators repeat the same geometry (width, height, step, dwell) at many
+centers.  Trajectories are generated once around ``(0, 0)``, stored, and
+translated to the requested center on reuse.  The cache is bounded by the
+memory held by its arrays and evicts the least recently used entries.
+
+List of objects::
+
+    # TrajectoryCache: # LRU cache of trajectory arrays, by memory size
+    # TableUploadCache: # skip scan record table uploads that did not change
+    # trajectory_cache: # the shared TrajectoryCache
+    # table_uploads: # the shared TableUploadCache
+    # cache_trajectory( ... ): # decorator using the shared cache
+"""
+
+__all__ = """
+    TrajectoryCache
+    TableUploadCache
+    trajectory_cache
+    table_uploads
+    cache_trajectory
+""".split()
+
+import functools
+import inspect
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+logger.info(__file__)
+
+MAX_BYTES = 512 * 2**20
+CENTER_ARGS = ("x_center", "y_center")
+KEY_DIGITS = 9  # geometry closer than this is the same geometry
+TABLE_TIMEOUT = 1.0  # seconds to read back a scan record table
+
+
+def _normalize(value):
+    """Hashable, rounded form of an argument, for use in a cache key."""
+    if isinstance(value, (bool, str, type(None))):
+        return value
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return round(float(value), KEY_DIGITS)
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(_normalize(v) for v in value)
+    return value
+
+
+class TrajectoryCache:
+    """Least recently used cache of trajectories, bounded by memory.
+
+    Attributes:
+        max_bytes (int): Memory limit for all cached arrays.
+        hits (int): Number of lookups served from the cache.
+        misses (int): Number of lookups that generated the trajectory.
+    """
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        """Initialize TrajectoryCache.
+
+        Parameters:
+            max_bytes (int): Memory limit for all cached arrays.
+        """
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        """Memory held by the cached arrays."""
+        return self._nbytes
+
+    def __len__(self):
+        """Number of cached trajectories."""
+        return len(self._entries)
+
+    def clear(self):
+        """Remove all cached trajectories."""
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def get(self, key):
+        """Cached arrays for ``key``, or None.
+
+        Parameters:
+            key: Hashable geometry key.
+
+        Returns:
+            tuple: Read-only arrays, or None if not cached.
+        """
+        with self._lock:
+            arrays = self._entries.get(key)
+            if arrays is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return arrays
+
+    def put(self, key, arrays):
+        """Cache ``arrays`` under ``key``, evicting old entries as needed.
+
+        Parameters:
+            key: Hashable geometry key.
+            arrays (tuple): Trajectory arrays, stored read-only.
+
+        Returns:
+            tuple: The stored arrays.
+        """
+        arrays = tuple(np.array(a) for a in arrays)
+        for a in arrays:
+            a.setflags(write=False)
+        size = sum(a.nbytes for a in arrays)
+        if size > self.max_bytes:
+            logger.info("Trajectory of %d bytes is too large to cache", size)
+            return arrays
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._nbytes -= sum(a.nbytes for a in old)
+            while self._entries and self._nbytes + size > self.max_bytes:
+                _key, evicted = self._entries.popitem(last=False)
+                self._nbytes -= sum(a.nbytes for a in evicted)
+            self._entries[key] = arrays
+            self._nbytes += size
+        return arrays
+
+    def cached(self, func, center_args=CENTER_ARGS):
+        """Decorate a trajectory generator to use this cache.
+
+        ``func`` must return ``(x, y, ...)`` arrays.  It is called with the
+        ``center_args`` set to 0, and the result is translated to the
+        requested center.  All other arguments form the cache key.  The
+        undecorated function stays available as ``__wrapped__``.
+
+        Parameters:
+            func (callable): Trajectory generator.
+            center_args (tuple): Names of the x and y center arguments.
+
+        Returns:
+            callable: The caching generator.
+        """
+        signature = inspect.signature(func)
+        name = f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            centers = [bound.arguments[arg] for arg in center_args]
+            geometry = tuple(
+                (arg, _normalize(value))
+                for arg, value in bound.arguments.items()
+                if arg not in center_args
+            )
+            key = (name, geometry)
+
+            arrays = self.get(key)
+            if arrays is None:
+                for arg in center_args:
+                    bound.arguments[arg] = 0
+                arrays = self.put(key, func(*bound.args, **bound.kwargs))
+
+            # new arrays, so callers never modify the cached ones
+            result = [np.array(a) for a in arrays]
+            for axis, center in enumerate(centers):
+                if center:
+                    result[axis] = result[axis] + center
+            return tuple(result)
+
+        return wrapper
+
+
+class TableUploadCache:
+    """Skip scan record table uploads that would not change the table.
+
+    A plan that reuses a trajectory can skip rewriting ``P1PA``/``P2PA``
+    when the table already holds it.  The table is read back from the IOC
+    before each upload: another client, an autosave restore or an earlier
+    session may have changed it since this process wrote it.
+
+    Parameters:
+        timeout (float): Seconds to read back a table.
+
+    Attributes:
+        skipped (int): Uploads skipped, the table was already right.
+        uploaded (int): Tables written.
+    """
+
+    def __init__(self, timeout=TABLE_TIMEOUT):
+        """Initialize TableUploadCache."""
+        self.timeout = timeout
+        self.skipped = 0
+        self.uploaded = 0
+
+    def changed(self, pv, values):
+        """True unless the table PV already starts with ``values``.
+
+        Parameters:
+            pv (epics.PV): The table PV, e.g. ``scanrecord.P1PA``.
+            values (array): Table to compare.
+        """
+        values = np.asarray(values)
+        current = pv.get(count=values.size, use_monitor=False, timeout=self.timeout)
+        if current is None:  # not read, write it to be sure
+            return True
+        current = np.atleast_1d(np.asarray(current))[: values.size]
+        return not np.array_equal(current, values)
+
+    def upload(self, pv, values):
+        """Write ``values`` to the ``epics.PV`` unless it already holds them.
+
+        Only the first ``len(values)`` elements of the table are compared,
+        the scan record reads no further than its number of points.
+
+        Parameters:
+            pv (epics.PV): The table PV, e.g. ``scanrecord.P1PA``.
+            values (array): Table to write.
+
+        Returns:
+            bool: True if the table was written.
+        """
+        if not self.changed(pv, values):
+            logger.info("%s is unchanged, skipping the upload", pv.pvname)
+            self.skipped += 1
+            return False
+        pv.put(np.asarray(values))
+        self.uploaded += 1
+        return True
+
+
+trajectory_cache = TrajectoryCache()
+table_uploads = TableUploadCache()
+
+
+def cache_trajectory(func=None, center_args=CENTER_ARGS):
+    """Decorate a trajectory generator to use the shared ``trajectory_cache``.
+
+    Parameters:
+        func (callable): Trajectory generator returning ``(x, y, ...)``.
+        center_args (tuple): Names of the x and y center arguments.
+    """
+    if func is None:
+        return functools.partial(cache_trajectory, center_args=center_args)
+    return trajectory_cache.cached(func, center_args=center_args)
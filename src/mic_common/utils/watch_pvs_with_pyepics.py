@@ -5,6 +5,9 @@ Future: ... and write to HDF5 file group.
 
 Accept information about PVs from YAML files.
 
+Reads are value-only: the enum strings of a PV come from the persistent
+``metadata_cache``, fetched once with the control variables.
+
 .. tip:: If ``oregistry`` warns about "duplicate objects", turn that off:
     ``oregistry.warn_duplicates = False``
 .. tip:: If EPICS warns about "Identical process variable names on multiple servers"
@@ -18,6 +21,8 @@ import time
 import epics
 import yaml
 
+from mic_common.utils.pv_metadata_cache import metadata_cache
+
 TIMEOUT = 0.1
 THIS_DIR = pathlib.Path(__file__).parent
 CONFIGS_DIR = THIS_DIR / ".." / "configs"
@@ -37,21 +42,36 @@ class WatchedPvRO(epics.PV):
         """
         raise NotImplementedError(f"{self} is read-only.")
 
+    @property
+    def choices(self):
+        """Enum strings of the PV, from ``metadata_cache``.
+
+        Returns:
+            list: The enum strings, None if the PV is not an enum.
+        """
+        if "enum" not in str(self.type):
+            return None
+        choices = metadata_cache.get(self.pvname, "enum_strs")
+        if choices is None:
+            choices = (self.get_ctrlvars() or {}).get("enum_strs")
+            if choices is not None:
+                metadata_cache.put(self.pvname, "enum_strs", choices)
+                metadata_cache.save()
+        return choices
+
     @property
     def value(self):
-        """Get PV value with metadata.
+        """Get PV value, without fetching its metadata.
 
         Returns:
             Value of the PV, with enum string if applicable.
         """
-        contents = self.get_with_metadata(with_ctrlvars=True)
-        value = contents["value"]
+        value = self.get()
         if isinstance(value, int):
             # If enum, then use str, if defined.
-            choices = contents.get("enum_strs")
             try:
-                value = choices[value]
-            except IndexError:
+                value = self.choices[value]
+            except (IndexError, TypeError):
                 pass
         return value
 
@@ -3,26 +3,50 @@ Watch PVs (using ophyd) and write to HDF5 file group.
 
 Accept information about PVs from YAML files.
 
+The watched PVs are kept in a long-lived ``MasterFilePVPool``: they are
+connected and monitored once, and every master file is written from their
+cached values.  They are created again only when the configuration
+changes.
+
+The static metadata of the PVs (``.DESC``, ``.RTYP``, units) is fetched
+for all of them at once by ``load_pv_metadata()``, in about one CA round
+trip, and kept in the persistent ``metadata_cache``.
+
+``write_scan_master_h5_async()`` takes a snapshot of the PVs at once and
+leaves the HDF5 writing to the background ``master_file_writer``.
+
 .. tip:: If ``oregistry`` warns about "duplicate objects", turn that off:
     ``oregistry.warn_duplicates = False``
 """
 
+import concurrent.futures
+import copy
 import datetime
+import logging
 import pathlib
+import queue
+import threading
 import time
 
 import h5py
+import numpy as np
 import yaml
 from ophyd import Component
 from ophyd import EpicsMotor
 from ophyd import EpicsSignalRO
 
+from mic_common.utils.pv_metadata_cache import METADATA_TIMEOUT
+from mic_common.utils.pv_metadata_cache import metadata_cache
+
 THIS_DIR = pathlib.Path(__file__).parent
 CONFIGS_DIR = THIS_DIR / ".." / "configs"
 PROJECT_DIR = THIS_DIR / "."  # TODO: get this from DM data dir
 
 MASTER_YAML_FILE = CONFIGS_DIR / "masterFileConfig_gen.yml"
 MASTER_SCAN_FILE = PROJECT_DIR / "master_scan_pvs.h5"
+CONNECTION_TIMEOUT = 2.0  # seconds for the PVs of a new configuration
+
+logger = logging.getLogger(__name__)
 
 pv_db = {}
 
@@ -37,13 +61,22 @@ class WatchedEpicsMotor(EpicsMotor):
     description_ = Component(EpicsSignalRO, ".DESC", kind="config", string=True)
     record_type = Component(EpicsSignalRO, ".RTYP", kind="config", string=True)
 
+    def _cached(self, signal):
+        """Value of ``signal``, a metadata PV, from ``metadata_cache``."""
+        pv = signal.pvname
+        value = metadata_cache.fetch([pv], retry=False)[pv]
+        if value is None:
+            value = signal.get()
+            metadata_cache.put(*pv.rsplit(".", 1), value)
+        return value
+
     @property
     def _description(self):
-        return self.description_.get()
+        return self._cached(self.description_)
 
     @property
     def _record_type(self):
-        return self.record_type.get()
+        return self._cached(self.record_type)
 
 
 class WatchedEpicsSignal(EpicsSignalRO):
@@ -51,8 +84,6 @@ class WatchedEpicsSignal(EpicsSignalRO):
 
     def __init__(self, read_pv="", units_pv="", **kwargs):
         """."""
-        import epics  # cheat here
-
         try:
             super().__init__(read_pv=read_pv, **kwargs)
         except Exception as reason:
@@ -61,43 +92,26 @@ class WatchedEpicsSignal(EpicsSignalRO):
             ) from reason
 
         pv_base = read_pv.split(".")[0]
-        tmot = 0.5
-
-        def caget_now(pv, default=None, timeout=5):
-            value = default
-            if len(pv) > 0:
-                try:
-                    value = epics.caget(
-                        pv,
-                        timeout=timeout,
-                        connection_timeout=timeout,
-                    )
-                except TimeoutError:
-                    value = default
-            return value
-
+        text_units = ":" not in units_pv or "." not in units_pv
+        metadata_pvs = [f"{pv_base}.DESC", f"{pv_base}.RTYP"]
+        if not text_units:
+            metadata_pvs.append(units_pv)
         # cheat here, only during initial construction
         # Signal has no Component attributes.  Gotta fake it.
-        self._description = caget_now(
-            f"{pv_base}.DESC",
-            default=f"EPICS PV: {pv_base}",
-            timeout=tmot,
-        )
+        # Usually prefetched by connect_with_EPICS(), for all PVs at once.
+        metadata = load_pv_metadata(metadata_pvs, retry=False)
 
-        self._record_type = caget_now(
-            f"{pv_base}.RTYP",
-            default="-timeout-",
-            timeout=tmot,
-        )
+        def cached(pv, default):
+            value = metadata.get(pv)
+            return default if value is None else value
 
-        if ":" not in units_pv or "." not in units_pv:
+        self._description = cached(f"{pv_base}.DESC", f"EPICS PV: {pv_base}")
+        self._record_type = cached(f"{pv_base}.RTYP", "-timeout-")
+
+        if text_units:
             self.egu = units_pv  # Assume text, not a PV
         else:
-            self.egu = caget_now(
-                units_pv,
-                default=self.metadata.get("units", ""),
-                timeout=tmot,
-            )
+            self.egu = cached(units_pv, self.metadata.get("units", ""))
 
         if self._description == "":
             self._description = f"EPICS PV: {self.pvname}"
@@ -111,11 +125,37 @@ class WatchedEpicsSignal(EpicsSignalRO):
             choices = self.metadata.get("enum_strs")
             try:
                 value = choices[value]
-            except IndexError:
-                pass
+            except (IndexError, TypeError):
+                pass  # not an enum
         return value
 
 
+def load_pv_metadata(pvs, timeout=METADATA_TIMEOUT, retry=True):
+    """Values of the metadata PVs ``pvs``, from ``metadata_cache``.
+
+    The PVs not yet cached are fetched together, in about one CA round
+    trip (at most ``timeout``).  A PV that does not answer is None.
+
+    Parameters:
+        pvs (list): Names of the PVs, e.g. ``"IOC:m1.DESC"``.
+        timeout (float): Seconds to connect and to read.
+        retry (bool): Ask again the PVs that did not answer before.
+
+    Returns:
+        dict: ``{pv: value}``.
+    """
+    return metadata_cache.fetch(pvs, timeout=timeout, retry=retry)
+
+
+def _signal_pvs(entry):
+    """The PV and units PV of the WatchedEpicsSignal of ``entry``."""
+    pv = entry.get("VALUE_PV", entry.get("PV"))
+    units_pv = entry.get("UNITS_PV")
+    if units_pv == f"{pv.split('.')[0]}.EGU":
+        units_pv = None  # the signal's own units
+    return pv, units_pv
+
+
 def connect_with_EPICS(specifications, db):
     """
     Watch various EPICS objects specified in a micdata YAML file.
@@ -126,7 +166,24 @@ def connect_with_EPICS(specifications, db):
     entries with "RBV_PV"   WatchedEpicsMotor
     any other entries       WatchedEpicsSignal
     =====================   =====================
+
+    The metadata of all the entries is loaded first, in one batch.
     """
+    metadata_pvs = []
+    for specs in specifications.values():
+        for entry in specs.values():
+            if not isinstance(entry, dict):
+                continue
+            if "RBV_PV" in entry:
+                pv, units_pv = entry["RBV_PV"], None
+            else:
+                pv, units_pv = _signal_pvs(entry)
+            pv_base = pv.split(".")[0]
+            metadata_pvs += [f"{pv_base}.DESC", f"{pv_base}.RTYP"]
+            if units_pv and ":" in units_pv and "." in units_pv:
+                metadata_pvs.append(units_pv)
+    load_pv_metadata(metadata_pvs)
+
     for section_name, specs in specifications.items():
         db[section_name] = {}
         for key, entry in specs.items():
@@ -138,27 +195,87 @@ def connect_with_EPICS(specifications, db):
                 device = WatchedEpicsMotor(pv, name=name)
             else:
                 kwargs = {"name": name}
-                pv = entry.get("VALUE_PV", entry.get("PV"))
-                units_pv = entry.get("UNITS_PV")
+                pv, units_pv = _signal_pvs(entry)
                 if units_pv is not None:
-                    if units_pv != f"{pv.split('.')[0]}.EGU":
-                        kwargs["units_pv"] = units_pv
-                device = WatchedEpicsSignal(pv, **kwargs)
+                    kwargs["units_pv"] = units_pv
+                device = WatchedEpicsSignal(pv, auto_monitor=True, **kwargs)
             db[section_name][name] = device
 
 
+class MasterFilePVPool:
+    """The watched PVs of a master file configuration, connected once.
+
+    Every ``connect()`` with the same configuration returns the same
+    devices, monitored since the first one.  A new configuration replaces
+    them.
+    """
+
+    def __init__(self):
+        """Initialize MasterFilePVPool."""
+        self.specifications = None
+        self.db = {}
+        self._lock = threading.Lock()
+
+    def connect(self, specifications, timeout=CONNECTION_TIMEOUT):
+        """The watched devices of ``specifications``, connected if needed.
+
+        Parameters:
+            specifications (dict): The master file YAML, by section.
+            timeout (float): Seconds to wait for the PVs of a new
+                configuration, those still disconnected are skipped when
+                writing.
+
+        Returns:
+            dict: ``{section: {name: device}}``.
+        """
+        with self._lock:
+            if self.db and specifications == self.specifications:
+                return self.db
+            self.disconnect()
+            db = {}
+            t0 = time.monotonic()
+            connect_with_EPICS(specifications, db)
+            deadline = t0 + timeout
+            devices = [d for entries in db.values() for d in entries.values()]
+            for device in devices:
+                try:
+                    device.wait_for_connection(
+                        timeout=max(deadline - time.monotonic(), 0.001)
+                    )
+                except TimeoutError:
+                    pass
+            missing = [d.name for d in devices if not d.connected]
+            logger.info(
+                "Connected %d master file PVs in %.2f s",
+                len(devices) - len(missing), time.monotonic() - t0,
+            )
+            if missing:
+                logger.warning("Master file PVs not connected: %s", missing)
+            self.specifications = copy.deepcopy(specifications)
+            self.db = db
+            return db
+
+    def disconnect(self):
+        """Destroy the watched devices."""
+        for entries in self.db.values():
+            for device in entries.values():
+                device.destroy()
+        self.db = {}
+        self.specifications = None
+
+
+pv_pool = MasterFilePVPool()
+
+
 def load_config_yaml(path):
     """Local developer copy."""
     return yaml.load(open(path, "r").read(), yaml.Loader)
 
 
-def write_h5_dataset(
-    h5parent: h5py.Group,
-    entry: tuple[WatchedEpicsMotor, WatchedEpicsSignal],
-) -> h5py.Dataset:
-    """Write this watched entry to the HDF5 group."""
+def snapshot_entry(entry):
+    """Name, value and HDF5 attributes of a watched entry, None if disconnected."""
     if not entry.connected:
-        return
+        return None
 
     value = entry.position
     setpoint = None
@@ -172,29 +289,61 @@ def write_h5_dataset(
     if isinstance(entry, WatchedEpicsMotor):
         setpoint = entry.user_setpoint.get()
 
-    ds = h5parent.create_dataset(entry.name, data=value)
     # https://manual.nexusformat.org/nxdl_desc.html#long-name
-    ds.attrs["long_name"] = entry._description
+    attrs = {"long_name": entry._description}
     if entry.egu not in (None, "None", ""):
         # https://manual.nexusformat.org/nxdl_desc.html#units
-        ds.attrs["units"] = entry.egu
+        attrs["units"] = entry.egu
     if setpoint is not None:
-        ds.attrs["setpoint"] = setpoint
-    ds.attrs["EPICS_PV"] = pv
-    ds.attrs["EPICS_record_type"] = entry._record_type
+        attrs["setpoint"] = setpoint
+    attrs["EPICS_PV"] = pv
+    attrs["EPICS_record_type"] = entry._record_type
+
+    return entry.name, value, attrs
+
+
+def snapshot_watched_pvs(db: dict) -> dict:
+    """Snapshot of the connected entries of ``db``, by section."""
+    snapshot = {}
+    for section_name, entries in db.items():
+        snapshot[section_name] = [
+            item
+            for item in map(snapshot_entry, entries.values())
+            if item is not None
+        ]
+    return snapshot
+
 
+def _write_h5_snapshot(h5parent: h5py.Group, name, value, attrs) -> h5py.Dataset:
+    ds = h5parent.create_dataset(name, data=value)
+    ds.attrs.update(attrs)
     return ds
 
 
-def write_h5_watched_pvs(h5parent: h5py.Group, db: dict, yaml_file=None):
-    """Report the monitored PVs to the HDF5 parent group."""
+def write_h5_dataset(
+    h5parent: h5py.Group,
+    entry: tuple[WatchedEpicsMotor, WatchedEpicsSignal],
+) -> h5py.Dataset:
+    """Write this watched entry to the HDF5 group."""
+    item = snapshot_entry(entry)
+    if item is None:
+        return
+    return _write_h5_snapshot(h5parent, *item)
+
+
+def write_h5_watched_pvs(
+    h5parent: h5py.Group, db: dict, yaml_file=None, snapshot=None
+):
+    """Report the monitored PVs, or their ``snapshot``, to the HDF5 parent group."""
     if yaml_file is not None:
         h5parent.attrs["yaml_configuration_file"] = str(yaml_file)
         # TODO: write the YAML text here?
-    for section_name, entries in db.items():
+    if snapshot is None:
+        snapshot = snapshot_watched_pvs(db)
+    for section_name, items in snapshot.items():
         group = h5parent.create_group(section_name)
-        for entry in entries.values():
-            write_h5_dataset(group, entry)
+        for item in items:
+            _write_h5_snapshot(group, *item)
 
 
 def developer_report(db):
@@ -225,28 +374,174 @@ def developer_report(db):
     print(table)
 
 
+def _write_master_file(master_scan_file, snapshot, master_file_yaml,
+                       bluesky_params, timestamp):
+    """Write a snapshot of the watched PVs and the scan parameters."""
+    with h5py.File(master_scan_file, "w") as h5root:
+        h5root.attrs["filename"] = str(master_scan_file)
+        h5root.attrs["datetime"] = str(timestamp)
+        write_h5_watched_pvs(h5root, None, master_file_yaml, snapshot=snapshot)
+        if bluesky_params is not None:
+            group = h5root.create_group("SCAN")
+            for desc, value in bluesky_params.items():
+                # arrays, e.g. the point order of a table scan, as they are
+                data = value if isinstance(value, np.ndarray) else str(value)
+                group.create_dataset(desc, data=data)
+        h5root.flush()
+
+
 def write_scan_master_h5(master_file_yaml: dict,
                          master_scan_file: str,
-                         bluesky_params: dict):
-    """Demonstrate this code."""
-    # specifications = master_file_yaml
-    pv_db = {}
-    connect_with_EPICS(master_file_yaml, pv_db)
-    time.sleep(1)  # plenty of time for PV connections
+                         bluesky_params: dict,
+                         pool: MasterFilePVPool = None):
+    """Write the watched PVs and the scan parameters to the master file.
+
+    The PVs come from ``pool``, by default the shared ``pv_pool``: they are
+    connected on the first call and at a change of ``master_file_yaml``.
+    """
+    pool = pv_pool if pool is None else pool
+    pv_db = pool.connect(master_file_yaml)
     developer_report(pv_db)
 
     try:
-        with h5py.File(master_scan_file, "w") as h5root:
-            h5root.attrs["filename"] = str(master_scan_file)
-            h5root.attrs["datetime"] = str(datetime.datetime.now())
-            write_h5_watched_pvs(h5root, pv_db, master_file_yaml)
-            if bluesky_params is not None:
-                group = h5root.create_group("SCAN")
-                for desc, value in bluesky_params.items():
-                    ds = group.create_dataset(desc, data=str(value))
+        _write_master_file(
+            master_scan_file,
+            snapshot_watched_pvs(pv_db),
+            master_file_yaml,
+            bluesky_params,
+            datetime.datetime.now(),
+        )
     except PermissionError as reason:
         print(f"PermissionError: {reason}")
 
 
+class MasterFileWriter:
+    """Write master files in a background thread, from PV snapshots.
+
+    ``submit()`` takes the snapshot of the watched PVs at once, in the
+    caller's thread, and returns a ``concurrent.futures.Future``.  A single
+    worker writes and flushes the files in order, so the RunEngine does
+    not wait on HDF5 I/O to a network mount.  The future is done when the
+    file is closed, with its path, or with the exception of the write.
+    """
+
+    def __init__(self):
+        """Initialize MasterFileWriter."""
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def submit(self, master_file_yaml, master_scan_file, bluesky_params,
+               pool=None):
+        """Snapshot the watched PVs now, write the master file later.
+
+        Parameters:
+            master_file_yaml (dict): The master file YAML, by section.
+            master_scan_file (str): Path of the master file.
+            bluesky_params (dict): Parameters of the plan, in ``SCAN``.
+            pool (MasterFilePVPool, optional): By default ``pv_pool``.
+
+        Returns:
+            concurrent.futures.Future: Done when the file is written.
+        """
+        pool = pv_pool if pool is None else pool
+        pv_db = pool.connect(master_file_yaml)
+        future = concurrent.futures.Future()
+        self._queue.put(
+            (
+                future,
+                (
+                    master_scan_file,
+                    snapshot_watched_pvs(pv_db),
+                    copy.deepcopy(master_file_yaml),
+                    dict(bluesky_params) if bluesky_params is not None else None,
+                    datetime.datetime.now(),
+                ),
+            )
+        )
+        self._start()
+        return future
+
+    def _start(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="MasterFileWriter", daemon=True
+                )
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            future, args = self._queue.get()
+            try:
+                if future.set_running_or_notify_cancel():
+                    t0 = time.monotonic()
+                    _write_master_file(*args)
+                    logger.info(
+                        "Master file %s written in %.2f s",
+                        args[0], time.monotonic() - t0,
+                    )
+                    future.set_result(args[0])
+            except Exception as reason:
+                logger.error("Cannot write master file %s: %s", args[0], reason)
+                future.set_exception(reason)
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """Wait until the master files submitted are written."""
+        self._queue.join()
+
+
+master_file_writer = MasterFileWriter()
+
+
+def write_scan_master_h5_async(master_file_yaml: dict,
+                               master_scan_file: str,
+                               bluesky_params: dict,
+                               pool: MasterFilePVPool = None):
+    """Like ``write_scan_master_h5()``, written by ``master_file_writer``.
+
+    Returns:
+        concurrent.futures.Future: Done when the file is written.
+    """
+    return master_file_writer.submit(
+        master_file_yaml, master_scan_file, bluesky_params, pool=pool
+    )
+
+
+def write_scan_timing(master_scan_file: str, line_timer):
+    """Add the line times of a LineTimer to the master file, as SCAN_TIMING.
+
+    The group sits next to ``SCAN``: the ``lines`` table, a histogram of
+    the line times, and the summary as attributes.  A failure is logged,
+    not raised.  A missing master file is not created: the timing alone
+    would pass for a master file.
+    """
+    if not pathlib.Path(master_scan_file).is_file():
+        logger.warning(
+            "No master file %s, the scan timing is not written", master_scan_file
+        )
+        return
+    try:
+        with h5py.File(master_scan_file, "r+") as h5root:
+            if "SCAN_TIMING" in h5root:
+                del h5root["SCAN_TIMING"]
+            group = h5root.create_group("SCAN_TIMING")
+            group.attrs["start_time"] = str(
+                datetime.datetime.fromtimestamp(line_timer.start_time or 0)
+            )
+            for key, value in line_timer.summary().items():
+                group.attrs[key] = value
+            ds = group.create_dataset("lines", data=line_timer.lines)
+            ds.attrs["units"] = "s"
+            counts, edges = line_timer.histogram()
+            group.create_dataset("line_time_histogram", data=counts)
+            ds = group.create_dataset("line_time_bin_edges", data=edges)
+            ds.attrs["units"] = "s"
+    except Exception as reason:  # after the scan, must not end the plan
+        logger.error("Cannot write the scan timing: %r", reason)
+
+
 if __name__ == "__main__":
     pass
@@ -59,7 +59,7 @@ def setup_flyscan_XRF_triggers(scanrecord, xrf, xrf_netcdf, sis3820, num_pulses)
     Trigger 3: Toggle SIS3820 (struck card) erase and start state
     """
 
-    yield from sis3820.before_flyscan(num_pulses)
+    yield from sis3820.before_flyscan(num_pulses, update_prescale=False)
 
     trigger_pvs = [
         xrf_netcdf.capture.pvname.replace("_RBV", ""),
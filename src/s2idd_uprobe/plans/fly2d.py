@@ -15,12 +15,16 @@ import logging
 import bluesky.plan_stubs as bps
 from apsbits.core.instrument_init import oregistry
 from apsbits.utils.config_loaders import get_config
+from mic_common.devices.fly_metrics import FlyScanMetrics
+from mic_common.utils.checkpoint import ScanCheckpoint
+from mic_common.utils.checkpoint import checkpoint_store
 from mic_common.utils.scan_monitor import execute_scan_2d
 from s2idd_uprobe.plans.before_after_fly import setup_flyscan_XRF_triggers
 from mic_common.plans.generallized_scan_1d import generalized_scan_1d
 from s2idd_uprobe.plans.helper_funcs import selected_dets
 from s2idd_uprobe.plans.toggle_usercalc import disable_usercalc
 from s2idd_uprobe.plans.toggle_usercalc import enable_usercalc
+from s2idd_uprobe.utils.usercalc_lib import xstage_watchdog
 
 logger = logging.getLogger(__name__)
 
@@ -42,7 +46,16 @@ preamp1_netcdf = oregistry["tetramm1_netcdf"]
 iconfig = get_config()
 scan_overhead = iconfig.get("SCAN_OVERHEAD")
 netcdf_delimiter = iconfig.get("FILE_DELIMITER")
-xmap_buffer = iconfig.get("XMAP", "BUFFER")
+xmap_buffer = iconfig.get("XMAP")["BUFFER"]
+
+fly_metrics = FlyScanMetrics(
+    name="fly_metrics",
+    sis3820=sis3820,
+    xmap=xrf,
+    netcdf=xrf_netcdf,
+    netcdf_pixels=xmap_buffer,
+)
+oregistry.register(fly_metrics)
 
 
 def fly2d(
@@ -61,6 +74,8 @@ def fly2d(
     xrf_on=True,
     preamp1_on=False,
     preamp2_on=False,
+    stall_watchdog=True,
+    resume=False,
 ):
     """2D Bluesky plan that drives the x- and y- sample motors in fly mode using ScanRecord
 
@@ -96,8 +111,53 @@ def fly2d(
         Bool: Whether to run Preamp1.
     preamp2_on :
         Bool: Whether to run Preamp2.
+    stall_watchdog :
+        Bool: Whether to watch for a stalled line and unstick the x-stage.
+    resume :
+        Bool: Resume the last fly2d that did not complete, from the line after
+        its checkpoint, with its parameters and detector file names. The other
+        parameters are ignored.
+
+    """
+    params = {k: v for k, v in locals().items() if k != "resume"}
+    if resume:
+        checkpoint = checkpoint_store.load("fly2d")
+        if checkpoint is None:
+            raise ValueError("No fly2d checkpoint to resume")
+        logger.info(
+            f"Resuming {checkpoint['file_name']} after line "
+            f"{checkpoint['last_line']} of {checkpoint['num_lines']}"
+        )
+        yield from _fly2d(**checkpoint["params"], checkpoint=checkpoint)
+    else:
+        yield from _fly2d(**params)
+
+
+def _fly2d(
+    samplename="smp1",
+    user_comments="",
+    width=0,
+    x_center=None,
+    stepsize_x=0,
+    height=0,
+    y_center=None,
+    stepsize_y=0,
+    dwell=0,
+    sample_z=None,
+    inc_eng=None,
+    adjust_zp=False,
+    xrf_on=True,
+    preamp1_on=False,
+    preamp2_on=False,
+    stall_watchdog=True,
+    checkpoint=None,
+):
+    """The fly2d scan, from the line after ``checkpoint`` when resuming.
 
+    ``checkpoint`` is the dict saved by ScanCheckpoint, None for a new scan.
     """
+    plan_params = {k: v for k, v in locals().items() if k != "checkpoint"}
+    start_line = checkpoint["last_line"] if checkpoint else 0
 
     """Disable the usercalc that used in scan record"""
     yield from disable_usercalc()
@@ -123,12 +183,18 @@ def fly2d(
     yield from fscan1.set_positioner_readback(f"{samy.prefix}.RBV")
 
     # check if the scan movement is relative or absolute
+    # when resuming, the outer scan starts at the first line not done
+    skipped = start_line * stepsize_y
     scan_movement = fscan1.scan_movement.enum_strs[fscan1.scan_movement.get()]
     if scan_movement == "RELATIVE":
         yield from bps.mv(samy, y_center)
-        yield from fscan1.set_center_width_stepsize(0, height, stepsize_y)
+        yield from fscan1.set_center_width_stepsize(
+            skipped / 2, height - skipped, stepsize_y
+        )
     else:
-        yield from fscan1.set_center_width_stepsize(y_center, height, stepsize_y)
+        yield from fscan1.set_center_width_stepsize(
+            y_center + skipped / 2, height - skipped, stepsize_y
+        )
 
     """Assign the per-pixel dwell time"""
     logger.info(f"Setting per-pixel dwell time ({fscanh_dwell.pvname}) to {dwell} ms")
@@ -141,6 +207,9 @@ def fly2d(
     """Update the next file name for the detector file plugin"""
     savedata.update_next_file_name()
     next_file_name = savedata.next_file_name
+    file_name = next_file_name.replace(".mda", "")
+    if checkpoint:
+        file_name = checkpoint["file_name"]  # write on to the same files
 
     # """Generate scan_master.h5 file"""
 
@@ -149,7 +218,7 @@ def fly2d(
         # Set up triggers for FLY scans, sis3820 will be sending out pulses. The number of pulses is numpts_x - 2
         numpts_x = fscanh.number_points.value
         num_pulses = numpts_x - 2
-        filename = next_file_name.replace(".mda", "")
+        filename = file_name
 
         if all([xrf_on, xrf.connected, xrf_netcdf.connected]):
             num_capture = 0 # When it's zero, the num_capture won't be overwritten
@@ -166,6 +235,10 @@ def fly2d(
                 beamline_delimiter=netcdf_delimiter,
             )
 
+            if checkpoint:
+                yield from xrf_netcdf.set_filenumber(
+                    checkpoint["file_numbers"].get("xrf_netcdf", 0)
+                )
             yield from xrf_netcdf.set_capture("capturing")
 
         if all([preamp1_on, preamp1_netcdf.connected]):
@@ -178,6 +251,10 @@ def fly2d(
                 beamline_delimiter=netcdf_delimiter,
             )
         
+            if checkpoint:
+                yield from preamp1_netcdf.set_filenumber(
+                    checkpoint["file_numbers"].get("tetramm1_netcdf", 0)
+                )
             yield from preamp1_netcdf.set_capture("capturing")
 
         
@@ -213,7 +290,26 @@ def fly2d(
     """Start executing scan"""
     # yield from bps.sleep(1)
     fname = savedata.next_file_name
-    yield from execute_scan_2d(fscanh, fscan1, scan_name=fname, print_outter_msg=True)
+    hooks = [fly_metrics]
+    hooks.append(
+        ScanCheckpoint(
+            "fly2d",
+            plan_params,
+            file_name=file_name,
+            file_numbers={
+                "xrf_netcdf": xrf_netcdf.file_number,
+                "tetramm1_netcdf": preamp1_netcdf.file_number,
+            },
+            resume_from=checkpoint,
+        )
+    )
+    if stall_watchdog:
+        # dwell is in ms
+        line_time = fscanh.number_points.value * dwell / 1000 * (1 + scan_overhead)
+        hooks.append(xstage_watchdog(line_time=line_time))
+    yield from execute_scan_2d(
+        fscanh, fscan1, scan_name=fname, print_outter_msg=True, hooks=hooks
+    )
 
     """Enable the usercalc that used in scan record"""
     yield from enable_usercalc()
@@ -18,7 +18,7 @@ from s2idd_uprobe.plans.before_after_fly import setup_flyscan_SIS3820_XMAP
 from s2idd_uprobe.plans.fly1d_noScanRecord import fly1d
 import numpy as np
 from ophyd.status import Status, SubscriptionStatus
-from apstools.plans import run_blocking_function
+from mic_common.utils.status_wait import wait_for_status
 
 
 
@@ -196,7 +196,7 @@ def fly2d(
 
         yield from bps.sleep(0.2)
         yield from bps.mv(samx, x_end)
-        yield from run_blocking_function(ready.wait)
+        yield from wait_for_status(ready)
 
         yield from bps.mv(samx.max_velocity, x_motor_retrace)
         yield from bps.mv(samx, x_start)
@@ -19,7 +19,7 @@ from bluesky import plan_stubs as bps
 from apsbits.utils.config_loaders import get_config
 from s2ide_uprobe.utils.usercalc_lib import hydra_config, sis3820_config, xrf_config
 from ophyd.status import Status
-from apstools.plans import run_blocking_function
+from mic_common.utils.status_wait import wait_for_status
 
 logger = logging.getLogger(__name__)
 logger.info(__file__)
@@ -43,7 +43,7 @@ xrf = oregistry["xrf"]
 xrf_netcdf = oregistry["xrf_netcdf"]
 iconfig = get_config()
 scan_overhead = iconfig.get("SCAN_OVERHEAD")
-xmap_buffer = iconfig.get("XMAP", "BUFFER")
+xmap_buffer = iconfig.get("XMAP")["BUFFER"]
 
 
 def fly2d(
@@ -174,7 +174,7 @@ def fly2d(
     savedata.update_next_file_name()
     fscan1.number_points_rbv.subscribe(outter_counter_callback)
     yield from bps.mv(fscan1.execute_scan, 1)  # Start scan
-    yield from run_blocking_function(st.wait)
+    yield from wait_for_status(st)
     # yield from execute_scan_2d(fscanh, fscan1, scan_name=savedata.next_file_name, 
     #                            print_outter_msg=True)
 
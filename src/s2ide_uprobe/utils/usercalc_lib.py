@@ -7,6 +7,7 @@ import logging
 from apsbits.utils.controls_setup import oregistry
 from apsbits.utils.config_loaders import get_config
 import numpy as np
+from mic_common.utils.stall_watchdog import StallWatchdog
 
 logger = logging.getLogger(__name__)
 logger.info(__file__)
@@ -16,8 +17,8 @@ fscanh = oregistry["fscanh"]
 sis3820 = oregistry["sis3820"]
 samx = oregistry["samx"]
 iconfig = get_config()
-xmap_buffer = iconfig.get("XMAP", "BUFFER")
-sam_x_precision = iconfig.get("SAM_X", "PRECISION")
+xmap_buffer = iconfig.get("XMAP")["BUFFER"]
+sam_x_precision = iconfig.get("SAM_X")["PRECISION"]
 
 def check_xstage_stuck(elapsed_realtime = 1, sis3820_current_channel = 0):
     """
@@ -27,7 +28,8 @@ def check_xstage_stuck(elapsed_realtime = 1, sis3820_current_channel = 0):
         elapsed_realtime: float
             The elapsed realtime in seconds
         sis3820_current_channel: int
-            The current channel of the sis3820
+            The channel of the sis3820 at the previous check, the xstage
+            is stuck only if the channel has not advanced since
 
     Returns:
         bool: True if the xstage is stuck, False otherwise
@@ -35,14 +37,14 @@ def check_xstage_stuck(elapsed_realtime = 1, sis3820_current_channel = 0):
     sis3820_acquiring = sis3820.acquiring.get()
     fscan1_running = fscan1.execute_scan.get()
     samx_done_moving = samx.motor_done_move.get()
-    sis3820_current_channel = sis3820.current_channel.get()
+    current_channel = sis3820.current_channel.get()
     sis3820_elapsed_real = sis3820.elapsed_real.get()
 
     if all([
         sis3820_acquiring,
         fscan1_running,
         samx_done_moving,
-        sis3820_current_channel == sis3820_current_channel,
+        current_channel == sis3820_current_channel,
         sis3820_elapsed_real > elapsed_realtime,
     ]):
         return True
@@ -54,6 +56,9 @@ def unstuck_xstage():
     """
     Unstuck the xstage by moving to the start or end position 
     depending on which is closer
+
+    Returns:
+        MoveStatus: The move, started without waiting for it
     """
     start_position = fscan1.start_position.get()
     end_position = fscan1.end_position.get()
@@ -62,11 +67,36 @@ def unstuck_xstage():
     distance_to_end = abs(end_position - curr_position)
 
     if distance_to_start < distance_to_end:
-        samx.move(end_position)
         logger.info(f"Unstuck xstage: Moving to end position {end_position}")
+        return samx.move(end_position, wait=False)
     else:
-        samx.move(start_position)
         logger.info(f"Unstuck xstage: Moving to start position {start_position}")
+        return samx.move(start_position, wait=False)
+
+
+def xstage_watchdog(line_time=None, **kwargs):
+    """
+    Stall watchdog of the fly scan, that unsticks the xstage
+
+    Pass it in the hooks of execute_scan_2d, or call start() and stop()
+    around the scan.
+
+    Parameters:
+        line_time: float
+            The expected time of a line in seconds, until lines are measured
+        **kwargs:
+            Other StallWatchdog parameters, e.g. recoveries or factor.
+            A scan held by the .WAIT of fscan1 or fscanh is not stalled
+    """
+    kwargs.setdefault("recoveries", [unstuck_xstage])
+    kwargs.setdefault("holds", [fscan1.wcnt, fscanh.wcnt])
+    return StallWatchdog(
+        sis3820.current_channel,
+        fscan1.execute_scan,
+        done_move=samx.motor_done_move,
+        line_time=line_time,
+        **kwargs,
+    )
 
 
 